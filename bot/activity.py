@@ -0,0 +1,194 @@
+"""This module contains the background writes of the registrations and the activity of the users."""
+import asyncio
+import os
+from collections import OrderedDict
+from datetime import datetime, timezone
+from logging import getLogger
+from typing import Dict, Optional, Tuple
+
+from pymongo.errors import PyMongoError
+
+from bot.analytics import Analytics
+from bot.models import Database
+
+logger = getLogger(__name__)
+
+
+class ActivityWriter:
+    """Registers the users and records when they were last seen, without making the
+    handlers wait for Mongo.
+
+    The handlers only note the user in memory; a user noted several times before the
+    next write is written once, with the latest time. The notes are written every
+    `flush_interval` seconds, or as soon as `flush_size` users are pending, with a
+    single unordered ``bulk_write``. A failed write is retried with the next one.
+
+    The new users and the active users are counted by `analytics`, once written.
+
+    At most `maxsize` users are pending, e.g. while Mongo is down. Beyond that, a
+    registration takes the place of the oldest user that was only seen, and the rest
+    is dropped, a user that was only seen is recorded with their next message.
+
+    Args:
+        database: The database.
+        flush_interval: The maximum number of seconds a note waits to be written.
+        flush_size: The number of pending users that triggers a write.
+        maxsize: The maximum number of pending users.
+        analytics: Counts the written users.
+    """
+
+    def __init__(
+        self,
+        database: Database,
+        flush_interval: float = 5,
+        flush_size: int = 1000,
+        maxsize: int = 100000,
+        analytics: Optional[Analytics] = None,
+    ) -> None:
+        self.database = database
+        self.analytics = analytics
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.maxsize = maxsize
+        # user id -> when the user was last seen, oldest first
+        self.registrations: Dict[int, datetime] = {}
+        self.seen: "OrderedDict[int, datetime]" = OrderedDict()
+        self.coalesced = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.failures = 0
+        self.written = 0
+        self._wake = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(
+        cls, database: Database, analytics: Optional[Analytics] = None
+    ) -> "ActivityWriter":
+        """Create the writer from ``ACTIVITY_FLUSH_INTERVAL``, ``ACTIVITY_FLUSH_SIZE`` and
+        ``ACTIVITY_MAX_PENDING``."""
+        return cls(
+            database,
+            flush_interval=float(os.environ.get("ACTIVITY_FLUSH_INTERVAL", 5)),
+            flush_size=int(os.environ.get("ACTIVITY_FLUSH_SIZE", 1000)),
+            maxsize=int(os.environ.get("ACTIVITY_MAX_PENDING", 100000)),
+            analytics=analytics,
+        )
+
+    def __len__(self) -> int:
+        return len(self.registrations) + len(self.seen)
+
+    def register(self, user_id: int, when: Optional[datetime] = None) -> None:
+        """Register the user, or make them active again, e.g. when they start the bot."""
+        when = when or datetime.now(timezone.utc)
+        if user_id in self.registrations:
+            self.registrations[user_id] = max(when, self.registrations[user_id])
+            self.coalesced += 1
+            return
+        if user_id in self.seen:
+            when = max(when, self.seen.pop(user_id))
+            self.coalesced += 1
+        elif len(self) >= self.maxsize:
+            if not self.seen:
+                self.dropped += 1
+                return
+            self.seen.popitem(last=False)
+            self.dropped += 1
+        self.registrations[user_id] = when
+        self._check_size()
+
+    def touch(self, user_id: int, when: Optional[datetime] = None) -> None:
+        """Record that the user was just seen."""
+        when = when or datetime.now(timezone.utc)
+        if user_id in self.registrations:
+            self.registrations[user_id] = max(when, self.registrations[user_id])
+            self.coalesced += 1
+            return
+        if user_id in self.seen:
+            when = max(when, self.seen.pop(user_id))
+            self.coalesced += 1
+        elif len(self) >= self.maxsize:
+            self.dropped += 1
+            return
+        self.seen[user_id] = when
+        self._check_size()
+
+    def _check_size(self) -> None:
+        if len(self) >= self.flush_size:
+            self._wake.set()
+
+    async def flush(self) -> bool:
+        """
+        Write the pending users to the database.
+
+        Returns:
+            Whether the write succeeded, the users are pending again if it didn't.
+        """
+        async with self._lock:
+            if not len(self):
+                return True
+            registrations, self.registrations = self.registrations, {}
+            seen, self.seen = self.seen, OrderedDict()
+            activity: Dict[int, Tuple[bool, datetime]] = {
+                **{user_id: (False, when) for user_id, when in seen.items()},
+                **{user_id: (True, when) for user_id, when in registrations.items()},
+            }
+            try:
+                registered = await self.database.write_activity(activity)
+            except PyMongoError as exception:
+                logger.warning("Couldn't write the activity of %s users: %s", len(activity), exception)
+                self.failures += 1
+                self._keep(registrations, seen)
+                return False
+            except asyncio.CancelledError:
+                self._keep(registrations, seen)
+                raise
+            self.flushes += 1
+            self.written += len(activity)
+            if self.analytics is not None:
+                self.analytics.count("signups", registered)
+                for user_id, (_, when) in activity.items():
+                    self.analytics.active(user_id, when)
+            return True
+
+    def _keep(self, registrations: Dict[int, datetime], seen: Dict[int, datetime]) -> None:
+        # Merged with what was noted since, within the same bound.
+        coalesced = self.coalesced
+        for user_id, when in registrations.items():
+            self.register(user_id, when)
+        for user_id, when in seen.items():
+            self.touch(user_id, when)
+        self.coalesced = coalesced
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._write())
+
+    async def stop(self) -> None:
+        """Stop the background task and write what is pending."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    async def _write(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if not await self.flush():
+                # Don't retry in a loop while Mongo is down, even with a full queue.
+                await asyncio.sleep(self.flush_interval)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "pending": len(self),
+            "registrations": len(self.registrations),
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "failures": self.failures,
+            "written": self.written,
+        }
@@ -0,0 +1,149 @@
+"""This module contains the routing of the user messages to the admins."""
+import itertools
+import os
+from collections import Counter
+from typing import Dict, List, Optional
+
+from telegram import Bot, Chat, Message
+from telegram.ext import filters
+
+from bot.cache import AsyncLRUCache
+from bot.models import Database
+
+MODES = ("all", "round_robin", "least_loaded")
+"""How the messages are spread over the admins: every admin receives every message, or
+each user is assigned to one admin in turn or to the admin with the fewest users."""
+
+
+class _ReplyToBot(filters.MessageFilter):
+    """Matches the replies to a message of the bot, including the messages in a forum
+    topic created by the bot, which reply to the creation of the topic."""
+
+    __slots__ = ()
+
+    def filter(self, message: Message) -> bool:
+        replied = message.reply_to_message
+        return (
+            replied is not None
+            and replied.from_user is not None
+            and replied.from_user.id == message.get_bot().id
+        )
+
+
+class AdminRouter:
+    """Decides which admin chats receive the messages of a user.
+
+    If an admin group is set, the messages go to that group, in a forum topic per user
+    when the group is a forum. Otherwise they go to the admins according to `mode`;
+    the assignment of a user to an admin is sticky and stored with the user.
+
+    Args:
+        admins: The ids of the admins.
+        group: The id of the admin group.
+        mode: One of :data:`MODES`.
+    """
+
+    def __init__(self, admins: List[int], group: Optional[int] = None, mode: str = "all") -> None:
+        if mode not in MODES:
+            raise ValueError(f"ADMIN_MODE must be one of {', '.join(MODES)}, not {mode!r}.")
+        self.admins = admins
+        self.group = group
+        self.mode = mode
+        self.load: Counter = Counter({admin_id: 0 for admin_id in admins})
+        self._cycle = itertools.cycle(admins)
+        self._assignments: Optional[AsyncLRUCache[int]] = None
+        self._topics: Optional[AsyncLRUCache[int]] = None
+        self._forum = False
+        self.bot: Optional[Bot] = None
+        self.database: Optional[Database] = None
+
+    @classmethod
+    def from_env(cls) -> "AdminRouter":
+        """Create the router from ``ADMINS`` (comma separated), ``ADMIN_GROUP`` and ``ADMIN_MODE``."""
+        group = os.environ.get("ADMIN_GROUP")
+        return cls(
+            [int(admin_id) for admin_id in os.environ.get("ADMINS").split(",")],
+            int(group) if group else None,
+            os.environ.get("ADMIN_MODE", "all"),
+        )
+
+    @property
+    def users(self) -> filters.User:
+        """Matches the messages sent by an admin."""
+        return filters.User(self.admins)
+
+    @property
+    def chats(self) -> filters.BaseFilter:
+        """Matches the messages sent in an admin chat: a private chat with an admin or
+        the admin group."""
+        admin_chats = filters.ChatType.PRIVATE & self.users
+        if self.group is not None:
+            admin_chats = admin_chats | filters.Chat(self.group)
+        return admin_chats
+
+    @property
+    def replies(self) -> filters.BaseFilter:
+        """Matches the answers of the admins to the users: any message in a private chat
+        with an admin, and the replies to the messages of the bot in the admin group.
+        The rest of the group is the admins talking to each other."""
+        replies = filters.ChatType.PRIVATE & self.users
+        if self.group is not None:
+            replies = replies | (filters.Chat(self.group) & _ReplyToBot())
+        return replies
+
+    @property
+    def chat_ids(self) -> List[int]:
+        """The admin chats: the private chats with the admins and the admin group."""
+        return self.admins + ([self.group] if self.group is not None else [])
+
+    def is_admin(self, user_id: int) -> bool:
+        return user_id in self.admins
+
+    def is_admin_chat(self, chat_id: int, user_id: int) -> bool:
+        """Whether `user_id` acts in an admin chat, like :attr:`chats`: any member of the
+        admin group, or an admin in any chat."""
+        return chat_id == self.group or self.is_admin(user_id)
+
+    async def start(self, bot: Bot, database: Database) -> None:
+        """Load the state the routing depends on."""
+        self.bot = bot
+        self.database = database
+        if self.group is not None:
+            self._forum = bool((await bot.get_chat(self.group)).is_forum)
+            self._topics = AsyncLRUCache(self._load_topic, maxsize=10000)
+        elif self.mode != "all":
+            self.load.update(await database.count_assignments(self.admins))
+            self._assignments = AsyncLRUCache(self._load_assignment, maxsize=100000)
+
+    async def targets(self, user_id: int) -> List[Dict]:
+        """Return the chats, as keyword arguments of a forward, that receive the messages
+        of `user_id`."""
+        if self.group is not None:
+            if not self._forum:
+                return [{"chat_id": self.group}]
+            return [{"chat_id": self.group, "message_thread_id": await self._topics.load(user_id)}]
+        if self.mode == "all":
+            return [{"chat_id": admin_id} for admin_id in self.admins]
+        return [{"chat_id": await self._assignments.load(user_id)}]
+
+    async def _load_assignment(self, user_id: int) -> int:
+        admin_id = await self.database.get_assignment(user_id)
+        if admin_id not in self.admins:
+            if self.mode == "round_robin":
+                admin_id = next(self._cycle)
+            else:
+                admin_id = min(self.admins, key=self.load.__getitem__)
+            self.load[admin_id] += 1
+            await self.database.set_assignment(user_id, admin_id)
+        return admin_id
+
+    async def _load_topic(self, user_id: int) -> int:
+        topic_id = await self.database.get_topic(user_id)
+        if topic_id is None:
+            user: Chat = await self.bot.get_chat(user_id)
+            topic = await self.bot.create_forum_topic(
+                self.group, f"{user.full_name or user_id} [{user_id}]"[:128]
+            )
+            topic_id = topic.message_thread_id
+            await self.database.set_topic(user_id, topic_id)
+        return topic_id
@@ -1,13 +1,38 @@
 """This module contains bot admin commands."""
-from typing import cast
+import html
+from typing import Optional, Tuple, cast
 
-from telegram import Chat, Bot, Message, Update
+from bson import ObjectId
+from telegram import (
+    Bot,
+    CallbackQuery,
+    Chat,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    Message,
+    Update,
+)
 from telegram.ext import ContextTypes
-from telegram.error import BadRequest
+from telegram.error import TelegramError
 
 from bot.const import strings
-from bot.helpers import get_user_id
-from bot.models.database import Database
+from bot.analytics import METRICS, sparkline
+from bot.constants import Priority
+from bot.broadcast import build_payload
+from bot.callbacks import RELAY_LATENCY
+from bot.helpers import get_chat, get_chats, get_database, get_user_id
+from bot.metrics import API_LATENCY, HANDLER_LATENCY, MONGO_LATENCY, gauges
+
+
+MAX_ANALYTICS_DAYS = 90
+"""The longest range shown by /analytics."""
+
+HISTORY_PER_PAGE = 10
+"""The number of archived messages on a page of /history."""
+
+HISTORY_PREVIEW = 64
+"""The number of characters shown of each message, so a page fits in a message even
+when the text is all escaped."""
 
 
 async def bans(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -22,19 +47,23 @@ async def bans(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat = cast(Chat, update.effective_chat)
     bot = cast(Bot, context.bot)
 
-    user_id = await get_user_id(message, strings)
-    user = (await bot.get_chat(user_id)).to_dict()
+    user_id = await get_user_id(message, strings, get_database(context))
+    if user_id is None:
+        return
+    user = (await get_chat(context, user_id)).to_dict()
 
-    if await Database().user_is_banned(user["id"]):
+    if await get_database(context).user_is_banned(user["id"]):
         await message.reply_text(
             strings["user-is-banned"].format(user["first_name"])
         )
     else:
-        await Database().ban_user(user["id"])
+        await get_database(context).ban_user(user["id"])
         await message.reply_text(
             strings["ban-user"]
         )
-        await bot.send_message(user["id"], strings["got-banned"])
+        await bot.send_message(
+            user["id"], strings["got-banned"], rate_limit_args=Priority.ADMIN
+        )
 
 
 async def unban(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -49,64 +78,204 @@ async def unban(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat = cast(Chat, update.effective_chat)
     bot = cast(Bot, context.bot)
 
-    user_id = await get_user_id(message, strings)
-    user = (await bot.get_chat(user_id)).to_dict()
+    user_id = await get_user_id(message, strings, get_database(context))
+    if user_id is None:
+        return
+    user = (await get_chat(context, user_id)).to_dict()
 
-    if not await Database().user_is_banned(user["id"]):
+    # Asks Mongo, the ban may not have reached this instance yet.
+    if not await get_database(context).unban_user(user["id"]):
         await message.reply_text(
             strings["user-is-not-banned"].format(user["first_name"])
         )
     else:
-        await Database().unban_user(user["id"])
         await message.reply_text(
             strings["unban-user"]
         )
-        await bot.send_message(user["id"], strings["has-unbanned"])
+        await bot.send_message(
+            user["id"], strings["has-unbanned"], rate_limit_args=Priority.ADMIN
+        )
+
+
+BANS_PER_PAGE = 20
+"""The number of banned users shown on one page of /listBanned."""
+
+
+async def ban_list_page(
+    context: ContextTypes.DEFAULT_TYPE,
+    after: Optional[int] = None,
+    before: Optional[int] = None,
+) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """
+    Render one page of the banned users, resolving only the profiles on that page.
+
+    Args:
+        context: The callback context as provided by the application.
+        after: The last user id of the previous page.
+        before: The first user id of the next page.
+    """
+    ids, has_prev, has_next = await get_database(context).get_banned_page(
+        after=after, before=before, limit=BANS_PER_PAGE
+    )
+    if not ids and (after is not None or before is not None):
+        # Everyone on that side was unbanned in the meantime.
+        return await ban_list_page(context)
+    chats = await get_chats(context, ids)
+
+    list_banned = []
+    for user_id, user in chats.items():
+        if isinstance(user, TelegramError):
+            mention = f"<i>{html.escape(user.message)}</i>"
+        else:
+            name = html.escape((user.first_name or "")[:25])
+            mention = f"@{user.username}" if user.username else \
+                      f"<a href='tg://user?id={user_id}'>{name}</a>"
+        list_banned.append(f" <b>├</b> {mention} [<code>{user_id}</code>]")
+
+    if list_banned:
+        list_banned[-1] = list_banned[-1].replace("├", "└")
+
+    buttons = []
+    if ids and has_prev:
+        buttons.append(InlineKeyboardButton("⬅️", callback_data=f"banlist:prev:{ids[0]}"))
+    if ids and has_next:
+        buttons.append(InlineKeyboardButton("➡️", callback_data=f"banlist:next:{ids[-1]}"))
+
+    text = "\n".join([strings["list-banned"], *list_banned])
+    return text, InlineKeyboardMarkup.from_row(buttons) if buttons else None
 
 
 async def list_ban(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
-    Get the list of banned users.
+    Get the list of banned users, one page at a time.
 
     Args:
         update: The Telegram update.
         context: The callback context as provided by the application.
-    """ 
-    list_banned = []
-    message = cast(Message, update.effective_message)
-    bot = cast(Bot, context.bot)
+    """
+    text, keyboard = await ban_list_page(context)
+    await cast(Message, update.effective_message).reply_text(
+        text=text, reply_markup=keyboard
+    )
+
+
+async def list_ban_page(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Switch the list of banned users to the previous or next page.
+
+    Args:
+        update: The Telegram update.
+        context: The callback context as provided by the application.
+    """
+    query = cast(CallbackQuery, update.callback_query)
+    if not context.bot_data["admins"].is_admin_chat(query.message.chat_id, query.from_user.id):
+        await query.answer()
+        return
+
+    _, direction, user_id = query.data.split(":")
+    if direction == "next":
+        text, keyboard = await ban_list_page(context, after=int(user_id))
+    else:
+        text, keyboard = await ban_list_page(context, before=int(user_id))
+
+    await query.answer()
+    await query.edit_message_text(text=text, reply_markup=keyboard)
+
+
+async def archive_page(
+    context: ContextTypes.DEFAULT_TYPE,
+    user_id: int,
+    after: Optional[ObjectId] = None,
+    before: Optional[ObjectId] = None,
+) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """
+    Render one page of the archived messages of a user, newest first.
 
-    text = "🚷 <b><u>List Banned Users</u></b>"
-    
-    user_has_banned = await Database().get_banned_users()
-    for user_id in user_has_banned:
+    Args:
+        context: The callback context as provided by the application.
+        user_id: The user.
+        after: The last message of the previous page.
+        before: The first message of the next page.
+    """
+    records, has_prev, has_next = await get_database(context).get_archive_page(
+        user_id, after=after, before=before, limit=HISTORY_PER_PAGE
+    )
+    if not records and (after is not None or before is not None):
+        # The messages on that side expired in the meantime.
+        return await archive_page(context, user_id)
+
+    lines = []
+    for record in records:
+        arrow = "📤" if "admin_id" in record else "📥"
+        text = record.get("text", "")
+        if len(text) > HISTORY_PREVIEW:
+            text = text[:HISTORY_PREVIEW - 1] + "…"
+        content = html.escape(text)
+        if record["type"] != "text":
+            content = f"<i>[{record['type']}]</i> {content}".rstrip()
+        lines.append(f"{arrow} <code>{record['ts']:%Y-%m-%d %H:%M}</code> {content}")
+
+    # At most 13 + 16 + 1 + 24 bytes, within the 64 bytes of the callback data.
+    buttons = []
+    if records and has_prev:
+        buttons.append(
+            InlineKeyboardButton("⬅️", callback_data=f"history:prev:{user_id}:{records[0]['_id']}")
+        )
+    if records and has_next:
+        buttons.append(
+            InlineKeyboardButton("➡️", callback_data=f"history:next:{user_id}:{records[-1]['_id']}")
+        )
+
+    text = "\n".join([strings["history"].format(user_id), *(lines or [strings["history-empty"]])])
+    return text, InlineKeyboardMarkup.from_row(buttons) if buttons else None
+
+
+async def history(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Get the archived messages of a user, `/history <user_id>` or in reply to one of
+    their messages, one page at a time.
+
+    Args:
+        update: The Telegram update.
+        context: The callback context as provided by the application.
+    """
+    message = cast(Message, update.effective_message)
+    if context.args:
         try:
-            user = await bot.get_chat(user_id)
-        except BadRequest as excp:
-            text = "\n" + excp.message
-            pass
-
-        name = user.first_name
-        id = user.id
-        mention = f"@{user.username}" if user.username else \
-                  f"<a href='tg://user?id={id}'>{name[:25]}</a>"
-
-        list_banned.append(f" <b>├</b> {mention} [<code>{id}</code>]")
-        
-    if len(list_banned) > 0:
-        res_user = list_banned[-1].replace("├", "└")
-        list_banned.pop(-1)
-        list_banned.append(res_user)
-        result = text + "\n" + "\n".join(list_banned)
-    elif len(list_banned) == 0:
-        result = text
+            user_id = int(context.args[0])
+        except ValueError:
+            await message.reply_text(strings["history-usage"])
+            return
+    else:
+        user_id = await get_user_id(message, strings, get_database(context))
+        if user_id is None:
+            return
+
+    text, keyboard = await archive_page(context, user_id)
+    await message.reply_text(text=text, reply_markup=keyboard)
+
+
+async def history_page(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Switch the archived messages of a user to the newer or older page.
+
+    Args:
+        update: The Telegram update.
+        context: The callback context as provided by the application.
+    """
+    query = cast(CallbackQuery, update.callback_query)
+    if not context.bot_data["admins"].is_admin_chat(query.message.chat_id, query.from_user.id):
+        await query.answer()
+        return
+
+    _, direction, user_id, record_id = query.data.split(":")
+    if direction == "next":
+        text, keyboard = await archive_page(context, int(user_id), after=ObjectId(record_id))
     else:
-        res_user = list_banned[-1].replace("├", "└")
-        list_banned.pop(-1)
-        list_banned.append(res_user)
-        result = text + "\n" + "\n".join(list_banned)
+        text, keyboard = await archive_page(context, int(user_id), before=ObjectId(record_id))
 
-    await message.reply_text(text=result)
+    await query.answer()
+    await query.edit_message_text(text=text, reply_markup=keyboard)
 
 
 async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -117,8 +286,236 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         update: The Telegram update.
         context: The callback context as provided by the application.
     """
+    counts = await get_database(context).get_user_counts()
     await cast(Message, update.effective_message).reply_text(
         strings["count-of-users"].format(
-            len(await Database().get_all_users())
+            counts["total"], counts["banned"], counts["inactive"]
         )
     )
+
+
+async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Send the replied message to all the users, or cancel the running broadcast
+    with `/broadcast cancel`.
+
+    Args:
+        update: The Telegram update.
+        context: The callback context as provided by the application.
+    """
+    message = cast(Message, update.effective_message)
+    broadcaster = context.bot_data["broadcaster"]
+
+    if context.args and context.args[0] == "cancel":
+        cancelled = await broadcaster.cancel()
+        await message.reply_text(
+            strings["broadcast-cancelled" if cancelled else "broadcast-not-running"]
+        )
+        return
+    if not message.reply_to_message:
+        await message.reply_text(strings["broadcast-no-message"])
+        return
+
+    if not await broadcaster.start(build_payload(message.reply_to_message), message.chat_id):
+        await message.reply_text(strings["broadcast-running"])
+
+
+async def save_template(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Save the replied message as a reply template, `/save <name>`.
+
+    Args:
+        update: The Telegram update.
+        context: The callback context as provided by the application.
+    """
+    message = cast(Message, update.effective_message)
+    if len(context.args) != 1 or not message.reply_to_message:
+        await message.reply_text(strings["template-save-usage"])
+        return
+
+    name = context.args[0].lower()
+    await context.bot_data["templates"].save(name, message.reply_to_message)
+    await message.reply_text(strings["template-saved"].format(html.escape(name)))
+
+
+async def use_template(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Answer the replied user message with a template, `/use <name>`.
+
+    Args:
+        update: The Telegram update.
+        context: The callback context as provided by the application.
+    """
+    message = cast(Message, update.effective_message)
+    if len(context.args) != 1:
+        await message.reply_text(strings["template-use-usage"])
+        return
+
+    templates = context.bot_data["templates"]
+    template = await templates.get(context.args[0].lower())
+    if template is None:
+        await message.reply_text(strings["template-not-found"].format(html.escape(context.args[0])))
+        return
+
+    user_id = await get_user_id(message, strings, get_database(context))
+    if user_id is None:
+        return
+    sent = await templates.send(context.bot, user_id, template, rate_limit_args=Priority.ADMIN)
+    context.bot_data["analytics"].count("replies")
+    # A copied template only returns its id, the command then stands for it.
+    context.bot_data["archive"].record(
+        sent if isinstance(sent, Message) else message, user_id, message.from_user.id
+    )
+
+
+async def list_templates(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Get the names of the reply templates.
+
+    Args:
+        update: The Telegram update.
+        context: The callback context as provided by the application.
+    """
+    names = await context.bot_data["templates"].names()
+    await cast(Message, update.effective_message).reply_text(
+        "\n".join(
+            [strings["templates"], *(f" • <code>{html.escape(name)}</code>" for name in names)]
+        )
+    )
+
+
+async def delete_template(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Delete a reply template, `/deltemplate <name>`.
+
+    Args:
+        update: The Telegram update.
+        context: The callback context as provided by the application.
+    """
+    message = cast(Message, update.effective_message)
+    if len(context.args) != 1:
+        await message.reply_text(strings["template-delete-usage"])
+        return
+
+    name = context.args[0].lower()
+    deleted = await context.bot_data["templates"].delete(name)
+    await message.reply_text(
+        strings["template-deleted" if deleted else "template-not-found"].format(html.escape(name))
+    )
+
+
+async def status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Get the runtime statistics of the bot, such as the Mongo connection pool usage.
+
+    Args:
+        update: The Telegram update.
+        context: The callback context as provided by the application.
+    """
+    pool_stats = get_database(context).pool_stats
+    sections = {
+        "Mongo Connection Pool": pool_stats.to_dict() if pool_stats else {},
+        "Chat Cache": context.bot_data["chat_cache"].stats(),
+        "Outbound Scheduler": context.bot.rate_limiter.stats(),
+        **{
+            f"Reply Relay ({path})": latency.to_dict()
+            for path, latency in RELAY_LATENCY.items()
+        },
+        "Error Reports": context.bot_data["errors"].stats(),
+        "Flood Control": context.bot_data["flood"].stats(),
+        "User States": context.bot_data["states"].stats(),
+        "Activity Writes": context.bot_data["activity"].stats(),
+        "Analytics": context.bot_data["analytics"].stats(),
+        "Archive": context.bot_data["archive"].stats(),
+    }
+    await cast(Message, update.effective_message).reply_text(
+        "\n\n".join(
+            strings["status-section"].format(
+                title,
+                "\n".join(f"{key}: <code>{value:g}</code>" for key, value in stats.items()),
+            )
+            for title, stats in sections.items()
+        )
+    )
+
+
+async def perf(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Get where the time goes: the handlers, and the Mongo commands and Bot API methods
+    that took the most time in total.
+
+    Args:
+        update: The Telegram update.
+        context: The callback context as provided by the application.
+    """
+    sections = []
+    for title, histograms in (
+        ("Handlers", HANDLER_LATENCY),
+        ("Mongo Commands", MONGO_LATENCY),
+        ("Bot API Methods", API_LATENCY),
+    ):
+        busiest = sorted(
+            histograms.copy().items(), key=lambda item: -item[1].total
+        )[:10]
+        lines = [
+            "{}: <code>{count:g} × {avg_ms:.1f}ms, p99 ≤ {p99_ms:g}ms, max {max_ms:.0f}ms</code>".format(
+                html.escape(name), **histogram.to_dict()
+            )
+            for name, histogram in busiest
+            if histogram.count
+        ]
+        sections.append(
+            strings["status-section"].format(title, "\n".join(lines) or strings["perf-empty"])
+        )
+    sections.append(
+        strings["status-section"].format(
+            "Updates",
+            "\n".join(
+                f"{key}: <code>{value:g}</code>"
+                for key, value in gauges(context.application)["updates"].items()
+            ),
+        )
+    )
+    await cast(Message, update.effective_message).reply_text("\n\n".join(sections))
+
+
+async def analytics(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Get the daily usage of the bot over the last days, 14 by default or the number
+    given with `/analytics <days>`.
+
+    Args:
+        update: The Telegram update.
+        context: The callback context as provided by the application.
+    """
+    message = cast(Message, update.effective_message)
+    try:
+        days = int(context.args[0]) if context.args else 14
+    except ValueError:
+        days = 0
+    if not 1 <= days <= MAX_ANALYTICS_DAYS:
+        await message.reply_text(strings["analytics-usage"].format(MAX_ANALYTICS_DAYS))
+        return
+
+    dates, series = await context.bot_data["analytics"].read(days)
+    lines = [strings["analytics"].format(dates[0].isoformat(), dates[-1].isoformat())]
+    for metric in METRICS:
+        values = series[metric]
+        lines.append(
+            strings["analytics-metric"].format(
+                strings[f"analytics-{metric}"],
+                sparkline(values),
+                values[-1],
+                sum(values) / days,
+                max(values),
+            )
+        )
+    # The last week day by day.
+    rows = ["day    " + " ".join(metric[:8].rjust(8) for metric in METRICS)]
+    for index in range(max(days - 7, 0), days):
+        rows.append(
+            dates[index].strftime("%m-%d  ")
+            + " ".join(str(series[metric][index]).rjust(8) for metric in METRICS)
+        )
+    lines.append("<pre>{}</pre>".format("\n".join(rows)))
+    await message.reply_text("\n\n".join(lines))
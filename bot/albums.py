@@ -0,0 +1,83 @@
+"""This module contains the collector of the messages sent as an album."""
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Hashable, List, Tuple
+
+from telegram import Message
+from telegram.ext import Application
+
+
+class AlbumCollector:
+    """Collects the messages of an album, so they can be relayed with a single request.
+
+    Telegram delivers every item of an album as its own update. The items sharing a
+    ``media_group_id`` are collected until none arrived for `delay` seconds, then
+    `callback` is called once with all of them, sorted by message id. The albums of a
+    chat are sent at once by :meth:`flush`, so a later message doesn't overtake them.
+
+    Args:
+        application: The application, which runs the callback so its errors reach the
+            error handlers.
+        callback: The coroutine function called with the messages of an album.
+        delay: The number of seconds to wait for the next item of an album.
+    """
+
+    def __init__(
+        self,
+        application: Application,
+        callback: Callable[[List[Message]], Awaitable[object]],
+        delay: float = 1.0,
+    ) -> None:
+        self.application = application
+        self.callback = callback
+        self.delay = delay
+        self._albums: Dict[Hashable, Tuple[float, List[Message]]] = {}
+        # The albums whose callback is running.
+        self._sending: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._albums)
+
+    def add(self, message: Message) -> None:
+        """Add an item of an album, the first one schedules the callback."""
+        key = (message.chat_id, message.media_group_id)
+        deadline = time.monotonic() + self.delay
+        album = self._albums.get(key)
+        if album is None:
+            self._albums[key] = (deadline, [message])
+            self.application.create_task(self._flush_later(key))
+        else:
+            album[1].append(message)
+            self._albums[key] = (deadline, album[1])
+
+    async def flush(self, chat_id: int) -> None:
+        """Send the albums of the chat that are still collected, oldest first, and wait
+        for the ones being sent."""
+        while True:
+            keys = [key for key in self._albums if key[0] == chat_id]
+            if not keys:
+                break
+            # One at a time, if the callback fails the others are still sent later.
+            key = min(keys, key=lambda key: min(m.message_id for m in self._albums[key][1]))
+            await self._send(key)
+        sending = [future for key, future in self._sending.items() if key[0] == chat_id]
+        if sending:
+            # Their errors are raised where they are sent.
+            await asyncio.wait(sending)
+
+    async def _flush_later(self, key: Hashable) -> None:
+        while (album := self._albums.get(key)) is not None:
+            delay = album[0] - time.monotonic()
+            if delay <= 0:
+                await self._send(key)
+                return
+            await asyncio.sleep(delay)
+
+    async def _send(self, key: Hashable) -> None:
+        _, messages = self._albums.pop(key)
+        messages.sort(key=lambda message: message.message_id)
+        self._sending[key] = future = asyncio.ensure_future(self.callback(messages))
+        try:
+            await future
+        finally:
+            self._sending.pop(key, None)
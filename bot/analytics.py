@@ -0,0 +1,184 @@
+"""This module contains the usage analytics of the bot, counted per hour."""
+import asyncio
+import os
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from logging import getLogger
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from pymongo.errors import PyMongoError
+
+from bot.models import Database
+
+logger = getLogger(__name__)
+
+METRICS = ("actives", "signups", "messages", "replies")
+"""The counted metrics: the users active on the day, the new users, the messages of the
+users and the replies of the admins."""
+
+SPARKS = "▁▂▃▄▅▆▇█"
+
+
+def hour_of(when: Optional[datetime] = None) -> datetime:
+    """Return the start of the hour of `when`, now by default, in UTC."""
+    when = when or datetime.now(timezone.utc)
+    return when.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def sparkline(values: Sequence[float]) -> str:
+    """Draw the values with one block character each, scaled to the largest."""
+    peak = max(values, default=0)
+    if not peak:
+        return SPARKS[0] * len(values)
+    return "".join(SPARKS[round(value / peak * (len(SPARKS) - 1))] for value in values)
+
+
+class Analytics:
+    """Counts the usage of the bot in memory, and adds the counts to one document per
+    hour every `flush_interval` seconds, with ``$inc`` upserts.
+
+    The active users are counted once a day: a user is added to the ``active_days``
+    collection, and counted if they weren't there yet, so the counts of several
+    processes add up. Reading a range of days is a single range query on the hours.
+
+    Args:
+        database: The database.
+        flush_interval: The number of seconds between two writes of the counts.
+        max_pending_users: The maximum number of active users waiting to be written,
+            the others are dropped, e.g. while Mongo is down.
+    """
+
+    def __init__(
+        self, database: Database, flush_interval: float = 60, max_pending_users: int = 100000
+    ) -> None:
+        self.database = database
+        self.flush_interval = flush_interval
+        self.max_pending_users = max_pending_users
+        self.counts: Counter = Counter()
+        # hour -> the users active in it
+        self.actives: Dict[datetime, Set[int]] = {}
+        self.pending_users = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.failures = 0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls, database: Database) -> "Analytics":
+        """Create the analytics from ``ANALYTICS_FLUSH_INTERVAL`` and ``ANALYTICS_MAX_PENDING``."""
+        return cls(
+            database,
+            flush_interval=float(os.environ.get("ANALYTICS_FLUSH_INTERVAL", 60)),
+            max_pending_users=int(os.environ.get("ANALYTICS_MAX_PENDING", 100000)),
+        )
+
+    def count(self, metric: str, amount: int = 1, when: Optional[datetime] = None) -> None:
+        """Add `amount` to `metric` in the hour of `when`, now by default."""
+        if amount:
+            self.counts[hour_of(when), metric] += amount
+
+    def active(self, user_id: int, when: Optional[datetime] = None) -> None:
+        """Count the user as active on the day of `when`, unless they already were."""
+        users = self.actives.setdefault(hour_of(when), set())
+        if user_id in users:
+            return
+        if self.pending_users >= self.max_pending_users:
+            self.dropped += 1
+            return
+        users.add(user_id)
+        self.pending_users += 1
+
+    async def flush(self) -> bool:
+        """
+        Write the counts to the database.
+
+        Returns:
+            Whether the write succeeded, the counts are pending again if it didn't.
+        """
+        async with self._lock:
+            actives, self.actives = self.actives, {}
+            self.pending_users = 0
+            try:
+                for hour, users in list(actives.items()):
+                    new = await self.database.mark_active(hour, users)
+                    # Counted once, even if the rest fails.
+                    del actives[hour]
+                    self.count("actives", new, hour)
+                counts, self.counts = self.counts, Counter()
+            except (PyMongoError, asyncio.CancelledError) as exception:
+                self._keep_actives(actives)
+                if isinstance(exception, asyncio.CancelledError):
+                    raise
+                logger.warning("Couldn't write the active users: %s", exception)
+                self.failures += 1
+                return False
+            if not counts:
+                return True
+            buckets: Dict[datetime, Dict[str, int]] = {}
+            for (hour, metric), amount in counts.items():
+                buckets.setdefault(hour, {})[metric] = amount
+            try:
+                await self.database.increment_analytics(buckets)
+            except (PyMongoError, asyncio.CancelledError) as exception:
+                self.counts.update(counts)
+                if isinstance(exception, asyncio.CancelledError):
+                    raise
+                logger.warning("Couldn't write the analytics: %s", exception)
+                self.failures += 1
+                return False
+            self.flushes += 1
+            return True
+
+    def _keep_actives(self, actives: Dict[datetime, Set[int]]) -> None:
+        for hour, users in actives.items():
+            for user_id in users:
+                self.active(user_id, hour)
+
+    async def read(self, days: int) -> Tuple[List[date], Dict[str, List[int]]]:
+        """
+        Read the counts of the last `days` days, today included.
+
+        Returns:
+            The days, and the count of every metric on each of them.
+        """
+        today = datetime.now(timezone.utc).date()
+        first = today - timedelta(days=days - 1)
+        dates = [first + timedelta(days=index) for index in range(days)]
+        series = {metric: [0] * days for metric in METRICS}
+        start = datetime(first.year, first.month, first.day, tzinfo=timezone.utc)
+        for document in await self.database.get_analytics(start, start + timedelta(days=days)):
+            index = (document["_id"].date() - first).days
+            for metric, amount in document.get("counts", {}).items():
+                if metric in series and 0 <= index < days:
+                    series[metric][index] += amount
+        # What wasn't written yet.
+        for (hour, metric), amount in self.counts.items():
+            index = (hour.date() - first).days
+            if metric in series and 0 <= index < days:
+                series[metric][index] += amount
+        return dates, series
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._write())
+
+    async def stop(self) -> None:
+        """Stop the background task and write the remaining counts."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    async def _write(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "pending_counts": len(self.counts),
+            "pending_users": self.pending_users,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "failures": self.failures,
+        }
@@ -0,0 +1,158 @@
+"""This module contains the archive of the conversations between the users and the admins."""
+import asyncio
+import os
+from datetime import datetime, timezone
+from logging import getLogger
+from typing import Dict, List, Optional
+
+from pymongo.errors import PyMongoError
+from telegram import Message
+
+from bot.helpers import message_content
+from bot.models import Database
+
+logger = getLogger(__name__)
+
+
+class Archive:
+    """Keeps a compact record of every message of a conversation, so an admin can look
+    up what a user sent without scrolling the chats, see :func:`bot.admintools.history`.
+
+    The records are buffered and inserted with a single unordered ``insert_many`` every
+    `flush_interval` seconds, or as soon as `batch_size` are pending. At most `maxsize`
+    records are pending, e.g. while Mongo is down, the newer ones are dropped.
+
+    Args:
+        database: The database.
+        flush_interval: The maximum number of seconds a record waits to be written.
+        batch_size: The number of pending records that triggers a write.
+        maxsize: The maximum number of pending records.
+        text_length: The number of characters of the text or caption that are kept.
+    """
+
+    def __init__(
+        self,
+        database: Database,
+        flush_interval: float = 2,
+        batch_size: int = 500,
+        maxsize: int = 20000,
+        text_length: int = 200,
+    ) -> None:
+        self.database = database
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.maxsize = maxsize
+        self.text_length = text_length
+        self.pending: List[Dict] = []
+        self.dropped = 0
+        self.flushes = 0
+        self.failures = 0
+        self.written = 0
+        self._wake = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls, database: Database) -> "Archive":
+        """Create the archive from ``ARCHIVE_FLUSH_INTERVAL``, ``ARCHIVE_BATCH_SIZE``,
+        ``ARCHIVE_MAX_PENDING`` and ``ARCHIVE_TEXT_LENGTH``."""
+        return cls(
+            database,
+            flush_interval=float(os.environ.get("ARCHIVE_FLUSH_INTERVAL", 2)),
+            batch_size=int(os.environ.get("ARCHIVE_BATCH_SIZE", 500)),
+            maxsize=int(os.environ.get("ARCHIVE_MAX_PENDING", 20000)),
+            text_length=int(os.environ.get("ARCHIVE_TEXT_LENGTH", 200)),
+        )
+
+    def record(self, message: Message, user_id: int, admin_id: Optional[int] = None) -> None:
+        """
+        Archive a message of the conversation with a user.
+
+        Args:
+            message: The message, sent by the user or by an admin.
+            user_id: The user of the conversation.
+            admin_id: The admin that sent the message, :obj:`None` for the messages of
+                the user.
+        """
+        if len(self.pending) >= self.maxsize:
+            self.dropped += 1
+            return
+        _, types, file_id = message_content(message)
+        record = {
+            "user_id": user_id,
+            "ts": message.date or datetime.now(timezone.utc),
+            "chat_id": message.chat_id,
+            "message_id": message.message_id,
+            "type": str(types) if types else "other",
+        }
+        text = message.text or message.caption
+        if text:
+            record["text"] = text[:self.text_length]
+        if file_id:
+            record["file_id"] = file_id
+        if admin_id is not None:
+            record["admin_id"] = admin_id
+        self.pending.append(record)
+        if len(self.pending) >= self.batch_size:
+            self._wake.set()
+
+    async def flush(self) -> bool:
+        """
+        Write the pending records to the database.
+
+        Returns:
+            Whether the write succeeded, the records are pending again if it didn't.
+        """
+        async with self._lock:
+            if not self.pending:
+                return True
+            records, self.pending = self.pending, []
+            try:
+                await self.database.insert_archive(records)
+            except PyMongoError as exception:
+                logger.warning("Couldn't archive %s messages: %s", len(records), exception)
+                self.failures += 1
+                self._keep(records)
+                return False
+            except asyncio.CancelledError:
+                self._keep(records)
+                raise
+            self.flushes += 1
+            self.written += len(records)
+            return True
+
+    def _keep(self, records: List[Dict]) -> None:
+        # Before what was recorded since, within the same bound.
+        kept = records + self.pending
+        self.dropped += max(len(kept) - self.maxsize, 0)
+        self.pending = kept[:self.maxsize]
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._write())
+
+    async def stop(self) -> None:
+        """Stop the background task and write what is pending."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    async def _write(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if not await self.flush():
+                # Don't retry in a loop while Mongo is down, even with a full buffer.
+                await asyncio.sleep(self.flush_interval)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "pending": len(self.pending),
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "failures": self.failures,
+            "written": self.written,
+        }
@@ -0,0 +1,289 @@
+"""This module contains the broadcast of a message to all the users."""
+import asyncio
+import time
+from datetime import datetime, timezone
+from logging import getLogger
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pymongo.errors import PyMongoError
+from telegram import Bot, InlineKeyboardButton, Message
+from telegram.error import Forbidden, TelegramError
+
+from bot.const import strings
+from bot.constants import MessageType, Priority
+from bot.helpers import (
+    build_markup,
+    button_parser,
+    has_button_markup,
+    message_content,
+    send_content,
+)
+from bot.models import Database
+
+logger = getLogger(__name__)
+
+
+class Broadcaster:
+    """Sends one message to every active user.
+
+    The users are streamed from the database in id order and sent to in batches. After
+    each batch the last id is checkpointed, so a broadcast interrupted by a restart is
+    resumed by :meth:`resume` and at most one batch is sent twice. The banned users are
+    skipped.
+
+    A failed database call is retried `retries` times, waiting twice as long each time
+    from `retry_delay` seconds; after that, or on any other error, the broadcast is
+    marked as failed and not resumed.
+
+    Args:
+        bot: The bot.
+        database: The database.
+        concurrency: The maximum number of messages in flight, the pace itself is set by
+            the rate limiter of the bot.
+        batch_size: The number of users between two checkpoints.
+        progress_interval: The minimum number of seconds between two progress updates.
+        retries: The number of times a failed database call is retried.
+        retry_delay: The number of seconds before the first retry.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        database: Database,
+        concurrency: int = 10,
+        batch_size: int = 100,
+        progress_interval: float = 5.0,
+        retries: int = 5,
+        retry_delay: float = 1.0,
+    ) -> None:
+        self.bot = bot
+        self.database = database
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.progress_interval = progress_interval
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.task: Optional[asyncio.Task] = None
+        self._broadcast: Optional[Dict] = None
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    async def start(self, payload: Dict, chat_id: int) -> bool:
+        """
+        Start a new broadcast, unless one is running in this or another process.
+
+        Args:
+            payload: The message, as built by :func:`build_payload`.
+            chat_id: The chat that receives the progress message.
+
+        Returns:
+            Whether the broadcast was started.
+        """
+        if self.running or await self.database.get_running_broadcast() is not None:
+            return False
+        progress = await self.bot.send_message(
+            chat_id, strings["broadcast-started"], rate_limit_args=Priority.ADMIN
+        )
+        broadcast = {
+            "status": "running",
+            "payload": payload,
+            "last_user_id": 0,
+            "sent": 0,
+            "blocked": 0,
+            "failed": 0,
+            "total": await self.database.count_users(),
+            "started_at": datetime.now(timezone.utc),
+            "chat_id": chat_id,
+            "message_id": progress.message_id,
+        }
+        broadcast["_id"] = await self.database.create_broadcast(broadcast)
+        if broadcast["_id"] is None:
+            # Another process started one in the meantime.
+            await progress.delete()
+            return False
+        self._launch(broadcast)
+        return True
+
+    async def resume(self) -> None:
+        """Resume the broadcast that was running when the bot stopped, if any."""
+        broadcast = await self.database.get_running_broadcast()
+        if broadcast is not None:
+            logger.info("Resuming broadcast %s after user %s.", broadcast["_id"], broadcast["last_user_id"])
+            self._launch(broadcast)
+
+    async def cancel(self) -> bool:
+        """Cancel the running broadcast, returns whether there was one."""
+        if not self.running:
+            return False
+        self.stop()
+        await self.database.update_broadcast(self._broadcast["_id"], {"status": "cancelled"})
+        return True
+
+    def stop(self) -> None:
+        """Stop sending, without touching the checkpoint so :meth:`resume` continues it."""
+        if self.task is not None:
+            self.task.cancel()
+
+    def _launch(self, broadcast: Dict) -> None:
+        self._broadcast = broadcast
+        self.task = asyncio.create_task(self._run(broadcast))
+
+    async def _retry(self, call: Callable[..., Awaitable], *args: Any) -> Any:
+        for attempt in range(self.retries + 1):
+            try:
+                return await call(*args)
+            except PyMongoError as exception:
+                if attempt == self.retries:
+                    raise
+                delay = self.retry_delay * 2**attempt
+                logger.warning("Broadcast: database error, retrying in %ss: %s", delay, exception)
+                await asyncio.sleep(delay)
+
+    async def _run(self, broadcast: Dict) -> None:
+        started = time.monotonic()
+        done_before = broadcast["sent"] + broadcast["blocked"] + broadcast["failed"]
+        try:
+            await self._send_all(broadcast, started, done_before)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Broadcast %s failed.", broadcast["_id"])
+            broadcast["status"] = "failed"
+            try:
+                await self.database.update_broadcast(broadcast["_id"], {"status": "failed"})
+            except PyMongoError as exception:
+                logger.warning("Couldn't mark broadcast %s as failed: %s", broadcast["_id"], exception)
+        await self._report(broadcast, started, done_before)
+
+    async def _send_all(self, broadcast: Dict, started: float, done_before: int) -> None:
+        payload = broadcast["payload"]
+        if payload["buttons"] or "message_id" not in payload:
+            content = (None, MessageType(payload["type"]), payload["file_id"])
+            reply_markup = build_markup(
+                [[InlineKeyboardButton(**button) for button in row] for row in payload["buttons"]]
+            )
+        else:
+            content = reply_markup = None
+        semaphore = asyncio.Semaphore(self.concurrency)
+        last_progress = 0.0
+
+        async def send(user_id: int) -> str:
+            async with semaphore:
+                try:
+                    if content is None:
+                        await self.bot.copy_message(
+                            user_id,
+                            payload["from_chat_id"],
+                            payload["message_id"],
+                            rate_limit_args=Priority.BROADCAST,
+                        )
+                    else:
+                        await send_content(
+                            self.bot,
+                            user_id,
+                            content,
+                            payload["text"],
+                            reply_markup,
+                            rate_limit_args=Priority.BROADCAST,
+                        )
+                    return "sent"
+                except Forbidden:
+                    return "blocked"
+                except TelegramError as exception:
+                    logger.info("Broadcast to %s failed: %s", user_id, exception.message)
+                    return "failed"
+
+        batch: List[int] = []
+        # The last id read, the stream starts again after it when the cursor fails.
+        last_read = broadcast["last_user_id"]
+        users = self.database.get_active_users(last_read)
+        failures = 0
+        while True:
+            try:
+                user_id = await anext(users, None)
+                failures = 0
+            except PyMongoError as exception:
+                if failures == self.retries:
+                    raise
+                delay = self.retry_delay * 2**failures
+                failures += 1
+                logger.warning("Broadcast: database error, retrying in %ss: %s", delay, exception)
+                await asyncio.sleep(delay)
+                users = self.database.get_active_users(last_read)
+                continue
+            if user_id is not None:
+                last_read = user_id
+                if user_id not in self.database.banned:
+                    batch.append(user_id)
+                if len(batch) < self.batch_size:
+                    continue
+            if batch:
+                results = await asyncio.gather(*(send(user_id) for user_id in batch))
+                for result in results:
+                    broadcast[result] += 1
+                await self._retry(
+                    self.database.mark_users_inactive,
+                    [user_id for user_id, result in zip(batch, results) if result == "blocked"],
+                )
+                broadcast["last_user_id"] = batch[-1]
+                await self._retry(
+                    self.database.update_broadcast,
+                    broadcast["_id"],
+                    {key: broadcast[key] for key in ("last_user_id", "sent", "blocked", "failed")},
+                )
+                batch = []
+            if user_id is None:
+                break
+            if time.monotonic() - last_progress >= self.progress_interval:
+                last_progress = time.monotonic()
+                await self._report(broadcast, started, done_before)
+
+        broadcast["status"] = "done"
+        await self._retry(self.database.update_broadcast, broadcast["_id"], {"status": "done"})
+
+    async def _report(self, broadcast: Dict, started: float, done_before: int) -> None:
+        done = broadcast["sent"] + broadcast["blocked"] + broadcast["failed"]
+        rate = (done - done_before) / max(time.monotonic() - started, 1e-6)
+        remaining = max(broadcast["total"] - done, 0)
+        eta = remaining / rate if rate and broadcast["status"] == "running" else 0
+        text = strings["broadcast-progress"].format(
+            {"done": "✅", "failed": "⚠️"}.get(broadcast["status"], "📣"),
+            done,
+            broadcast["total"],
+            broadcast["sent"],
+            broadcast["blocked"],
+            broadcast["failed"],
+            rate,
+            int(eta // 60),
+            int(eta % 60),
+        )
+        try:
+            await self.bot.edit_message_text(
+                text,
+                chat_id=broadcast["chat_id"],
+                message_id=broadcast["message_id"],
+                rate_limit_args=Priority.ADMIN,
+            )
+        except TelegramError as exception:
+            # E.g. the message was deleted, or is unchanged; the broadcast goes on.
+            logger.debug("Couldn't update the broadcast progress: %s", exception.message)
+
+
+def build_payload(message: Message) -> Dict:
+    """Serialize the message to broadcast, so it can be stored with the broadcast.
+
+    Messages without ``buttonurl:`` markup are copied from the original, the others are
+    rebuilt from their content.
+    """
+    content = message_content(message)
+    data = button_parser(content[0]) if has_button_markup(message) else ("", [])
+    return {
+        "from_chat_id": message.chat_id,
+        "message_id": message.message_id,
+        "type": str(content[1]),
+        "file_id": content[2],
+        "text": data[0],
+        "buttons": [[{"text": button.text, "url": button.url} for button in row] for row in data[1]],
+    }
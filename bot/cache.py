@@ -0,0 +1,132 @@
+"""This module contains the in-memory caches used by the bot."""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, List, Optional, TypeVar
+
+V = TypeVar("V")
+
+_MISSING = object()
+
+
+class LRUCache(Generic[V]):
+    """A least recently used cache with an optional time to live for the entries.
+
+    Args:
+        maxsize: The maximum number of entries, the least recently used are evicted first.
+        ttl: The number of seconds an entry stays valid, :obj:`None` to never expire.
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+
+        value, expires = entry
+        if expires is not None and expires < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: V, ttl: Optional[float] = None) -> None:
+        """Store `value`, valid for `ttl` seconds instead of the ttl of the cache if given."""
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl is not None else None
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[0]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def values(self) -> List[V]:
+        """Return the values, expired ones included."""
+        return [entry[0] for entry in self._data.values()]
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class AsyncLRUCache(LRUCache[V]):
+    """A :class:`LRUCache` that loads missing entries with a coroutine function.
+
+    Concurrent lookups of the same missing key share a single call of the loader.
+    Exceptions raised by the loader are propagated and not cached.
+
+    Args:
+        loader: The coroutine function called with the key to load a missing entry.
+        maxsize: The maximum number of entries, the least recently used are evicted first.
+        ttl: The number of seconds an entry stays valid, :obj:`None` to never expire.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[Any], Awaitable[V]],
+        maxsize: int,
+        ttl: Optional[float] = None,
+    ) -> None:
+        super().__init__(maxsize, ttl)
+        self.loader = loader
+        self.coalesced = 0
+        self._pending: Dict[Hashable, asyncio.Future] = {}
+
+    async def load(self, key: Hashable) -> V:
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            value = await self.loader(key)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exception:
+            future.set_exception(exception)
+            # Don't warn about an exception nobody else was waiting for.
+            future.exception()
+            raise
+        else:
+            self.set(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            del self._pending[key]
+
+    def stats(self) -> Dict[str, float]:
+        stats = super().stats()
+        stats["coalesced"] = self.coalesced
+        return stats
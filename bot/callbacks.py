@@ -1,11 +1,12 @@
 """The module contains some bots functionality."""
-import os
+import asyncio
 import re
-from typing import cast
+import time
+from typing import Dict, List, cast
 from logging import getLogger
 
 from telegram.error import BadRequest
-from telegram.ext import ContextTypes
+from telegram.ext import ApplicationHandlerStop, ContextTypes
 from telegram import (
     Bot,
     Chat,
@@ -17,9 +18,21 @@ from telegram import (
     Update
 )
 
+from bot.admins import AdminRouter
 from bot.const import strings
-from bot.helpers import button_parser, get_user_id, message_content
-from bot.constants import MessageType, UserState
+from bot.helpers import (
+    build_markup,
+    button_parser,
+    get_database,
+    get_states,
+    get_user_id,
+    has_button_markup,
+    message_content,
+    send_content,
+)
+from bot.constants import Priority, UserState
+from bot.floodcontrol import FloodControl
+from bot.metrics import LatencyStats
 from bot.models import Database
 
 logger = getLogger(__name__)
@@ -27,6 +40,10 @@ logger = getLogger(__name__)
 URL = "https://telegra.ph/file/0be5e826d1bc2f49d919d.jpg"
 """The media url in start messages."""
 
+RELAY_LATENCY = {"copy": LatencyStats(), "buttons": LatencyStats()}
+"""The latency of the admin replies, sent with :meth:`telegram.Bot.copy_message` or
+rebuilt to add buttons."""
+
 
 async def info(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
@@ -40,7 +57,7 @@ async def info(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user = cast(User, update.effective_user)   
     language = "id" if user.language_code == "id" else "en"
 
-    if await Database().user_is_banned(user.id):
+    if await get_database(context).user_is_banned(user.id):
         await message.reply_text(strings[language]["not-allowed"])
         return
         
@@ -51,7 +68,8 @@ async def info(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             )
         ]
     )
-    await Database().register_user_by_dict(user.to_dict())
+    # Written in the background, the reply doesn't wait for Mongo.
+    context.bot_data["activity"].register(user.id)
     await message.reply_text(
         text=strings[language]["start"].format(URL, user.first_name),
         reply_markup=keyboard
@@ -66,10 +84,11 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         update: The Telegram update.
         context: The callback context as provided by the application.
     """
-    if context.user_data.get("state", UserState.IDLE) != UserState.IDLE:
+    query = cast(CallbackQuery, update.callback_query)
+    states = get_states(context)
+    if await states.get(query.from_user.id) != UserState.IDLE:
         return
 
-    query = cast(CallbackQuery, update.callback_query)
     language = "id" if query.from_user.language_code == "id" else "en"
     keyboard = InlineKeyboardMarkup.from_column(
         [
@@ -80,7 +99,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         text=strings[language]["start-conversation"].format(URL),
         reply_markup=keyboard
     )
-    context.user_data["state"] = UserState.COMMENTING
+    states.set(query.from_user.id, UserState.COMMENTING)
 
 
 async def back(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -104,7 +123,37 @@ async def back(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         strings[language]["start"].format(URL, query.from_user.first_name),
         reply_markup=keyboard
     )
-    context.user_data["state"] = UserState.IDLE
+    get_states(context).set(query.from_user.id, UserState.IDLE)
+
+
+async def flood_control(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Drops the messages of the users that flood the bot, before they reach the other
+    handlers. The user is told once when they get muted, and banned after too many mutes.
+
+    Args:
+        update: The Telegram update.
+        context: The callback context as provided by the application.
+    """
+    message = cast(Message, update.effective_message)
+    user = cast(User, update.effective_user)
+    flood: FloodControl = context.bot_data["flood"]
+
+    verdict = flood.check(user.id, message.media_group_id)
+    if verdict == "allow":
+        return
+
+    if verdict == "mute":
+        throttle = flood.users.get(user.id)
+        language = "id" if user.language_code == "id" else "en"
+        await message.reply_text(
+            strings[language]["flood-muted"].format(throttle.muted_until - time.monotonic())
+        )
+    elif verdict == "ban":
+        logger.info("Banning %s for flooding the bot.", user.id)
+        await get_database(context).ban_user(user.id)
+        await message.reply_text(strings["got-banned"])
+    raise ApplicationHandlerStop
 
 
 async def handle(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -115,31 +164,99 @@ async def handle(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         update: The Telegram update.
         context: The callback context as provided by the application.
     """
-    if context.user_data.get("state", None) != UserState.COMMENTING:
+    user = cast(User, update.effective_user)
+    if await get_states(context).get(user.id) != UserState.COMMENTING:
         return 
         
     message = cast(Message, update.effective_message)        
-    user = cast(User, update.effective_user)
     chat = cast(Chat, update.effective_chat)  
     bot = cast(Bot, context.bot)
-    if await Database().user_is_banned(user.id):
+    database = get_database(context)
+    if await database.user_is_banned(user.id):
         return 
+    context.bot_data["activity"].touch(user.id)
+    context.bot_data["analytics"].count("messages")
+    context.bot_data["archive"].record(message, user.id)
     
-    user = await bot.get_chat(user.id) 
-    
-    if message:  
-        fw = await bot.forward_message(
-            chat_id=int(os.environ.get("ADMINS")),
-            from_chat_id=chat.id,
-            message_id=message.message_id
-        )      
-        if user.has_private_forwards:
-            await bot.send_message(
-                chat_id=int(os.environ.get("ADMINS")),
-                text=strings["has-private-forwards"].format(user.id),
-                reply_to_message_id=fw.message_id,
+    if message.media_group_id:
+        # The album is forwarded at once by `forward_album`.
+        context.bot_data["albums"].add(message)
+        return
+
+    # The albums sent before are relayed first, they are still collected.
+    await context.bot_data["albums"].flush(chat.id)
+    await relay(bot, database, context.bot_data["admins"], user.id, chat.id, [message.message_id])
+
+
+async def forward_album(
+    bot: Bot, database: Database, admins: AdminRouter, messages: List[Message]
+) -> None:
+    """
+    Forward the items of an album collected by :class:`bot.albums.AlbumCollector`
+    with a single request.
+
+    Args:
+        bot: The bot.
+        database: The database.
+        admins: The routing of the messages to the admins.
+        messages: The items of the album, sorted by message id.
+    """
+    await relay(
+        bot,
+        database,
+        admins,
+        messages[0].from_user.id,
+        messages[0].chat_id,
+        [message.message_id for message in messages],
+    )
+
+
+async def relay(
+    bot: Bot,
+    database: Database,
+    admins: AdminRouter,
+    user_id: int,
+    from_chat_id: int,
+    message_ids: List[int],
+) -> None:
+    """
+    Forward messages of a user to all the admin chats that receive them, in parallel.
+    A failing admin chat doesn't prevent the delivery to the others.
+
+    Args:
+        bot: The bot.
+        database: The database.
+        admins: The routing of the messages to the admins.
+        user_id: The user that sent the messages.
+        from_chat_id: The chat the messages were sent in.
+        message_ids: The messages, sorted by message id.
+    """
+    targets = await admins.targets(user_id)
+
+    async def forward(target: Dict) -> None:
+        if len(message_ids) == 1:
+            forwarded = [
+                await bot.forward_message(
+                    from_chat_id=from_chat_id, message_id=message_ids[0], **target
+                )
+            ]
+        else:
+            forwarded = await bot.forward_messages(
+                from_chat_id=from_chat_id, message_ids=message_ids, **target
             )
-            return
+        # Replies to the forwarded messages are routed back to the user through this,
+        # even if the user hides their account in forwarded messages.
+        await database.save_routes(
+            target["chat_id"], [fw.message_id for fw in forwarded], user_id
+        )
+
+    results = await asyncio.gather(*(forward(target) for target in targets), return_exceptions=True)
+    errors = [result for result in results if isinstance(result, Exception)]
+    for target, result in zip(targets, results):
+        if isinstance(result, Exception):
+            logger.warning("Couldn't forward to %s: %s", target["chat_id"], result)
+    if errors and len(errors) == len(targets):
+        raise errors[0]
 
 
 async def reply(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -152,53 +269,29 @@ async def reply(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     message = cast(Message, update.effective_message)    
     bot = cast(Bot, context.bot)
-    TYPE = {
-        MessageType.ANIMATION: bot.send_animation,
-        MessageType.AUDIO: bot.send_audio,
-        MessageType.DOCUMENT: bot.send_document,
-        MessageType.PHOTO: bot.send_photo,
-        MessageType.STICKER: bot.send_sticker,
-        MessageType.VIDEO: bot.send_video,
-        MessageType.VIDEO_NOTE: bot.send_video_note,
-        MessageType.VOICE: bot.send_voice,
-        MessageType.TEXT: bot.send_message,
-    } 
-    
-    user_id = await get_user_id(message, strings)      
-    content = message_content(message)     
-    data = button_parser(content[0])   
     
+    user_id = await get_user_id(message, strings, get_database(context))
+    if user_id is None:
+        return
+
+    started = time.perf_counter()
     try:
-        if TYPE[content[1]] in [
-            bot.send_audio,
-            bot.send_voice,
-            bot.send_document,
-        ]:
-            await TYPE[content[1]](
-                user_id,
-                content[2],
-                caption=data[0],
-                reply_markup=InlineKeyboardMarkup(data[1]) if len(data[1]) != 0 else None
-            )            
-        elif TYPE[content[1]] in [bot.send_sticker, bot.send_video_note]:
-            await TYPE[content[1]](
-                user_id, 
-                content[2]
-            )
-        elif TYPE[content[1]] == bot.send_message:
-            await TYPE[content[1]](
-                user_id, 
-                data[0],
-                reply_markup=InlineKeyboardMarkup(data[1]) if len(data[1]) != 0 else None
+        if not has_button_markup(message):
+            # Nothing to add, Telegram copies the message as it is.
+            path = "copy"
+            await bot.copy_message(
+                user_id, message.chat_id, message.message_id, rate_limit_args=Priority.ADMIN
             )
         else:
-            await TYPE[content[1]](
-                user_id,
-                content[2],
-                caption=data[0],
-                has_spoiler=True,
-                reply_markup=InlineKeyboardMarkup(data[1]) if len(data[1]) != 0 else None
+            path = "buttons"
+            content = message_content(message)
+            text, buttons = button_parser(content[0])
+            await send_content(
+                bot, user_id, content, text, build_markup(buttons), rate_limit_args=Priority.ADMIN
             )
+        RELAY_LATENCY[path].observe(time.perf_counter() - started)
+        context.bot_data["analytics"].count("replies")
+        context.bot_data["archive"].record(message, user_id, message.from_user.id)
     except BadRequest as exception:
         logger.info(
             "The message couldn't be sent to user_id %s, due to: %s", 
@@ -10,6 +10,7 @@ strings = {
             "⬇️<a href='{}'> </a><u>Write a message here</u> (or send media) and I'll reply as soon as possible."
         ),
         "not-allowed": "❌ <i>You have been blocked to using this bot.</i>",
+        "flood-muted": "⏳ <i>Slow down, your messages are ignored for {:.0f} seconds.</i>",
         "start-button": "💭 Start conversation",
         "back-button": "❌",
     },
@@ -22,6 +23,7 @@ strings = {
             "⬇️<a href='{}'> </a><u>Tulis pesan di sini</u> (atau kirim media) dan saya akan membalasnya sesegera mungkin."
         ),
         "not-allowed": "❌ <i>Anda telah diblokir untuk menggunakan bot ini.</i>",
+        "flood-muted": "⏳ <i>Pelan-pelan, pesan Anda diabaikan selama {:.0f} detik.</i>",
         "start-button": "💭 Mulai percakapan",
         "back-button": "❌",
     },
@@ -34,6 +36,43 @@ strings = {
     "no-message": "You have to reply to the message of the user.",
     "user-not-found": "User_id not found.",
     "user-id": "User_id: <code>{}</code>",
-    "count-of-users": "🔢 Users that started the bot: <code>{}</code>",
-    "has-private-forwards": "⬆️ <code>{}</code> has hidden account. Reply to this message to answering."
+    "count-of-users": (
+        "🔢 Users that started the bot: <code>{}</code>\n"
+        "🚷 Banned users: <code>{}</code>\n"
+        "💤 Users that blocked the bot: <code>{}</code>"
+    ),
+    "list-banned": "🚷 <b><u>List Banned Users</u></b>",
+    "broadcast-no-message": "Reply to the message you want to broadcast.",
+    "broadcast-running": "A broadcast is already running, cancel it with /broadcast cancel.",
+    "broadcast-not-running": "No broadcast is running.",
+    "broadcast-cancelled": "📣 <i>The broadcast has been cancelled.</i>",
+    "broadcast-started": "📣 <i>Starting the broadcast...</i>",
+    "broadcast-progress": (
+        "{} <b><u>Broadcast</u></b>\n"
+        "Progress: <code>{}/{}</code>\n"
+        "Sent: <code>{}</code> · Blocked: <code>{}</code> · Failed: <code>{}</code>\n"
+        "Throughput: <code>{:.1f}</code> msg/s · ETA: <code>{}m {:02d}s</code>"
+    ),
+    "templates": "📝 <b><u>Reply Templates</u></b>",
+    "template-save-usage": "Reply to a message with /save &lt;name&gt; to save it as a template.",
+    "template-use-usage": "Reply to a user message with /use &lt;name&gt; to answer with a template.",
+    "template-delete-usage": "Usage: /deltemplate &lt;name&gt;",
+    "template-saved": "📝 <i>The template</i> <code>{}</code> <i>has been saved.</i>",
+    "template-deleted": "🗑 <i>The template</i> <code>{}</code> <i>has been deleted.</i>",
+    "template-not-found": "There is no template named <code>{}</code>.",
+    "status-section": "📊 <b><u>{}</u></b>\n{}",
+    "perf-empty": "<i>Nothing recorded yet.</i>",
+    "analytics": "📈 <b><u>Analytics</u></b> <code>{} → {}</code>",
+    "analytics-metric": (
+        "{}\n<code>{}</code>\n"
+        "Today: <code>{}</code> · Average: <code>{:.1f}</code> · Peak: <code>{}</code>"
+    ),
+    "analytics-actives": "👥 <b>Daily active users</b>",
+    "analytics-signups": "🆕 <b>New users</b>",
+    "analytics-messages": "📥 <b>Messages from users</b>",
+    "analytics-replies": "📤 <b>Replies from admins</b>",
+    "analytics-usage": "Usage: /analytics [days], at most {} days.",
+    "history": "🗂 <b><u>History</u></b> of <code>{}</code>",
+    "history-empty": "<i>No archived messages.</i>",
+    "history-usage": "Usage: /history &lt;user_id&gt;, or reply to a message of the user with /history.",
 }
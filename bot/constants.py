@@ -1,9 +1,10 @@
 """This module contains several constants that are relevant for the Bot."""
-from enum import Enum
+from enum import Enum, IntEnum
 from telegram._utils.enum import StringEnum
 
 __all__ = [
-    "MessageType"
+    "MessageType",
+    "Priority",
     "UserState",
 ]  
 
@@ -12,6 +13,18 @@ class UserState(Enum):
     IDLE = 1
 
 
+class Priority(IntEnum):
+    """This enum contains the priority classes of the outgoing requests, lower values are
+    sent first. Pass them as ``rate_limit_args`` to the bot methods, requests without
+    one are sent as :attr:`NORMAL`.
+    """
+    # The values start at 1, a falsy `rate_limit_args` is dropped by the bot.
+    ADMIN = 1
+    NORMAL = 2
+    ERROR = 3
+    BROADCAST = 4
+
+
 class MessageType(StringEnum):
     """This enum contains the available types of :class:`telegram.Message` that can be seen. The enum
     members of this enumeration are instances of :class:`str` and can be treated as such.
@@ -24,4 +37,9 @@ class MessageType(StringEnum):
     VIDEO = "video"
     VIDEO_NOTE = "video_note"
     VOICE = "voice"
+    POLL = "poll"
+    VENUE = "venue"
+    LOCATION = "location"
+    CONTACT = "contact"
+    DICE = "dice"
     TEXT = "text"
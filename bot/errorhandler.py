@@ -1,22 +1,156 @@
 """The module contains the error handler."""
+import asyncio
+import hashlib
 import html
 import io
 import json
+import os
 import uuid
 import traceback
 
 from logging import getLogger
-from telegram import Update
+from typing import Dict, List, Optional
+from telegram import Bot, Update
+from telegram.error import TelegramError
 from telegram.ext import ContextTypes
 
+from bot.constants import Priority
+
 logger = getLogger(__name__)
 
 
+def fingerprint(error: BaseException) -> str:
+    """Identify an error by its type and the frames of its traceback, so repeated
+    occurrences of the same failure can be counted together."""
+    frames = traceback.extract_tb(error.__traceback__)
+    key = type(error).__qualname__ + "".join(
+        f"|{frame.filename}:{frame.name}:{frame.lineno}" for frame in frames
+    )
+    return hashlib.sha1(key.encode()).hexdigest()[:10]
+
+
+class ErrorReporter:
+    """Decides which errors are reported to the developer chat.
+
+    The first occurrence of an error is reported in full. Further occurrences of the
+    same :func:`fingerprint` are only counted and summed up in a digest sent every
+    `interval` seconds. At most `max_in_flight` full reports are sent at the same time,
+    the others are dropped, so error reporting can't starve the real traffic.
+
+    Args:
+        chat_id: The chat that receives the reports.
+        interval: The number of seconds between two digests.
+        max_in_flight: The maximum number of full reports being sent at once.
+    """
+
+    def __init__(self, chat_id: int, interval: float = 300, max_in_flight: int = 3) -> None:
+        self.chat_id = chat_id
+        self.interval = interval
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.dropped = 0
+        # fingerprint -> [occurrences since the last report, summary of the error]
+        self.errors: Dict[str, List] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls) -> "ErrorReporter":
+        """Create the reporter from ``ERROR_CHAT``, ``ERROR_DIGEST_INTERVAL`` and
+        ``ERROR_MAX_IN_FLIGHT``."""
+        return cls(
+            int(os.environ.get("ERROR_CHAT", -1001929613454)),
+            float(os.environ.get("ERROR_DIGEST_INTERVAL", 300)),
+            int(os.environ.get("ERROR_MAX_IN_FLIGHT", 3)),
+        )
+
+    def record(self, error: BaseException) -> str:
+        """Count an occurrence, returns the fingerprint if it is the first one."""
+        key = fingerprint(error)
+        entry = self.errors.get(key)
+        if entry is not None:
+            entry[0] += 1
+            return ""
+        self.errors[key] = [0, f"{type(error).__name__}: {error}"[:200]]
+        return key
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "fingerprints": len(self.errors),
+            "repeats": sum(entry[0] for entry in self.errors.values()),
+            "in_flight": self.in_flight,
+            "dropped": self.dropped,
+        }
+
+    def start(self, bot: Bot) -> None:
+        self._task = asyncio.create_task(self._send_digests(bot))
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+    def digest(self) -> Optional[str]:
+        """Return the digest of the occurrences since the last one, and reset them."""
+        lines = []
+        for key, entry in sorted(self.errors.items(), key=lambda item: -item[1][0]):
+            if entry[0]:
+                lines.append(f"x{entry[0]} <code>{key}</code> {html.escape(entry[1])}")
+        # An error that didn't occur again is reported in full on its next occurrence.
+        self.errors = {key: [0, entry[1]] for key, entry in self.errors.items() if entry[0]}
+        if self.dropped:
+            lines.append(f"{self.dropped} reports dropped")
+            self.dropped = 0
+        if not lines:
+            return None
+        minutes = f"{self.interval / 60:g}"
+        return "\n".join([f"Errors in the last {minutes} min:", *lines[:30]])[:4096]
+
+    async def _send_digests(self, bot: Bot) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            text = self.digest()
+            if text is None:
+                continue
+            try:
+                await bot.send_message(self.chat_id, text, rate_limit_args=Priority.ERROR)
+            except TelegramError as exception:
+                logger.warning("Couldn't send the error digest: %s", exception)
+
+
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Log the error and send a telegram message to notify the developer."""
     # Log the error before we do anything else, so we can see it even if something breaks.
     logger.error(msg="Exception while handling an update:", exc_info=context.error)
 
+    reporter: ErrorReporter = context.bot_data["errors"]
+    key = reporter.record(context.error)
+    if not key:
+        return
+    if reporter.in_flight >= reporter.max_in_flight:
+        reporter.dropped += 1
+        # Reported in full on its next occurrence.
+        reporter.errors.pop(key, None)
+        return
+
+    reporter.in_flight += 1
+    try:
+        await send_report(update, context, reporter.chat_id, key)
+    except TelegramError as exception:
+        # Reporting a failure mustn't raise, and e.g. a flood wait is in the digest.
+        logger.warning("Couldn't send the error report %s: %s", key, exception)
+        reporter.dropped += 1
+        reporter.errors.pop(key, None)
+    except Exception:
+        reporter.errors.pop(key, None)
+        raise
+    finally:
+        reporter.in_flight -= 1
+
+
+async def send_report(
+    update: object, context: ContextTypes.DEFAULT_TYPE, chat_id: int, key: str
+) -> None:
+    """Send the full report of an error."""
+
     # traceback.format_exception returns the usual python message about an exception, but as a
     # list of strings rather than a single string, so we have to join them together.
     tb_list = traceback.format_exception(
@@ -28,7 +162,7 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> N
     # You might need to add some logic to deal with messages longer than the 4096 character limit.
     update_str = update.to_dict() if isinstance(update, Update) else str(update)
     message = (
-        f"An exception was raised while handling an update\n"
+        f"An exception was raised while handling an update (<code>{key}</code>)\n"
         f"<pre><code class='language-python'>update = {html.escape(json.dumps(update_str, indent=2, ensure_ascii=False))}"
         "</code></pre>\n\n"
         f"<pre><code class='language-python'>{html.escape(tb_string)}</code></pre>"
@@ -40,11 +174,14 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> N
         )) as out_file:
             out_file.name = str(uuid.uuid4()).split("-")[0].upper() + ".txt"
             await context.bot.send_document(
-                chat_id=int(-1001929613454),
+                chat_id=chat_id,
                 document=out_file,
                 caption="An exception was raised while handling an update.",
+                rate_limit_args=Priority.ERROR,
             )
             return
 
     # Finally, send the message
-    await context.bot.send_message(chat_id=int(-1001929613454), text=message)
+    await context.bot.send_message(
+        chat_id=chat_id, text=message, rate_limit_args=Priority.ERROR
+    )
@@ -0,0 +1,135 @@
+"""This module contains the flood control of the messages sent by the users."""
+import os
+import time
+from typing import Dict, Optional
+
+from bot.cache import LRUCache
+
+
+class Throttle:
+    """The flood state of one user: a token bucket, and the mutes it earned."""
+
+    __slots__ = ("tokens", "updated", "muted_until", "mutes", "media_group_id")
+
+    def __init__(self, tokens: float, now: float) -> None:
+        self.tokens = tokens
+        self.updated = now
+        self.muted_until = 0.0
+        self.mutes = 0
+        self.media_group_id: Optional[str] = None
+
+
+class FloodControl:
+    """Decides whether a message of a user is processed, before any I/O is done for it.
+
+    Every user has a token bucket refilled with `rate` messages per second, up to `burst`.
+    A user that runs out of tokens is muted for `mute_seconds`, doubled on every
+    following mute; the messages of a muted user are dropped. The mute after
+    `max_mutes` mutes is a ban instead. The state of the users that didn't write for
+    `idle_ttl` seconds, or of the least recently active when there are more than
+    `maxsize`, is forgotten.
+
+    Args:
+        rate: The number of messages per second a user can keep sending.
+        burst: The number of messages a user can send at once.
+        mute_seconds: The duration of the first mute.
+        max_mutes: The number of mutes before a user is banned.
+        maxsize: The maximum number of users tracked.
+        idle_ttl: The number of seconds a user is tracked after their last message.
+    """
+
+    def __init__(
+        self,
+        rate: float = 1.0,
+        burst: float = 10,
+        mute_seconds: float = 60,
+        max_mutes: int = 3,
+        maxsize: int = 100000,
+        idle_ttl: float = 600,
+    ) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.mute_seconds = mute_seconds
+        self.max_mutes = max_mutes
+        # A user is kept at least as long as their longest mute.
+        longest_mute = mute_seconds * 2 ** max(max_mutes - 1, 0)
+        self.users: LRUCache[Throttle] = LRUCache(maxsize, ttl=max(idle_ttl, longest_mute))
+        self.dropped = 0
+        self.muted = 0
+        self.banned = 0
+
+    @classmethod
+    def from_env(cls) -> "FloodControl":
+        """Create the flood control from ``FLOOD_RATE``, ``FLOOD_BURST``,
+        ``FLOOD_MUTE_SECONDS``, ``FLOOD_MAX_MUTES``, ``FLOOD_MAX_USERS`` and
+        ``FLOOD_IDLE_TTL``."""
+        return cls(
+            rate=float(os.environ.get("FLOOD_RATE", 1)),
+            burst=float(os.environ.get("FLOOD_BURST", 10)),
+            mute_seconds=float(os.environ.get("FLOOD_MUTE_SECONDS", 60)),
+            max_mutes=int(os.environ.get("FLOOD_MAX_MUTES", 3)),
+            maxsize=int(os.environ.get("FLOOD_MAX_USERS", 100000)),
+            idle_ttl=float(os.environ.get("FLOOD_IDLE_TTL", 600)),
+        )
+
+    def check(self, user_id: int, media_group_id: Optional[str] = None) -> str:
+        """
+        Account a message of the user.
+
+        Args:
+            user_id: The user that sent the message.
+            media_group_id: The album of the message, the items of an album count as
+                one message.
+
+        Returns:
+            ``"allow"`` to process the message, ``"drop"`` to ignore it, ``"mute"`` if
+            the user was just muted or ``"ban"`` if the user must be banned.
+        """
+        now = time.monotonic()
+        throttle = self.users.get(user_id)
+        if throttle is None:
+            throttle = Throttle(self.burst, now)
+        # Setting it again postpones the expiry of an active user.
+        self.users.set(user_id, throttle)
+
+        if throttle.muted_until > now:
+            self.dropped += 1
+            return "drop"
+        if media_group_id is not None and media_group_id == throttle.media_group_id:
+            return "allow"
+        throttle.media_group_id = media_group_id
+
+        throttle.tokens = min(self.burst, throttle.tokens + (now - throttle.updated) * self.rate)
+        throttle.updated = now
+        if throttle.tokens >= 1:
+            throttle.tokens -= 1
+            return "allow"
+
+        if throttle.mutes >= self.max_mutes:
+            # Dropped without even the ban check until it's forgotten, see `forget`.
+            throttle.muted_until = float("inf")
+            self.banned += 1
+            return "ban"
+        throttle.muted_until = now + self.mute_duration(throttle.mutes)
+        throttle.mutes += 1
+        # The user starts over with a full bucket once the mute is over.
+        throttle.tokens = self.burst
+        throttle.updated = throttle.muted_until
+        self.muted += 1
+        return "mute"
+
+    def forget(self, user_id: int) -> None:
+        """Forget the mutes of the user, e.g. when the user is unbanned."""
+        self.users.pop(user_id)
+
+    def mute_duration(self, mutes: int) -> float:
+        """Return the duration of the mute of a user that was already muted `mutes` times."""
+        return self.mute_seconds * 2 ** mutes
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "tracked_users": len(self.users),
+            "dropped": self.dropped,
+            "muted": self.muted,
+            "banned": self.banned,
+        }
@@ -1,9 +1,22 @@
 """This module contains convenience helper functions."""
+import asyncio
 import re
-from typing import List, Optional, Tuple, Union
-from telegram import InlineKeyboardButton, Message, Update
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+from telegram import (
+    Bot,
+    Chat,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    Message,
+    MessageOriginUser,
+    Update,
+)
+from telegram.error import TelegramError
+from telegram.ext import ContextTypes
 
 from bot.constants import MessageType
+from bot.models import Database
+from bot.userstate import UserStates
 
 BTN_URL_REGEX = re.compile(r"(\[([^\[]+?)\]\(buttonurl:(?:/{0,2})(.+?)(:same)?\))")
 
@@ -21,10 +34,12 @@ def button_parser(text_note: str) -> Tuple[str, List[InlineKeyboardButton]]:
     Tuple[str, List[InlineKeyboardButton]]
         The parsed string and buttons
     """
-    note_data = ""
+    # The pieces are joined once at the end, this keeps the parsing linear in the length
+    # of the text.
+    parts = []
     buttons = []
     if text_note is None:
-        return note_data, buttons
+        return "", buttons
     prev = 0
     for match in BTN_URL_REGEX.finditer(text_note):
         n_escapes = 0
@@ -42,16 +57,16 @@ def button_parser(text_note: str) -> Tuple[str, List[InlineKeyboardButton]]:
                 buttons.append(
                     [InlineKeyboardButton(text=match.group(2), url=match.group(3))]
                 )
-            note_data += text_note[prev : match.start(1)]
+            parts.append(text_note[prev : match.start(1)])
             prev = match.end(1)
 
         else:
-            note_data += text_note[prev:to_check]
+            parts.append(text_note[prev:to_check])
             prev = match.start(1) - 1
 
-    note_data += text_note[prev:]
+    parts.append(text_note[prev:])
 
-    return note_data, buttons
+    return "".join(parts), buttons
 
 
 def message_content(union: Union["Message", "Update"]):
@@ -124,28 +139,155 @@ def message_content(union: Union["Message", "Update"]):
         )
         types = MessageType.VOICE
         file_id = message.voice.file_id
+    elif message.poll:
+        """:obj:`str`: Messages with :attr:`telegram.Message.poll`."""
+        msg_data = None
+        types = MessageType.POLL
+        file_id = ""
+    elif message.venue:
+        """:obj:`str`: Messages with :attr:`telegram.Message.venue`."""
+        msg_data = None
+        types = MessageType.VENUE
+        file_id = ""
+    elif message.location:
+        """:obj:`str`: Messages with :attr:`telegram.Message.location`."""
+        msg_data = None
+        types = MessageType.LOCATION
+        file_id = ""
+    elif message.contact:
+        """:obj:`str`: Messages with :attr:`telegram.Message.contact`."""
+        msg_data = None
+        types = MessageType.CONTACT
+        file_id = ""
+    elif message.dice:
+        """:obj:`str`: Messages with :attr:`telegram.Message.dice`."""
+        msg_data = None
+        types = MessageType.DICE
+        file_id = ""
     elif message.text:
         msg_data = message.text_html if message.text_html else message.text
         types = MessageType.TEXT
         file_id = ""
+    else:
+        msg_data = None
+        types = None
+        file_id = ""
 
     return msg_data, types, file_id
 
 
-async def get_user_id(m: Message, strings):
-    if m.reply_to_message and m.reply_to_message.forward_from:
-        user_id = m.reply_to_message.forward_from.id
-        
-    elif m.reply_to_message and m.reply_to_message.text:
-        user = re.search(r'\d+', m.reply_to_message.text)
-        if user:
-            user_id = user.group()
-        else:
-            await m.reply_text(strings["user-not-found"])
-            return
-            
-    else:
+def has_button_markup(message: Message) -> bool:
+    """Whether the text or caption of the message contains ``buttonurl:`` markup."""
+    text = message.text or message.caption
+    return text is not None and "buttonurl:" in text
+
+
+SEND_METHODS: Dict[MessageType, Tuple[str, bool, bool]] = {
+    MessageType.ANIMATION: ("send_animation", True, True),
+    MessageType.AUDIO: ("send_audio", True, False),
+    MessageType.DOCUMENT: ("send_document", True, False),
+    MessageType.PHOTO: ("send_photo", True, True),
+    MessageType.STICKER: ("send_sticker", False, False),
+    MessageType.VIDEO: ("send_video", True, True),
+    MessageType.VIDEO_NOTE: ("send_video_note", False, False),
+    MessageType.VOICE: ("send_voice", True, False),
+    MessageType.TEXT: ("send_message", True, False),
+}
+"""The bot method sending each type of message, whether it takes a caption and buttons,
+and whether the media is sent as a spoiler."""
+
+
+def build_markup(
+    buttons: List[List[InlineKeyboardButton]],
+) -> Optional[InlineKeyboardMarkup]:
+    """Return the keyboard of the buttons parsed by :func:`button_parser`, if any."""
+    return InlineKeyboardMarkup(buttons) if len(buttons) != 0 else None
+
+
+async def send_content(
+    bot: Bot,
+    chat_id: Union[int, str],
+    content: Tuple[Optional[str], MessageType, str],
+    text: str,
+    reply_markup: Optional[InlineKeyboardMarkup] = None,
+    **kwargs: Any,
+) -> Message:
+    """Send a message built by :func:`message_content`, with the text and keyboard built
+    from :func:`button_parser`.
+
+    This is only needed to add buttons, other messages are sent with a single
+    :meth:`telegram.Bot.copy_message`. The keyword arguments are passed on to the bot method.
+    """
+    method, caption, has_spoiler = SEND_METHODS[content[1]]
+
+    if content[1] == MessageType.TEXT:
+        return await bot.send_message(chat_id, text, reply_markup=reply_markup, **kwargs)
+    if not caption:
+        return await getattr(bot, method)(chat_id, content[2], **kwargs)
+    if has_spoiler:
+        kwargs["has_spoiler"] = True
+    return await getattr(bot, method)(
+        chat_id,
+        content[2],
+        caption=text,
+        reply_markup=reply_markup,
+        **kwargs,
+    )
+
+
+async def get_user_id(m: Message, strings, database: Database) -> Optional[int]:
+    """Return the id of the user whose forwarded message `m` replies to.
+
+    The user is looked up in the routes saved by :func:`bot.callbacks.handle`, the
+    forward origin is only used for messages forwarded before routes existed.
+    """
+    if not m.reply_to_message:
         await m.reply_text(strings["no-message"])
         return
-        
+
+    user_id = await database.get_route(m.chat_id, m.reply_to_message.message_id)
+    if user_id is None and m.is_topic_message:
+        # Anything written in the forum topic of a user is meant for that user.
+        user_id = await database.get_topic_user(m.message_thread_id)
+    origin = m.reply_to_message.forward_origin
+    if user_id is None and isinstance(origin, MessageOriginUser):
+        user_id = origin.sender_user.id
+    if user_id is None:
+        await m.reply_text(strings["user-not-found"])
     return user_id
+
+
+def get_database(context: ContextTypes.DEFAULT_TYPE) -> Database:
+    """Return the process-wide database created in :func:`bot.setup.setup_application`."""
+    return context.bot_data["database"]
+
+
+def get_states(context: ContextTypes.DEFAULT_TYPE) -> UserStates:
+    """Return the conversation states created in :func:`bot.setup.register_handlers`."""
+    return context.bot_data["states"]
+
+
+async def get_chat(context: ContextTypes.DEFAULT_TYPE, chat_id: Union[int, str]) -> Chat:
+    """Return a chat through the profile cache created in :func:`bot.setup.setup_application`."""
+    return await context.bot_data["chat_cache"].load(int(chat_id))
+
+
+async def get_chats(
+    context: ContextTypes.DEFAULT_TYPE, chat_ids: Iterable[int], concurrency: int = 10
+) -> Dict[int, Union[Chat, TelegramError]]:
+    """Resolve several chats in parallel, with at most `concurrency` requests in flight.
+
+    A failing id doesn't affect the others, its error is returned in place of the chat.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def resolve(chat_id: int) -> Union[Chat, TelegramError]:
+        async with semaphore:
+            try:
+                return await get_chat(context, chat_id)
+            except TelegramError as exception:
+                return exception
+
+    chat_ids = list(chat_ids)
+    results = await asyncio.gather(*(resolve(chat_id) for chat_id in chat_ids))
+    return dict(zip(chat_ids, results))
@@ -0,0 +1,225 @@
+"""This module contains the runtime metrics of the bot.
+
+Recording a metric only updates a few counters, the Prometheus text and the ``/perf``
+summary are built when they are requested.
+"""
+import asyncio
+import bisect
+import functools
+import time
+from collections import Counter, defaultdict
+from logging import getLogger
+from typing import Any, Awaitable, Callable, DefaultDict, Dict, List, Tuple
+
+from telegram.ext import Application
+from telegram.request import HTTPXRequest
+
+logger = getLogger(__name__)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+"""The upper bounds, in seconds, of the histogram buckets."""
+
+
+class LatencyStats:
+    """Counts the observations of an operation and their duration."""
+
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "avg_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "max_ms": self.max * 1000,
+        }
+
+
+class Histogram(LatencyStats):
+    """:class:`LatencyStats` that also counts the observations per bucket of :data:`BUCKETS`."""
+
+    __slots__ = ("buckets",)
+
+    def __init__(self) -> None:
+        super().__init__()
+        # The last bucket counts the observations above the largest bound.
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def observe(self, seconds: float) -> None:
+        super().observe(seconds)
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate the `q` quantile, as the upper bound of the bucket it falls in."""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def to_dict(self) -> Dict[str, float]:
+        stats = super().to_dict()
+        stats["p50_ms"] = self.quantile(0.5) * 1000 if self.count else 0.0
+        stats["p99_ms"] = self.quantile(0.99) * 1000 if self.count else 0.0
+        return stats
+
+
+HANDLER_LATENCY: DefaultDict[str, Histogram] = defaultdict(Histogram)
+"""The duration of the handler callbacks, by callback name."""
+
+MONGO_LATENCY: DefaultDict[str, Histogram] = defaultdict(Histogram)
+"""The duration of the Mongo commands, by command name."""
+
+MONGO_ERRORS: Counter = Counter()
+"""The failed Mongo commands, by command name."""
+
+API_LATENCY: DefaultDict[str, Histogram] = defaultdict(Histogram)
+"""The duration of the Bot API requests, by method."""
+
+API_ERRORS: Counter = Counter()
+"""The Bot API requests that didn't succeed, by method."""
+
+
+def timed(callback: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """Wrap a handler callback so its duration is recorded in :data:`HANDLER_LATENCY`."""
+    histogram = HANDLER_LATENCY[callback.__name__]
+
+    @functools.wraps(callback)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - started)
+
+    return wrapper
+
+
+def instrument_handlers(application: Application) -> None:
+    """Time the callbacks of all the handlers registered so far."""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            handler.callback = timed(handler.callback)
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """Records the duration and the failures of the Bot API requests, by method."""
+
+    async def do_request(self, url: str, method: str, *args: Any, **kwargs: Any) -> Tuple[int, bytes]:
+        endpoint = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+        except Exception:
+            API_ERRORS[endpoint] += 1
+            raise
+        finally:
+            API_LATENCY[endpoint].observe(time.perf_counter() - started)
+        if code != 200:
+            API_ERRORS[endpoint] += 1
+        return code, payload
+
+
+def gauges(application: Application) -> Dict[str, Dict[str, float]]:
+    """Return the current state of the queues and the shared resources, by section."""
+    processor = application.update_processor
+    sections = {
+        "updates": {
+            "queue_depth": application.update_queue.qsize(),
+            **processor.stats(),
+        },
+        "outbound": application.bot.rate_limiter.stats(),
+    }
+    database = application.bot_data.get("database")
+    if database is not None and database.pool_stats is not None:
+        sections["mongo_pool"] = database.pool_stats.to_dict()
+    for name in ("chat_cache", "states", "activity", "analytics", "archive", "errors"):
+        if name in application.bot_data:
+            sections[name] = application.bot_data[name].stats()
+    return sections
+
+
+def _labels(name: str, value: str) -> str:
+    escaped = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'{name}="{escaped}"'
+
+
+def _histograms(metric: str, label: str, histograms: Dict[str, Histogram]) -> List[str]:
+    lines = [f"# TYPE {metric} histogram"]
+    # Copied first, the Mongo metrics are recorded from the threads of the driver.
+    for key, histogram in sorted(histograms.copy().items()):
+        labels = _labels(label, key)
+        cumulative = 0
+        for bound, count in zip(BUCKETS, histogram.buckets):
+            cumulative += count
+            lines.append(f'{metric}_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+        lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f"{metric}_sum{{{labels}}} {histogram.total}")
+        lines.append(f"{metric}_count{{{labels}}} {histogram.count}")
+    return lines
+
+
+def _counters(metric: str, label: str, counter: Counter) -> List[str]:
+    lines = [f"# TYPE {metric} counter"]
+    lines.extend(
+        f"{metric}{{{_labels(label, key)}}} {value}" for key, value in sorted(counter.copy().items())
+    )
+    return lines
+
+
+def render_prometheus(application: Application) -> str:
+    """Render all the metrics in the Prometheus text exposition format."""
+    lines = [
+        *_histograms("feedbackbot_handler_seconds", "handler", HANDLER_LATENCY),
+        *_histograms("feedbackbot_mongo_command_seconds", "command", MONGO_LATENCY),
+        *_counters("feedbackbot_mongo_command_errors_total", "command", MONGO_ERRORS),
+        *_histograms("feedbackbot_bot_api_seconds", "method", API_LATENCY),
+        *_counters("feedbackbot_bot_api_errors_total", "method", API_ERRORS),
+    ]
+    for section, stats in gauges(application).items():
+        for key, value in stats.items():
+            metric = f"feedbackbot_{section}_{key}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+async def serve_metrics(application: Application, host: str, port: int) -> asyncio.AbstractServer:
+    """Serve :func:`render_prometheus` over HTTP on ``GET /metrics``."""
+
+    async def respond(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await reader.readline()
+            # The headers are read and ignored, there is no request body.
+            while (await reader.readline()).strip():
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", render_prometheus(application).encode()
+            else:
+                status, body = "404 Not Found", b"Not Found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError) as exception:
+            logger.debug("Metrics request failed: %s", exception)
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(respond, host, port)
@@ -1,3 +1,4 @@
-__all__ = ["Database"]
+__all__ = ["Database", "PoolStats"]
 
 from .database import Database
+from .pool import PoolStats
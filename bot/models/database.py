@@ -1,12 +1,214 @@
 """Bot database."""
+import asyncio
 import os
-from typing import Dict, Optional
+from datetime import datetime, timezone
+from logging import getLogger
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorClient as Client
+from pymongo import ASCENDING, DESCENDING, DeleteOne, ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure, PyMongoError
+
+from bot.cache import LRUCache
+from .pool import PoolStats, create_client
+
+logger = getLogger(__name__)
+
+BAN_REFRESH_INTERVAL = float(os.environ.get("BAN_REFRESH_INTERVAL", 30))
+"""Seconds between two checks of the ban list version written by other instances."""
+
+ROUTE_TTL = int(os.environ.get("ROUTE_TTL_DAYS", 30)) * 24 * 60 * 60
+"""Seconds after which a forwarded message can't be replied to anymore."""
+
+UPDATE_QUEUE_TTL = int(os.environ.get("UPDATE_QUEUE_TTL", 24 * 60 * 60))
+"""Seconds after which an update nobody took from the update queue is dropped."""
+
+ARCHIVE_TTL = int(os.environ.get("ARCHIVE_TTL_DAYS", 0)) * 24 * 60 * 60
+"""Seconds after which an archived message is dropped, 0 keeps them forever."""
+
+ACTIVE_DAYS_TTL = 2 * 24 * 60 * 60
+"""Seconds after which the record that a user was active on a day is dropped, it's only
+needed on that day."""
+
+
+def only_duplicates(exception: BulkWriteError) -> bool:
+    """Return whether the writes of an unordered bulk write only failed on duplicate keys."""
+    details = exception.details
+    return not details.get("writeConcernErrors") and all(
+        error["code"] == 11000 for error in details.get("writeErrors", [])
+    )
+
 
 class Database:
-    def __init__(self) -> None:
-        self.client = Client(os.environ.get("MONGO_URL"))
+    _shared: Optional["Database"] = None
+
+    def __init__(self, client: Client, pool_stats: Optional[PoolStats] = None) -> None:
+        self.client = client
+        self.pool_stats = pool_stats
         self.db = self.client["FeedbackBot"]
+        # In-process copy of the `ban` collection, see `load_bans`.
+        self.banned: Set[int] = set()
+        self.ban_version: Optional[int] = None
+        # Called with the id of every unbanned user, here or by another instance.
+        self.unban_listeners: List[Callable[[int], Any]] = []
+        self._refresh_task: Optional[asyncio.Task] = None
+        # The most recent routes, see `save_route`.
+        self.routes: LRUCache[int] = LRUCache(
+            maxsize=int(os.environ.get("ROUTE_CACHE_SIZE", 50000))
+        )
+
+    @classmethod
+    def connect(cls) -> "Database":
+        """Create the database with a new pooled client, shared by the whole process."""
+        pool_stats = PoolStats()
+        return cls(create_client(pool_stats), pool_stats)
+
+    @classmethod
+    def shared(cls) -> "Database":
+        """Return the database of the process, connected on first use, so the handlers
+        and the sharding share one pool."""
+        if cls._shared is None:
+            cls._shared = cls.connect()
+        return cls._shared
+
+    async def start(self) -> None:
+        """Create the indexes, load the ban cache and keep it in sync with the other bot instances."""
+        await self.ensure_indexes()
+        await self.load_bans()
+        self._refresh_task = asyncio.create_task(self._refresh_bans_forever())
+
+    def close(self) -> None:
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+        self.client.close()
+        if Database._shared is self:
+            Database._shared = None
+
+    async def ensure_indexes(self) -> None:
+        """Create the indexes the queries rely on, this is a no-op if they already exist."""
+        for collection in ("users", "ban"):
+            try:
+                await self.db[collection].create_index(
+                    [("user_id", ASCENDING)], unique=True, name="user_id_unique"
+                )
+            except OperationFailure as exception:
+                # Most likely duplicates left over from before the index existed.
+                logger.error(
+                    "Couldn't create the unique index on %s.user_id: %s",
+                    collection,
+                    exception,
+                )
+        await self.db["routes"].create_index(
+            [("chat_id", ASCENDING), ("message_id", ASCENDING)],
+            unique=True,
+            name="message_unique",
+        )
+        await self._ensure_ttl_index("routes", "created_at", ROUTE_TTL)
+        await self.db["users"].create_index(
+            [("topic_id", ASCENDING)], name="topic_id", sparse=True
+        )
+        await self.db["templates"].create_index(
+            [("name", ASCENDING)], unique=True, name="name_unique"
+        )
+        await self.db["update_queue"].create_index(
+            [("shard", ASCENDING), ("_id", ASCENDING)], name="shard_order"
+        )
+        await self._ensure_ttl_index("update_queue", "created_at", UPDATE_QUEUE_TTL)
+        # Covers the pages of `get_archive_page`, `_id` breaks the ties between messages
+        # of the same second.
+        await self.db["archive"].create_index(
+            [("user_id", ASCENDING), ("ts", DESCENDING), ("_id", DESCENDING)], name="user_ts"
+        )
+        # Without ARCHIVE_TTL_DAYS the archive is kept forever, a previous TTL is dropped.
+        await self._ensure_ttl_index("archive", "ts", ARCHIVE_TTL)
+        await self._ensure_ttl_index("active_days", "day", ACTIVE_DAYS_TTL)
+        # Only the few users that blocked the bot are indexed.
+        await self.db["users"].create_index(
+            [("active", ASCENDING)],
+            name="inactive",
+            partialFilterExpression={"active": False},
+        )
+        # At most one broadcast runs at a time, whichever worker started it.
+        try:
+            await self.db["broadcasts"].create_index(
+                [("status", ASCENDING)],
+                unique=True,
+                name="one_running",
+                partialFilterExpression={"status": "running"},
+            )
+        except OperationFailure as exception:
+            # Broadcasts started by several workers before the index existed.
+            logger.error("Couldn't create the unique index on broadcasts.status: %s", exception)
+
+    async def _ensure_ttl_index(self, collection: str, field: str, seconds: int) -> None:
+        """
+        Make the documents of `collection` expire `seconds` after `field`, with the
+        ``expiry`` index.
+
+        ``create_index`` fails when the index exists with another TTL, e.g. after a
+        change of the setting, so the TTL of an existing index is changed in place.
+
+        Args:
+            collection: The name of the collection.
+            field: The date the documents expire after.
+            seconds: The lifetime of the documents, ``0`` to keep them forever, which
+                drops the index.
+        """
+        index = (await self.db[collection].index_information()).get("expiry")
+        if index is not None and (not seconds or index["key"] != [(field, ASCENDING)]):
+            await self.db[collection].drop_index("expiry")
+            index = None
+        if not seconds:
+            return
+        if index is None:
+            await self.db[collection].create_index(
+                [(field, ASCENDING)], expireAfterSeconds=seconds, name="expiry"
+            )
+        elif index.get("expireAfterSeconds") != seconds:
+            await self.db.command(
+                "collMod", collection, index={"name": "expiry", "expireAfterSeconds": seconds}
+            )
+            logger.info("Changed the lifetime of %s to %s seconds.", collection, seconds)
+
+    async def load_bans(self) -> None:
+        """Replace the ban cache with the content of the `ban` collection."""
+        meta = await self.db["meta"].find_one({"_id": "ban"})
+        banned = set(await self.get_banned_users())
+        unbanned = self.banned - banned if self.ban_version is not None else set()
+        self.banned = banned
+        self.ban_version = meta["version"] if meta else 0
+        for user_id in unbanned:
+            self._unbanned(user_id)
+
+    def _unbanned(self, user_id: int) -> None:
+        for listener in self.unban_listeners:
+            listener(user_id)
+
+    async def refresh_bans(self) -> None:
+        """Reload the ban cache if another instance changed the ban list."""
+        meta = await self.db["meta"].find_one({"_id": "ban"})
+        if (meta["version"] if meta else 0) != self.ban_version:
+            await self.load_bans()
+
+    async def _refresh_bans_forever(self) -> None:
+        while True:
+            await asyncio.sleep(BAN_REFRESH_INTERVAL)
+            try:
+                await self.refresh_bans()
+            except PyMongoError as exception:
+                logger.warning("Couldn't refresh the ban cache: %s", exception)
+
+    async def _bump_ban_version(self) -> None:
+        meta = await self.db["meta"].find_one_and_update(
+            {"_id": "ban"},
+            {"$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        # Only skip the next reload if nobody else changed the list in between.
+        if self.ban_version is not None and meta["version"] == self.ban_version + 1:
+            self.ban_version = meta["version"]
 
     async def get_database_stats(self):
         stats = await self.db.command("dbStats")
@@ -20,33 +222,409 @@ class Database:
             return False
         return True
 
-    async def get_all_users(self) -> list:
-        list_users = []
+    async def get_all_users(self) -> AsyncIterator[Dict]:
+        """Iterate over the users with a cursor instead of loading them all at once."""
         async for user in self.db["users"].find({"user_id": {"$gt": 0}}):
-            list_users.append(user)
-        return list_users
+            yield user
+
+    async def count_users(self) -> int:
+        """Return the number of users from the collection metadata, without a scan."""
+        return await self.db["users"].estimated_document_count()
+
+    async def get_user_counts(self) -> Dict[str, int]:
+        """Return the number of users broken down by their status."""
+        return {
+            "total": await self.count_users(),
+            "banned": len(self.banned),
+            "inactive": await self.db["users"].count_documents({"active": False}),
+        }
+
+    async def get_active_users(self, after: int = 0) -> AsyncIterator[int]:
+        """Iterate over the ids of the users that didn't block the bot, sorted by id."""
+        cursor = self.db["users"].find(
+            {"user_id": {"$gt": after}, "active": {"$ne": False}},
+            projection={"_id": False, "user_id": True},
+            batch_size=1000,
+        ).sort("user_id", ASCENDING)
+        async for user in cursor:
+            yield user["user_id"]
+
+    async def mark_users_inactive(self, user_ids: List[int]):
+        if not user_ids:
+            return
+        return await self.db["users"].update_many(
+            {"user_id": {"$in": user_ids}}, {"$set": {"active": False}}
+        )
+
+    async def create_broadcast(self, broadcast: Dict) -> Any:
+        """Store a new broadcast, returns its id or :obj:`None` if one is already running."""
+        try:
+            result = await self.db["broadcasts"].insert_one(broadcast)
+        except DuplicateKeyError:
+            return None
+        return result.inserted_id
+
+    async def update_broadcast(self, broadcast_id: Any, fields: Dict):
+        return await self.db["broadcasts"].update_one(
+            {"_id": broadcast_id}, {"$set": fields}
+        )
+
+    async def get_running_broadcast(self) -> Optional[Dict]:
+        return await self.db["broadcasts"].find_one({"status": "running"})
 
     async def register_user_by_dict(self, info: Dict) -> Dict:
         id = info["id"]
 
-        if await self.get_user_by_id(id):
-            return 
-        return await self.db["users"].insert_one({"user_id": id})
+        try:
+            return await self.db["users"].update_one(
+                {"user_id": id},
+                # A user that blocked the bot and starts it again is active again.
+                {"$setOnInsert": {"user_id": id}, "$unset": {"active": ""}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # A concurrent upsert for the same user won the race.
+            return
+
+    async def write_activity(self, activity: Dict[int, Tuple[bool, datetime]]) -> int:
+        """
+        Register users and record when they were last seen, see
+        :class:`bot.activity.ActivityWriter`.
+
+        Args:
+            activity: The user ids, mapped to whether to register the user and when the
+                user was last seen.
+
+        Returns:
+            The number of users that were registered for the first time.
+        """
+        if not activity:
+            return 0
+        requests = []
+        for user_id, (register, last_seen) in activity.items():
+            if register:
+                # As in `register_user_by_dict`.
+                update = {
+                    "$setOnInsert": {"user_id": user_id},
+                    "$unset": {"active": ""},
+                    "$max": {"last_seen": last_seen},
+                }
+            else:
+                update = {"$max": {"last_seen": last_seen}}
+            requests.append(UpdateOne({"user_id": user_id}, update, upsert=register))
+        try:
+            result = await self.db["users"].bulk_write(requests, ordered=False)
+        except BulkWriteError as exception:
+            # The other writes went through, a duplicate key only means that a
+            # concurrent upsert for the same user won the race.
+            if not only_duplicates(exception):
+                raise
+            return exception.details.get("nUpserted", 0)
+        return result.upserted_count
 
     async def user_is_banned(self, user_id: int) -> bool:
-        return bool(await self.db["ban"].find_one({"user_id": user_id}))
+        return user_id in self.banned
 
     async def ban_user(self, user_id: int):
-        return await self.db["ban"].insert_one({"user_id": user_id})
+        try:
+            result = await self.db["ban"].update_one(
+                {"user_id": user_id}, {"$setOnInsert": {"user_id": user_id}}, upsert=True
+            )
+        except DuplicateKeyError:
+            result = None
+        self.banned.add(user_id)
+        await self._bump_ban_version()
+        return result
+
+    async def unban_user(self, user_id: int) -> bool:
+        """
+        Unban the user, even if the ban wasn't loaded here yet.
+
+        Returns:
+            Whether the user was banned.
+        """
+        result = await self.db["ban"].delete_one({"user_id": user_id})
+        was_banned = user_id in self.banned or result.deleted_count > 0
+        self.banned.discard(user_id)
+        if was_banned:
+            self._unbanned(user_id)
+        if result.deleted_count:
+            await self._bump_ban_version()
+        return was_banned
+
+    async def save_route(self, chat_id: int, message_id: int, user_id: int):
+        """Remember that the message `message_id` in `chat_id` belongs to `user_id`."""
+        return await self.save_routes(chat_id, [message_id], user_id)
+
+    async def save_routes(self, chat_id: int, message_ids: List[int], user_id: int):
+        """Remember that the messages `message_ids` in `chat_id` belong to `user_id`."""
+        now = datetime.now(timezone.utc)
+        for message_id in message_ids:
+            self.routes.set((chat_id, message_id), user_id)
+        return await self.db["routes"].bulk_write(
+            [
+                UpdateOne(
+                    {"chat_id": chat_id, "message_id": message_id},
+                    {"$set": {"user_id": user_id, "created_at": now}},
+                    upsert=True,
+                )
+                for message_id in message_ids
+            ],
+            ordered=False,
+        )
+
+    async def get_route(self, chat_id: int, message_id: int) -> Optional[int]:
+        """Return the user the message `message_id` in `chat_id` belongs to, if known."""
+        user_id = self.routes.get((chat_id, message_id))
+        if user_id is None:
+            route = await self.db["routes"].find_one(
+                {"chat_id": chat_id, "message_id": message_id}
+            )
+            if route is None:
+                return None
+            user_id = route["user_id"]
+            self.routes.set((chat_id, message_id), user_id)
+        return user_id
+
+    async def get_assignment(self, user_id: int) -> Optional[int]:
+        """Return the admin the user is assigned to, see :class:`bot.admins.AdminRouter`."""
+        user = await self.db["users"].find_one({"user_id": user_id}, {"admin": True})
+        return user.get("admin") if user else None
+
+    async def set_assignment(self, user_id: int, admin_id: int):
+        return await self.db["users"].update_one(
+            {"user_id": user_id}, {"$set": {"admin": admin_id}}, upsert=True
+        )
+
+    async def count_assignments(self, admin_ids: List[int]) -> Dict[int, int]:
+        """Return the number of users assigned to each of the admins."""
+        cursor = self.db["users"].aggregate(
+            [
+                {"$match": {"admin": {"$in": admin_ids}}},
+                {"$group": {"_id": "$admin", "count": {"$sum": 1}}},
+            ]
+        )
+        return {group["_id"]: group["count"] async for group in cursor}
 
-    async def unban_user(self, user_id: int):
-        is_banned = await self.user_is_banned(user_id)
-        if not is_banned:
+    async def get_topic(self, user_id: int) -> Optional[int]:
+        """Return the forum topic of the user in the admin group."""
+        user = await self.db["users"].find_one({"user_id": user_id}, {"topic_id": True})
+        return user.get("topic_id") if user else None
+
+    async def set_topic(self, user_id: int, topic_id: int):
+        return await self.db["users"].update_one(
+            {"user_id": user_id}, {"$set": {"topic_id": topic_id}}, upsert=True
+        )
+
+    async def get_topic_user(self, topic_id: int) -> Optional[int]:
+        """Return the user whose forum topic in the admin group is `topic_id`."""
+        user = await self.db["users"].find_one({"topic_id": topic_id}, {"user_id": True})
+        return user["user_id"] if user else None
+
+    async def mark_active(self, when: datetime, user_ids: Iterable[int]) -> int:
+        """
+        Record that the users were active on the day of `when`, see
+        :class:`bot.analytics.Analytics`.
+
+        Returns:
+            The number of users that weren't recorded for that day yet.
+        """
+        day = when.replace(hour=0, minute=0, second=0, microsecond=0)
+        requests = [
+            UpdateOne(
+                {"_id": f"{day:%Y-%m-%d}:{user_id}"}, {"$setOnInsert": {"day": day}}, upsert=True
+            )
+            for user_id in user_ids
+        ]
+        if not requests:
+            return 0
+        try:
+            result = await self.db["active_days"].bulk_write(requests, ordered=False)
+        except BulkWriteError as exception:
+            # Lost races with the other processes, those users were counted by them.
+            if not only_duplicates(exception):
+                raise
+            return exception.details.get("nUpserted", 0)
+        return result.upserted_count
+
+    async def increment_analytics(self, buckets: Dict[datetime, Dict[str, int]]):
+        """Add counts to the documents of their hour, see :class:`bot.analytics.Analytics`."""
+        if not buckets:
             return
-        return await self.db["ban"].delete_one({"user_id": user_id})
+        return await self.db["analytics"].bulk_write(
+            [
+                UpdateOne(
+                    {"_id": hour},
+                    {"$inc": {f"counts.{metric}": amount for metric, amount in counts.items()}},
+                    upsert=True,
+                )
+                for hour, counts in buckets.items()
+            ],
+            ordered=False,
+        )
+
+    async def get_analytics(self, start: datetime, end: datetime) -> List[Dict]:
+        """Return the documents of the hours from `start` to `end`, in order."""
+        cursor = self.db["analytics"].find({"_id": {"$gte": start, "$lt": end}}).sort("_id", ASCENDING)
+        return [document async for document in cursor]
+
+    async def insert_archive(self, records: List[Dict]):
+        """Append messages to the archive, see :class:`bot.archive.Archive`."""
+        if not records:
+            return
+        return await self.db["archive"].insert_many(records, ordered=False)
+
+    async def get_archive_page(
+        self,
+        user_id: int,
+        after: Optional[ObjectId] = None,
+        before: Optional[ObjectId] = None,
+        limit: int = 10,
+    ) -> Tuple[List[Dict], bool, bool]:
+        """
+        Return a page of the archived messages of the user, newest first, found from the
+        boundary of the current page rather than by skipping the previous pages.
+
+        Args:
+            user_id: The user.
+            after: The last (oldest) message of the current page, to get the next page.
+            before: The first (newest) message of the current page, to get the previous
+                page.
+            limit: The number of messages per page.
+
+        Returns:
+            The messages, whether there is a previous page and whether there is a next one.
+        """
+        archive = self.db["archive"]
+
+        def beyond(record: Dict, operator: str) -> Dict:
+            # The messages after `record` in the order of `operator`, ties broken by `_id`.
+            return {
+                "user_id": user_id,
+                "$or": [
+                    {"ts": {operator: record["ts"]}},
+                    {"ts": record["ts"], "_id": {operator: record["_id"]}},
+                ],
+            }
+
+        boundary = before or after
+        anchor = None
+        if boundary is not None:
+            anchor = await archive.find_one({"_id": boundary}, {"ts": True})
+        if anchor is None:
+            # The boundary expired in the meantime, start over.
+            query, before, after = {"user_id": user_id}, None, None
+        else:
+            query = beyond(anchor, "$gt" if before else "$lt")
+        order = ASCENDING if before else DESCENDING
+        cursor = archive.find(query).sort([("ts", order), ("_id", order)])
+        records = [record async for record in cursor.limit(limit + 1)]
+        more = len(records) > limit
+        records = records[:limit]
+        if before:
+            records.reverse()
+        if not records:
+            return records, False, False
+        # The other side is looked up, the messages there may have expired since.
+        if before:
+            has_next = await archive.find_one(beyond(records[-1], "$lt"), {"_id": True})
+            return records, more, has_next is not None
+        has_prev = after is not None and await archive.find_one(
+            beyond(records[0], "$gt"), {"_id": True}
+        ) is not None
+        return records, has_prev, more
+
+    async def save_template(self, template: Dict):
+        return await self.db["templates"].replace_one(
+            {"name": template["name"]}, template, upsert=True
+        )
+
+    async def get_template(self, name: str) -> Optional[Dict]:
+        return await self.db["templates"].find_one({"name": name})
+
+    async def get_template_names(self) -> List[str]:
+        cursor = self.db["templates"].find({}, {"name": True}).sort("name", ASCENDING)
+        return [template["name"] async for template in cursor]
+
+    async def delete_template(self, name: str) -> bool:
+        result = await self.db["templates"].delete_one({"name": name})
+        return bool(result.deleted_count)
+
+    async def get_banned_page(
+        self, after: Optional[int] = None, before: Optional[int] = None, limit: int = 20
+    ) -> Tuple[List[int], bool, bool]:
+        """
+        Return one page of banned user ids, sorted by id.
+
+        The page is selected by keyset on the `user_id` index: pass the last id of the
+        current page as `after` for the next page, or its first id as `before` for the
+        previous one.
+
+        Returns:
+            The ids of the page, whether a previous page and whether a next page exists.
+        """
+        if before is not None:
+            cursor = self.db["ban"].find({"user_id": {"$lt": before, "$gt": 0}})
+            cursor = cursor.sort("user_id", DESCENDING).limit(limit + 1)
+            ids = [user["user_id"] async for user in cursor]
+            ids, has_prev = ids[:limit][::-1], len(ids) > limit
+            # The users of the next page may have been unbanned since.
+            has_next = await self.db["ban"].find_one({"user_id": {"$gte": before}}) is not None
+            return ids, has_prev, has_next
+
+        cursor = self.db["ban"].find({"user_id": {"$gt": after or 0}})
+        cursor = cursor.sort("user_id", ASCENDING).limit(limit + 1)
+        ids = [user["user_id"] async for user in cursor]
+        has_prev = after is not None and await self.db["ban"].find_one(
+            {"user_id": {"$lte": after, "$gt": 0}}
+        ) is not None
+        return ids[:limit], has_prev, len(ids) > limit
 
     async def get_banned_users(self) -> list:
         results = []
         async for user in self.db["ban"].find({"user_id": {"$gt": 0}}):
             results.append(user["user_id"])
         return results
+
+    async def get_user_data(self, user_id: int) -> Optional[Dict]:
+        """Return the conversation state of the user, see :class:`bot.userstate.UserStates`."""
+        document = await self.db["user_data"].find_one({"_id": user_id})
+        return document["data"] if document else None
+
+    async def write_user_data(self, changes: Dict[int, Optional[Dict]]):
+        """Write the conversation state of several users at once, :obj:`None` deletes it."""
+        if not changes:
+            return
+        return await self.db["user_data"].bulk_write(
+            [
+                DeleteOne({"_id": user_id})
+                if data is None
+                else ReplaceOne({"_id": user_id}, {"_id": user_id, "data": data}, upsert=True)
+                for user_id, data in changes.items()
+            ],
+            ordered=False,
+        )
+
+    async def push_updates(self, updates: List[Tuple[int, Dict]]):
+        """Append updates to the queue of their shard, see :mod:`bot.sharding`."""
+        if not updates:
+            return
+        now = datetime.now(timezone.utc)
+        return await self.db["update_queue"].insert_many(
+            [{"shard": shard, "update": update, "created_at": now} for shard, update in updates],
+            ordered=True,
+        )
+
+    async def take_updates(
+        self, shard: int, limit: int = 100, after: Optional[Any] = None
+    ) -> List[Dict]:
+        """Return the oldest updates of the shard, after the queue id `after` if given;
+        they stay queued until :meth:`ack_updates`."""
+        query: Dict[str, Any] = {"shard": shard}
+        if after is not None:
+            query["_id"] = {"$gt": after}
+        cursor = self.db["update_queue"].find(query).sort("_id", ASCENDING)
+        return [document async for document in cursor.limit(limit)]
+
+    async def ack_updates(self, ids: List[Any]):
+        return await self.db["update_queue"].delete_many({"_id": {"$in": ids}})
@@ -0,0 +1,149 @@
+"""Process-wide Mongo client and connection pool statistics."""
+import os
+import threading
+from typing import Dict
+
+from motor.motor_asyncio import AsyncIOMotorClient as Client
+from pymongo import monitoring
+
+from bot.metrics import MONGO_ERRORS, MONGO_LATENCY
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Collects connection pool events so the pool can be sized from real usage.
+
+    The events are published from the threads of the driver, the counters are only
+    changed and read under a lock.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.created = 0
+        self.closed = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.pool_clears = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    @property
+    def open(self) -> int:
+        return self.created - self.closed
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return self._to_dict()
+
+    def _to_dict(self) -> Dict:
+        return {
+            "open": self.open,
+            "created": self.created,
+            "closed": self.closed,
+            "checked_out": self.checked_out,
+            "max_checked_out": self.max_checked_out,
+            "checkouts": self.checkouts,
+            "checkout_failures": self.checkout_failures,
+            "pool_clears": self.pool_clears,
+            "avg_wait_ms": (self.wait_time / self.checkouts * 1000) if self.checkouts else 0.0,
+            "max_wait_ms": self.max_wait_time * 1000,
+        }
+
+    def pool_created(self, event) -> None:
+        pass
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_cleared(self, event) -> None:
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event) -> None:
+        pass
+
+    def connection_created(self, event) -> None:
+        with self._lock:
+            self.created += 1
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def connection_closed(self, event) -> None:
+        with self._lock:
+            self.closed += 1
+
+    def connection_check_out_started(self, event) -> None:
+        pass
+
+    def connection_check_out_failed(self, event) -> None:
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_out(self, event) -> None:
+        # The checkout duration is only reported by pymongo>=4.7.
+        waited = getattr(event, "duration", None)
+        with self._lock:
+            if waited is not None:
+                self.wait_time += waited
+                self.max_wait_time = max(self.max_wait_time, waited)
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+
+    def connection_checked_in(self, event) -> None:
+        with self._lock:
+            self.checked_out -= 1
+
+
+class CommandStats(monitoring.CommandListener):
+    """Records the duration of the Mongo commands in :data:`bot.metrics.MONGO_LATENCY`.
+
+    The events are published from the threads of the driver, the metrics are changed
+    under a lock; the readers copy them first.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+
+    def started(self, event) -> None:
+        pass
+
+    def succeeded(self, event) -> None:
+        with self._lock:
+            MONGO_LATENCY[event.command_name].observe(event.duration_micros / 1e6)
+
+    def failed(self, event) -> None:
+        with self._lock:
+            MONGO_LATENCY[event.command_name].observe(event.duration_micros / 1e6)
+            MONGO_ERRORS[event.command_name] += 1
+
+
+def create_client(pool_stats: PoolStats) -> Client:
+    """
+    Create the Mongo client shared by the whole process.
+
+    The pool is configured from the environment:
+    ``MONGO_MAX_POOL_SIZE``, ``MONGO_MIN_POOL_SIZE``, ``MONGO_MAX_IDLE_TIME_MS``,
+    ``MONGO_CONNECT_TIMEOUT_MS``, ``MONGO_SOCKET_TIMEOUT_MS``,
+    ``MONGO_SERVER_SELECTION_TIMEOUT_MS``, ``MONGO_WAIT_QUEUE_TIMEOUT_MS`` and
+    ``MONGO_READ_PREFERENCE``.
+
+    Args:
+        pool_stats: The listener that receives the connection pool events.
+    """
+    return Client(
+        os.environ.get("MONGO_URL"),
+        maxPoolSize=int(os.environ.get("MONGO_MAX_POOL_SIZE", 50)),
+        minPoolSize=int(os.environ.get("MONGO_MIN_POOL_SIZE", 0)),
+        maxIdleTimeMS=int(os.environ.get("MONGO_MAX_IDLE_TIME_MS", 300000)),
+        connectTimeoutMS=int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", 5000)),
+        socketTimeoutMS=int(os.environ.get("MONGO_SOCKET_TIMEOUT_MS", 10000)),
+        serverSelectionTimeoutMS=int(
+            os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)
+        ),
+        waitQueueTimeoutMS=int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", 5000)),
+        readPreference=os.environ.get("MONGO_READ_PREFERENCE", "primary"),
+        event_listeners=[pool_stats, CommandStats()],
+    )
@@ -0,0 +1,126 @@
+"""This module contains the processor that runs the updates concurrently but in order per chat."""
+import asyncio
+from logging import getLogger
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = getLogger(__name__)
+
+
+def update_key(update: object) -> Optional[Hashable]:
+    """Return the conversation of the update: its chat, and its topic in a forum.
+    Updates without a chat aren't ordered."""
+    if not isinstance(update, Update) or update.effective_chat is None:
+        return None
+    message = update.effective_message
+    if message is not None and message.is_topic_message:
+        return update.effective_chat.id, message.message_thread_id
+    return update.effective_chat.id
+
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    """Processes the updates of different chats concurrently, and the updates of one chat
+    one after the other in the order they arrived.
+
+    An update waits for the previous updates of its chat before it takes one of the
+    `max_concurrent_updates` slots, so a busy chat doesn't hold up the others. At most
+    `max_pending` updates are admitted at once, running or waiting for their chat, and
+    at most `max_queue_per_key` per chat; the updates of a chat beyond that are dropped.
+
+    Args:
+        max_concurrent_updates: The maximum number of updates processed at the same time.
+        max_pending: The maximum number of updates admitted, defaults to four times
+            `max_concurrent_updates`.
+        max_queue_per_key: The maximum number of updates admitted for one chat.
+    """
+
+    def __init__(
+        self,
+        max_concurrent_updates: int,
+        max_pending: Optional[int] = None,
+        max_queue_per_key: int = 100,
+    ) -> None:
+        # The semaphore of the base class bounds the admitted updates, `_running` the
+        # ones that are processed.
+        max_pending = max_pending or 4 * max_concurrent_updates
+        self._max_running = max_concurrent_updates
+        super().__init__(max_pending)
+        # The base class sizes it with `max_concurrent_updates`, which is overridden.
+        self._semaphore = asyncio.BoundedSemaphore(max_pending)
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self.max_queue_per_key = max_queue_per_key
+        # key -> [the lock taken in turn by the updates of the key, number of updates]
+        self._keys: Dict[Hashable, List[Any]] = {}
+        self.in_flight = 0
+        self.waiting = 0
+        self.dropped = 0
+        # Called with every update once it was processed or dropped.
+        self.done_listeners: List[Callable[[object], Any]] = []
+
+    @property
+    def max_concurrent_updates(self) -> int:
+        return self._max_running
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "keys": len(self._keys),
+            "dropped": self.dropped,
+            "max_concurrent": self._max_running,
+        }
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        try:
+            await self._process(update, coroutine)
+        finally:
+            for listener in self.done_listeners:
+                listener(update)
+
+    async def _process(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = update_key(update)
+        if key is None:
+            await self._run(coroutine)
+            return
+
+        entry = self._keys.get(key)
+        if entry is None:
+            entry = self._keys[key] = [asyncio.Lock(), 0]
+        elif entry[1] >= self.max_queue_per_key:
+            self.dropped += 1
+            logger.warning("Dropping an update of %s, %s are already queued.", key, entry[1])
+            coroutine.close()
+            return
+
+        entry[1] += 1
+        try:
+            self.waiting += 1
+            try:
+                # The lock is handed over in the order the updates started waiting.
+                await entry[0].acquire()
+            finally:
+                self.waiting -= 1
+            try:
+                await self._run(coroutine)
+            finally:
+                entry[0].release()
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._keys[key]
+
+    async def _run(self, coroutine: Awaitable[Any]) -> None:
+        async with self._running:
+            self.in_flight += 1
+            try:
+                await coroutine
+            finally:
+                self.in_flight -= 1
@@ -0,0 +1,272 @@
+"""This module contains the scheduler of the outgoing Bot API requests."""
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from logging import getLogger
+from typing import Any, Callable, Coroutine, Dict, Iterable, List, Optional, Tuple, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from bot.cache import LRUCache
+from bot.constants import Priority
+
+logger = getLogger(__name__)
+
+RATE_LIMITED_PREFIXES = ("send", "forward", "copy", "edit")
+"""The endpoints that count against the Telegram flood limits, other calls aren't paced."""
+
+
+class TokenBucket:
+    """A token bucket holding up to `capacity` tokens, refilled with `rate` tokens per second."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, tokens: int = 1) -> float:
+        """Return the number of seconds until `tokens` tokens are available."""
+        self._refill()
+        return 0.0 if self.tokens >= tokens else (tokens - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self._refill()
+        self.tokens -= 1
+
+    def time_to_full(self) -> float:
+        """Return the number of seconds until the bucket is full again, if left alone."""
+        return (self.capacity - self.tokens) / self.rate + (self.updated - time.monotonic())
+
+
+class BucketQueue:
+    """Hands out the tokens of a :class:`TokenBucket` to the waiting requests, by
+    priority and in arrival order within a priority.
+
+    Args:
+        bucket: The bucket.
+        paused_until: Returns the :func:`time.monotonic` time before which no token is
+            handed out, e.g. after a flood error.
+    """
+
+    __slots__ = ("bucket", "paused_until", "_waiters", "_sequence", "_dispatcher")
+
+    def __init__(
+        self, bucket: TokenBucket, paused_until: Callable[[], float] = lambda: 0.0
+    ) -> None:
+        self.bucket = bucket
+        self.paused_until = paused_until
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._waiters)
+
+    def delay(self) -> float:
+        """Return how long a request arriving now would wait, behind the waiting ones."""
+        return max(
+            self.bucket.delay(len(self._waiters) + 1), self.paused_until() - time.monotonic()
+        )
+
+    async def acquire(self, priority: int) -> None:
+        """Wait for a token."""
+        if (
+            not self._waiters
+            and self.paused_until() <= time.monotonic()
+            and not self.bucket.delay()
+        ):
+            self.bucket.take()
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+
+    async def _dispatch(self) -> None:
+        while self._waiters:
+            delay = max(self.bucket.delay(), self.paused_until() - time.monotonic())
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.bucket.take()
+                future.set_result(None)
+
+    def close(self) -> None:
+        """Stop handing out tokens and cancel the waiting requests."""
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+        for _, _, future in self._waiters:
+            future.cancel()
+        self._waiters.clear()
+
+
+class PriorityRateLimiter(BaseRateLimiter[int]):
+    """Paces the outgoing requests to stay within the Telegram flood limits.
+
+    Requests wait for their chat bucket first and then for the global bucket. Both are
+    served by :class:`bot.constants.Priority` and in arrival order within a priority.
+    A request that would wait longer than `max_chat_delay` for its chat fails at once
+    with :exc:`telegram.error.RetryAfter`, unless it has the admin priority, so a flood
+    of messages to one chat can't pile up without bound.
+    On :exc:`telegram.error.RetryAfter` from Telegram all requests are paused for the
+    requested time and the failed request is retried.
+
+    In a sharded deployment every worker has its own limiter, so the overall rate and
+    the rate of the `shared_chats`, which receive messages from every worker such as the
+    admin chats, are divided by the number of `shards`.
+
+    Args:
+        overall_rate: The number of requests per second for the whole bot.
+        private_chat_rate: The number of requests per second to a single private chat.
+        group_chat_rate: The number of requests per minute to a single group.
+        max_retries: How often a request is retried after a :exc:`RetryAfter`.
+        shards: The number of processes sending requests with the same token.
+        shared_chats: The chats every process sends to.
+        max_chat_delay: The longest a request waits for its chat, in seconds.
+    """
+
+    def __init__(
+        self,
+        overall_rate: float = 30,
+        private_chat_rate: float = 1,
+        group_chat_rate: float = 20,
+        max_retries: int = 3,
+        shards: int = 1,
+        shared_chats: Iterable[int] = (),
+        max_chat_delay: float = 60,
+    ) -> None:
+        self.private_chat_rate = private_chat_rate
+        self.group_chat_rate = group_chat_rate / 60
+        self.max_retries = max_retries
+        self.shards = shards
+        self.shared_chats = set(shared_chats)
+        self.max_chat_delay = max_chat_delay
+        overall_rate /= shards
+        self._queue = BucketQueue(
+            TokenBucket(overall_rate, overall_rate), lambda: self._paused_until
+        )
+        # A queue is kept until its bucket is full again, forgetting it then changes nothing.
+        self._chat_queues: LRUCache[BucketQueue] = LRUCache(maxsize=10000)
+        self._paused_until = 0.0
+        self._chat_waiting = 0
+        self.requests: Dict[Priority, int] = {priority: 0 for priority in Priority}
+        self.wait_time: Dict[Priority, float] = {priority: 0.0 for priority in Priority}
+        self.max_wait_time: Dict[Priority, float] = {priority: 0.0 for priority in Priority}
+        self.retries = 0
+        self.rejected = 0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        self._queue.close()
+        for queue in self._chat_queues.values():
+            queue.close()
+
+    @property
+    def queue_depth(self) -> int:
+        """The number of requests waiting to be sent."""
+        return len(self._queue) + self._chat_waiting
+
+    def stats(self) -> Dict[str, float]:
+        stats: Dict[str, float] = {
+            "queue_depth": self.queue_depth,
+            "retries": self.retries,
+            "rejected": self.rejected,
+        }
+        for priority in Priority:
+            requests = self.requests[priority]
+            name = priority.name.lower()
+            stats[f"{name}_requests"] = requests
+            stats[f"{name}_avg_wait_ms"] = (
+                self.wait_time[priority] / requests * 1000 if requests else 0.0
+            )
+            stats[f"{name}_max_wait_ms"] = self.max_wait_time[priority] * 1000
+        return stats
+
+    def _chat_queue(self, chat_id: Union[int, str]) -> BucketQueue:
+        queue = self._chat_queues.get(chat_id)
+        if queue is None:
+            # Usernames (@channel) and negative ids are groups and channels.
+            private = isinstance(chat_id, int) and chat_id > 0
+            rate = self.private_chat_rate if private else self.group_chat_rate
+            if chat_id in self.shared_chats:
+                rate /= self.shards
+            queue = BucketQueue(TokenBucket(rate, 1 if private else 3))
+        return queue
+
+    async def _acquire_chat(self, chat_id: Union[int, str], priority: Priority) -> None:
+        queue = self._chat_queue(chat_id)
+        if priority != Priority.ADMIN:
+            delay = queue.delay()
+            if delay > self.max_chat_delay:
+                self.rejected += 1
+                raise RetryAfter(math.ceil(delay))
+        # The queue must outlive the requests waiting in it.
+        bucket = queue.bucket
+        self._chat_queues.set(
+            chat_id, queue, ttl=bucket.time_to_full() + (len(queue) + 1) / bucket.rate
+        )
+        self._chat_waiting += 1
+        try:
+            await queue.acquire(priority)
+        finally:
+            self._chat_waiting -= 1
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict, List[Dict]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> Union[bool, Dict, List[Dict]]:
+        if not endpoint.startswith(RATE_LIMITED_PREFIXES):
+            return await callback(*args, **kwargs)
+
+        priority = Priority(rate_limit_args or Priority.NORMAL)
+        chat_id = data.get("chat_id")
+        started = time.monotonic()
+
+        if chat_id is not None:
+            await self._acquire_chat(chat_id, priority)
+
+        for retry in range(self.max_retries + 1):
+            await self._queue.acquire(priority)
+            if retry == 0:
+                waited = time.monotonic() - started
+                self.requests[priority] += 1
+                self.wait_time[priority] += waited
+                self.max_wait_time[priority] = max(self.max_wait_time[priority], waited)
+
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as exception:
+                if retry == self.max_retries:
+                    raise
+                self.retries += 1
+                logger.warning(
+                    "Rate limit hit on %s, pausing for %s seconds.",
+                    endpoint,
+                    exception.retry_after,
+                )
+                self._paused_until = max(
+                    self._paused_until, time.monotonic() + exception.retry_after
+                )
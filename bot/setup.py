@@ -1,7 +1,10 @@
 """The module contains functions that register the handlers."""
+import functools
 import os
+from typing import List
 
-from telegram import BotCommandScopeAllPrivateChats
+from telegram import BotCommandScopeAllPrivateChats, Update
+from telegram.constants import UpdateType
 from telegram.ext import (
     Application, 
     CommandHandler,
@@ -10,51 +13,226 @@ from telegram.ext import (
     filters,
 )
 
-from bot.errorhandler import error_handler
-from bot.admintools import bans, list_ban, stats, unban
-from bot.callbacks import back, handle, info, start, reply
+from bot.activity import ActivityWriter
+from bot.analytics import Analytics
+from bot.archive import Archive
+from bot.cache import AsyncLRUCache
+from bot.errorhandler import ErrorReporter, error_handler
+from bot.floodcontrol import FloodControl
+from bot.metrics import instrument_handlers, serve_metrics
+from bot.admintools import (
+    analytics,
+    bans,
+    broadcast,
+    delete_template,
+    history,
+    history_page,
+    list_ban,
+    list_ban_page,
+    list_templates,
+    perf,
+    save_template,
+    stats,
+    status,
+    unban,
+    use_template,
+)
+from bot.admins import AdminRouter
+from bot.albums import AlbumCollector
+from bot.broadcast import Broadcaster
+from bot.callbacks import back, flood_control, forward_album, handle, info, start, reply
+from bot.models import Database
+from bot.templates import TemplateStore
+from bot.userstate import UserStates
 
 
-async def setup_application(application: Application) -> None:
+HANDLER_UPDATE_TYPES = {
+    CallbackQueryHandler: [UpdateType.CALLBACK_QUERY],
+    CommandHandler: [UpdateType.MESSAGE],
+    MessageHandler: [UpdateType.MESSAGE],
+}
+"""The update types each kind of handler is registered for."""
+
+
+def register_handlers(application: Application) -> None:
     """
-    Registers the different handlers, and etc.
+    Registers the different handlers.
+
+    This runs before the application starts, so that :func:`allowed_updates` can be
+    computed from the registered handlers.
 
     Args:
         application: The application.
     """
-    admin_id = int(os.environ.get("ADMINS"))
-    
+    admins = application.bot_data["admins"] = AdminRouter.from_env()
+    admin_chats = admins.chats
+    application.bot_data["states"] = UserStates.from_env()
+
+    # Flood control runs first and stops the processing of the dropped messages.
+    application.bot_data["flood"] = FloodControl.from_env()
+    application.add_handler(
+        MessageHandler(filters.ALL & filters.ChatType.PRIVATE & ~admins.users, flood_control),
+        group=-1,
+    )
     application.add_handler(
         CommandHandler(
             ["start", "info", "help"], info, filters=filters.ChatType.PRIVATE
         )
     )
     # Commands that are only for bot admins.
-    application.add_handler(CommandHandler("ban", bans, filters=(filters.ChatType.PRIVATE & filters.User(admin_id))))
-    application.add_handler(CommandHandler("unban", unban, filters=(filters.ChatType.PRIVATE & filters.User(admin_id))))
-    application.add_handler(CommandHandler("listBanned", list_ban,  filters=(filters.ChatType.PRIVATE & filters.User(admin_id))))
-    application.add_handler(CommandHandler("subs", stats, filters.User(admin_id)))
+    application.add_handler(CommandHandler("ban", bans, filters=admin_chats))
+    application.add_handler(CommandHandler("unban", unban, filters=admin_chats))
+    application.add_handler(CommandHandler("listBanned", list_ban, filters=admin_chats))
+    application.add_handler(CommandHandler("subs", stats, filters=admin_chats))
+    application.add_handler(CommandHandler("status", status, filters=admin_chats))
+    application.add_handler(CommandHandler("perf", perf, filters=admin_chats))
+    application.add_handler(CommandHandler("analytics", analytics, filters=admin_chats))
+    application.add_handler(CommandHandler("history", history, filters=admin_chats))
+    application.add_handler(CommandHandler("broadcast", broadcast, filters=admin_chats))
+    application.add_handler(CommandHandler("save", save_template, filters=admin_chats))
+    application.add_handler(CommandHandler("use", use_template, filters=admin_chats))
+    application.add_handler(CommandHandler("templates", list_templates, filters=admin_chats))
+    application.add_handler(CommandHandler("deltemplate", delete_template, filters=admin_chats))
     # telegram.ext.CallbackQueryHandler
     application.add_handler(CallbackQueryHandler(start, pattern="start-message"))
     application.add_handler(CallbackQueryHandler(back, pattern="back-start"))
+    application.add_handler(CallbackQueryHandler(list_ban_page, pattern=r"^banlist:"))
+    application.add_handler(CallbackQueryHandler(history_page, pattern=r"^history:"))
     # telegram.ext.MessageHandler
-    application.add_handler(MessageHandler(filters.ALL & filters.ChatType.PRIVATE & ~filters.User(admin_id), handle))
+    application.add_handler(MessageHandler(filters.ALL & filters.ChatType.PRIVATE & ~admins.users, handle))
+    # The reply blocks, so the update processor keeps the replies of a chat in order.
     application.add_handler(
         MessageHandler(
             filters.ALL
-            & filters.ChatType.PRIVATE
-            & filters.User(admin_id)
+            & admins.replies
             & ~filters.COMMAND,
             reply,
-            block=False,
         ),
         group=1
     )
+    # Error handler, it only waits for the reports it sends so it doesn't block updates.
+    application.bot_data["errors"] = ErrorReporter.from_env()
+    application.add_error_handler(error_handler, block=False)
+    instrument_handlers(application)
+
+
+def allowed_updates(application: Application) -> List[str]:
+    """
+    Returns the update types the registered handlers can handle, so that Telegram
+    doesn't send us any other update.
+
+    Args:
+        application: The application.
+    """
+    update_types = set()
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            for handler_type, types in HANDLER_UPDATE_TYPES.items():
+                if isinstance(handler, handler_type):
+                    update_types.update(types)
+                    break
+            else:
+                # We don't know what this handler needs, so don't filter anything.
+                return Update.ALL_TYPES
+    return sorted(update_types)
+
+
+async def setup_application(application: Application) -> None:
+    """
+    Acquires the shared resources used by the handlers, and etc.
+
+    Args:
+        application: The application.
+    """
+    # One pooled client for the whole process, handlers reach it through `bot_data`.
+    # A database that is already there, such as the stand-in of `tools/benchmark.py`,
+    # is used as is.
+    database = application.bot_data.get("database")
+    if database is None:
+        database = application.bot_data["database"] = Database.shared()
+    await database.start()
+    # The mutes are kept by the worker of the user, which may not be this one.
+    database.unban_listeners.append(application.bot_data["flood"].forget)
+    application.bot_data["chat_cache"] = AsyncLRUCache(
+        application.bot.get_chat,
+        maxsize=int(os.environ.get("CHAT_CACHE_SIZE", 10000)),
+        ttl=float(os.environ.get("CHAT_CACHE_TTL", 300)),
+    )
+    await application.bot_data["admins"].start(application.bot, database)
+    application.bot_data["templates"] = TemplateStore(database)
+    application.bot_data["albums"] = AlbumCollector(
+        application,
+        functools.partial(
+            forward_album, application.bot, database, application.bot_data["admins"]
+        ),
+        delay=float(os.environ.get("ALBUM_DELAY", 1.0)),
+    )
+    broadcaster = application.bot_data["broadcaster"] = Broadcaster(
+        application.bot,
+        database,
+        concurrency=int(os.environ.get("BROADCAST_CONCURRENCY", 10)),
+    )
+    # In a sharded deployment the first worker resumes the broadcast for everyone.
+    if int(os.environ.get("SHARD_INDEX", 0)) == 0:
+        await broadcaster.resume()
+    application.bot_data["states"].start(database)
+    usage = application.bot_data["analytics"] = Analytics.from_env(database)
+    usage.start()
+    activity = application.bot_data["activity"] = ActivityWriter.from_env(database, usage)
+    activity.start()
+    application.bot_data["archive"] = Archive.from_env(database)
+    application.bot_data["archive"].start()
+    application.bot_data["errors"].start(application.bot)
+    if os.environ.get("METRICS_PORT"):
+        # Prometheus scrapes `GET /metrics`, nothing is computed in between.
+        application.bot_data["metrics_server"] = await serve_metrics(
+            application,
+            os.environ.get("METRICS_LISTEN", "0.0.0.0"),
+            int(os.environ["METRICS_PORT"]),
+        )
 
     base_commands = [("start", "Display general information.")]
     await application.bot.set_my_commands(
         commands=base_commands,
         scope=BotCommandScopeAllPrivateChats()
     )
-    # Error handler
-    application.add_error_handler(error_handler)
+
+
+async def stop_application(application: Application) -> None:
+    """
+    Stops the background senders while the bot can still send requests.
+
+    Args:
+        application: The application.
+    """
+    broadcaster = application.bot_data.get("broadcaster")
+    if broadcaster is not None:
+        broadcaster.stop()
+    application.bot_data["errors"].stop()
+    # Written while the database is still open, it's closed in `shutdown_application`.
+    await application.bot_data["states"].stop()
+    activity = application.bot_data.get("activity")
+    if activity is not None:
+        await activity.stop()
+    archive = application.bot_data.get("archive")
+    if archive is not None:
+        await archive.stop()
+    # After the activity, whose last write adds to the counts.
+    usage = application.bot_data.get("analytics")
+    if usage is not None:
+        await usage.stop()
+    metrics_server = application.bot_data.pop("metrics_server", None)
+    if metrics_server is not None:
+        metrics_server.close()
+
+
+async def shutdown_application(application: Application) -> None:
+    """
+    Releases the resources acquired in :func:`setup_application`.
+
+    Args:
+        application: The application.
+    """
+    database = application.bot_data.pop("database", None)
+    if database is not None:
+        database.close()
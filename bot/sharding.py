@@ -0,0 +1,349 @@
+"""This module contains the sharded deployment of the bot.
+
+A front process receives the updates, by polling or with a webhook, and hands each one
+to the worker that owns its user, chosen by consistent hashing. The workers run the
+usual application. They are started by the front and fed through process queues, or
+run on their own (``MODE=worker``) and fed through a queue collection in Mongo.
+Because every update of a user goes to the same worker, the state kept in memory per
+user (flood control, albums, ...) stays correct; the conversation state is stored
+in Mongo by :class:`bot.userstate.UserStates` so it survives a change of the shards.
+"""
+import asyncio
+import bisect
+import hashlib
+import multiprocessing
+import queue
+import signal
+import time
+from logging import getLogger
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pymongo.errors import PyMongoError
+from telegram import Update
+from telegram.ext import Application, Updater
+
+from bot.models import Database
+
+logger = getLogger(__name__)
+
+BATCH_SIZE = 100
+"""The maximum number of updates handed over at once."""
+
+
+class HashRing:
+    """Maps keys to shards by consistent hashing, so changing the number of shards only
+    moves the keys of about one shard.
+
+    Args:
+        shards: The number of shards.
+        replicas: The number of points of each shard on the ring.
+    """
+
+    def __init__(self, shards: int, replicas: int = 100) -> None:
+        points = sorted(
+            (self._hash(f"{shard}:{replica}"), shard)
+            for shard in range(shards)
+            for replica in range(replicas)
+        )
+        self._hashes = [point[0] for point in points]
+        self._shards = [point[1] for point in points]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    def shard(self, key: int) -> int:
+        index = bisect.bisect(self._hashes, self._hash(str(key)))
+        return self._shards[index % len(self._shards)]
+
+
+def shard_key(update: Dict) -> int:
+    """Return the user of an update in its JSON form, or its chat if it has no user."""
+    for value in update.values():
+        if isinstance(value, dict):
+            user = value.get("from") or value.get("user")
+            if user:
+                return user["id"]
+            if value.get("chat"):
+                return value["chat"]["id"]
+    return update["update_id"]
+
+
+def stop_event() -> asyncio.Event:
+    """Return an event set by SIGINT and SIGTERM."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    return stop
+
+
+async def run_front(
+    application: Application,
+    start: Callable[[Updater], Awaitable[Any]],
+    push: Callable[[List[Tuple[int, Dict]]], Awaitable[Any]],
+    shards: int,
+) -> None:
+    """
+    Receive the updates and push them to their shard, until SIGINT or SIGTERM.
+
+    The handlers of the application aren't run, only its updater is used.
+
+    Args:
+        application: The application, whose updater fills its update queue.
+        start: Starts the updater, e.g. :meth:`telegram.ext.Updater.start_polling`.
+        push: Hands over a batch of ``(shard, update)`` pairs, in order.
+        shards: The number of shards.
+    """
+    ring = HashRing(shards)
+    updater = application.updater
+    stop = stop_event()
+    async with updater:
+        await start(updater)
+        logger.info("Routing the updates to %s shards.", shards)
+        while not stop.is_set():
+            getter = asyncio.ensure_future(application.update_queue.get())
+            stopper = asyncio.ensure_future(stop.wait())
+            await asyncio.wait((getter, stopper), return_when=asyncio.FIRST_COMPLETED)
+            stopper.cancel()
+            if not getter.done():
+                getter.cancel()
+                break
+            updates = [getter.result()]
+            while len(updates) < BATCH_SIZE and not application.update_queue.empty():
+                updates.append(application.update_queue.get_nowait())
+            batch = []
+            for update in updates:
+                data = update.to_dict()
+                batch.append((ring.shard(shard_key(data)), data))
+            await push(batch)
+        await updater.stop()
+
+
+class LocalShards:
+    """Worker processes started by the front, each fed through its own process queue.
+
+    Args:
+        target: The function run by a worker, called with its index and its queue.
+        shards: The number of workers.
+        maxsize: The number of updates a queue holds before the front waits.
+    """
+
+    def __init__(
+        self,
+        target: Callable[[int, "multiprocessing.Queue[Optional[Dict]]"], None],
+        shards: int,
+        maxsize: int = 1000,
+    ) -> None:
+        context = multiprocessing.get_context("spawn")
+        self.queues = [context.Queue(maxsize) for _ in range(shards)]
+        self.processes = [
+            context.Process(target=target, args=(index, self.queues[index]), name=f"worker-{index}")
+            for index in range(shards)
+        ]
+
+    def start(self) -> None:
+        for process in self.processes:
+            process.start()
+
+    async def push(self, batch: List[Tuple[int, Dict]]) -> None:
+        loop = asyncio.get_running_loop()
+        for shard, update in batch:
+            try:
+                self.queues[shard].put_nowait(update)
+            except queue.Full:
+                # Waiting here holds back all the later updates, so the order is kept.
+                await loop.run_in_executor(None, self.queues[shard].put, update)
+
+    def stop(self, timeout: float = 60) -> None:
+        """Let the workers process what they were handed and wait for them to exit, the
+        workers still running after `timeout` seconds are terminated."""
+        deadline = time.monotonic() + timeout
+        for shard_queue, process in zip(self.queues, self.processes):
+            # The queue of a worker that died stays full.
+            while process.is_alive() and time.monotonic() < deadline:
+                try:
+                    shard_queue.put(None, timeout=1.0)
+                    break
+                except queue.Full:
+                    continue
+        for process in self.processes:
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logger.warning("Terminating %s, it didn't stop in time.", process.name)
+                process.terminate()
+                process.join()
+
+
+class MongoShards:
+    """Pushes the updates to the queue collection read by the workers started with
+    ``MODE=worker``, possibly on other machines."""
+
+    def __init__(self, database: Database) -> None:
+        self.database = database
+
+    async def push(self, batch: List[Tuple[int, Dict]]) -> None:
+        await self.database.push_updates(batch)
+
+
+async def serve_worker(
+    application: Application,
+    take: Callable[[asyncio.Event], Awaitable[Optional[List[Dict]]]],
+    finish: Optional[Callable[[], Awaitable[Any]]] = None,
+) -> None:
+    """
+    Run the application on the updates returned by `take`, until it returns :obj:`None`,
+    which it does after SIGINT or SIGTERM.
+
+    Args:
+        application: The application, set up and torn down like ``run_polling`` does.
+        take: Returns the next batch of updates, in their JSON form.
+        finish: Called once the application processed the updates it was handed, while
+            the database is still open, e.g. :meth:`MongoTaker.ack`.
+    """
+    stop = stop_event()
+    await application.initialize()
+    if application.post_init is not None:
+        await application.post_init(application)
+    await application.start()
+    try:
+        while True:
+            updates = await take(stop)
+            if updates is None:
+                break
+            for data in updates:
+                await application.update_queue.put(Update.de_json(data, application.bot))
+    finally:
+        # Processes the updates that are still queued.
+        await application.stop()
+        if finish is not None:
+            await finish()
+        if application.post_stop is not None:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown is not None:
+            await application.post_shutdown(application)
+
+
+def take_local(shard_queue: "multiprocessing.Queue[Optional[Dict]]"):
+    """Return the `take` of :func:`serve_worker` for a worker of :class:`LocalShards`."""
+    ended = False
+
+    async def take(stop: asyncio.Event) -> Optional[List[Dict]]:
+        nonlocal ended
+        loop = asyncio.get_running_loop()
+        while not stop.is_set() and not ended:
+            try:
+                update = await loop.run_in_executor(None, shard_queue.get, True, 1.0)
+            except queue.Empty:
+                continue
+            if update is None:
+                return None
+            updates = [update]
+            while len(updates) < BATCH_SIZE:
+                try:
+                    update = shard_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if update is None:
+                    # Process what came before the end, then stop.
+                    ended = True
+                    break
+                updates.append(update)
+            return updates
+        return None
+
+    return take
+
+
+class MongoTaker:
+    """The `take` of :func:`serve_worker` for a worker of :class:`MongoShards`.
+
+    An update is removed from the queue once it was processed, so the updates of a
+    worker that died are processed again by its replacement. The updates are acked one
+    by one as they complete, reported by the ``done_listeners`` of the
+    :class:`bot.processor.KeyedUpdateProcessor`, and new ones are fetched as long as
+    fewer than `max_unacked` are in progress, so a slow update only holds up its own
+    chat. The processed updates are removed in bulk by each call, and by :meth:`ack`
+    when the worker stops.
+
+    Args:
+        application: The application of the worker.
+        database: The database holding the queue.
+        shard: The shard of the worker.
+        max_delay: The longest pause between two polls of an empty queue.
+        max_unacked: The maximum number of updates handed over and not processed yet.
+    """
+
+    def __init__(
+        self,
+        application: Application,
+        database: Database,
+        shard: int,
+        max_delay: float = 0.5,
+        max_unacked: int = 1000,
+    ) -> None:
+        self.application = application
+        self.database = database
+        self.shard = shard
+        self.max_delay = max_delay
+        self.max_unacked = max_unacked
+        # update id -> queue id, of the updates handed over and not processed yet
+        self.unacked: Dict[int, Any] = {}
+        # The queue ids of the processed updates, not removed yet.
+        self.processed: List[Any] = []
+        self._last_id: Optional[Any] = None
+        self._progress = asyncio.Event()
+        application.update_processor.done_listeners.append(self._done)
+
+    def _done(self, update: object) -> None:
+        if isinstance(update, Update):
+            queue_id = self.unacked.pop(update.update_id, None)
+            if queue_id is not None:
+                self.processed.append(queue_id)
+                self._progress.set()
+
+    async def ack(self) -> None:
+        """Remove the processed updates from the queue."""
+        if not self.processed:
+            return
+        processed, self.processed = self.processed, []
+        try:
+            await self.database.ack_updates(processed)
+        except PyMongoError as exception:
+            # At worst they are processed again after a restart.
+            logger.warning("Couldn't ack %s updates: %s", len(processed), exception)
+            self.processed.extend(processed)
+
+    async def __call__(self, stop: asyncio.Event) -> Optional[List[Dict]]:
+        delay = 0.01
+        while not stop.is_set():
+            await self.ack()
+            room = self.max_unacked - len(self.unacked)
+            if room <= 0:
+                self._progress.clear()
+                await first_of(self._progress, stop)
+                continue
+            documents = await self.database.take_updates(
+                self.shard, min(room, BATCH_SIZE), after=self._last_id
+            )
+            if documents:
+                self._last_id = documents[-1]["_id"]
+                for document in documents:
+                    self.unacked[document["update"]["update_id"]] = document["_id"]
+                return [document["update"] for document in documents]
+            try:
+                await asyncio.wait_for(stop.wait(), delay)
+            except asyncio.TimeoutError:
+                delay = min(delay * 2, self.max_delay)
+        return None
+
+
+async def first_of(*events: asyncio.Event) -> None:
+    """Wait until one of the events is set."""
+    waiters = [asyncio.ensure_future(event.wait()) for event in events]
+    try:
+        await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for waiter in waiters:
+            waiter.cancel()
@@ -0,0 +1,105 @@
+"""This module contains the reply templates saved by the admins."""
+from typing import List, NamedTuple, Optional, Tuple, Union
+
+from telegram import Bot, InlineKeyboardMarkup, Message
+
+from bot.cache import AsyncLRUCache
+from bot.constants import MessageType
+from bot.helpers import (
+    SEND_METHODS,
+    build_markup,
+    button_parser,
+    message_content,
+    send_content,
+)
+from bot.models import Database
+
+
+class Template(NamedTuple):
+    """A saved reply, with its ``buttonurl:`` markup already parsed."""
+
+    name: str
+    content: Tuple[Optional[str], Optional[MessageType], str]
+    text: str
+    reply_markup: Optional[InlineKeyboardMarkup]
+    from_chat_id: int
+    message_id: int
+
+
+def compile_template(document: dict) -> Template:
+    """Parse a template stored by :meth:`TemplateStore.save`."""
+    text, buttons = button_parser(document["text"])
+    try:
+        message_type = MessageType(document["type"])
+    except ValueError:
+        message_type = None
+    return Template(
+        name=document["name"],
+        content=(document["text"], message_type, document["file_id"]),
+        text=text,
+        reply_markup=build_markup(buttons),
+        from_chat_id=document["from_chat_id"],
+        message_id=document["message_id"],
+    )
+
+
+class TemplateStore:
+    """The templates saved in the database, the compiled templates are cached and
+    invalidated when a template is saved again or deleted.
+
+    Args:
+        database: The database.
+        maxsize: The number of templates kept compiled.
+        ttl: The number of seconds a compiled template is kept, this bounds how long
+            another bot instance can use an outdated template.
+    """
+
+    def __init__(self, database: Database, maxsize: int = 256, ttl: float = 300) -> None:
+        self.database = database
+        self.cache: AsyncLRUCache[Optional[Template]] = AsyncLRUCache(
+            self._load, maxsize=maxsize, ttl=ttl
+        )
+
+    async def _load(self, name: str) -> Optional[Template]:
+        document = await self.database.get_template(name)
+        return compile_template(document) if document else None
+
+    async def get(self, name: str) -> Optional[Template]:
+        return await self.cache.load(name)
+
+    async def names(self) -> List[str]:
+        return await self.database.get_template_names()
+
+    async def save(self, name: str, message: Message) -> None:
+        """Save the message as the template `name`, replacing the previous one."""
+        content = message_content(message)
+        await self.database.save_template(
+            {
+                "name": name,
+                "type": str(content[1]),
+                "file_id": content[2],
+                "text": content[0] or "",
+                "from_chat_id": message.chat_id,
+                "message_id": message.message_id,
+            }
+        )
+        self.cache.pop(name)
+
+    async def delete(self, name: str) -> bool:
+        """Delete the template `name`, returns whether it existed."""
+        self.cache.pop(name)
+        return await self.database.delete_template(name)
+
+    @staticmethod
+    async def send(
+        bot: Bot, chat_id: Union[int, str], template: Template, **kwargs
+    ) -> Message:
+        """Send the template, the keyword arguments are passed on to the bot method."""
+        if template.content[1] not in SEND_METHODS:
+            # Messages that can't be rebuilt, such as polls, are copied from the original.
+            return await bot.copy_message(
+                chat_id, template.from_chat_id, template.message_id, **kwargs
+            )
+        return await send_content(
+            bot, chat_id, template.content, template.text, template.reply_markup, **kwargs
+        )
@@ -0,0 +1,263 @@
+"""This module contains the store of the conversation state of the users."""
+import asyncio
+import os
+import time
+from array import array
+from logging import getLogger
+from typing import Dict, Optional
+
+from pymongo.errors import PyMongoError
+
+from bot.constants import UserState
+from bot.models import Database
+
+logger = getLogger(__name__)
+
+_EMPTY = 0
+_DELETED = -1
+_STATES = list(UserState)
+_CODES = {state: code for code, state in enumerate(_STATES)}
+
+
+class UserStates:
+    """Maps the users to their :class:`bot.constants.UserState`, in a few bytes per user.
+
+    The users are kept in an open addressing table of three arrays: the user ids, a
+    byte for the state and the second of the last access, about 13 bytes per slot
+    instead of a dict per user. The users that weren't seen for `idle_ttl` seconds are
+    evicted, a slice of the table at a time, and the table shrinks when it's mostly
+    empty, so the memory follows the number of recently active users.
+
+    A user is only evicted when their state can be found again. With a database, the
+    state of a user is loaded the first time it's needed, and the changes are kept, the
+    latest per user, and written every `flush_interval` seconds with a single
+    ``bulk_write``; a user is evicted once their change was written. Without one, only
+    the idle users are evicted, as an unknown user is idle.
+
+    The store takes the place of a :class:`telegram.ext.BasePersistence`, which persists
+    the ``user_data`` of the application: a dict per user that is never shrunk.
+
+    Args:
+        idle_ttl: The number of seconds a user is kept after their last access.
+        flush_interval: The number of seconds between two writes of the changes, and
+            between two slices of the eviction.
+        persistent: Whether the states are stored in the database given to :meth:`start`.
+        min_capacity: The number of slots the table doesn't shrink below.
+    """
+
+    def __init__(
+        self,
+        idle_ttl: float = 7 * 86400,
+        flush_interval: float = 10,
+        persistent: bool = True,
+        min_capacity: int = 1024,
+    ) -> None:
+        self.idle_ttl = idle_ttl
+        self.flush_interval = flush_interval
+        self.persistent = persistent
+        self.min_capacity = min_capacity
+        self.database: Optional[Database] = None
+        self._epoch = time.monotonic()
+        self._allocate(min_capacity)
+        # user id -> the state to write
+        self.dirty: Dict[int, UserState] = {}
+        self.evicted = 0
+        self.loads = 0
+        self.flushes = 0
+        self.written = 0
+        self._sweep_from = 0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls) -> "UserStates":
+        """Create the store from ``STATE_IDLE_TTL``, ``PERSISTENCE_INTERVAL`` and
+        ``PERSISTENCE``; the states are stored in Mongo unless it's ``memory``."""
+        return cls(
+            idle_ttl=float(os.environ.get("STATE_IDLE_TTL", 7 * 86400)),
+            flush_interval=float(os.environ.get("PERSISTENCE_INTERVAL", 10)),
+            persistent=os.environ.get("PERSISTENCE", "mongo") != "memory",
+        )
+
+    def _allocate(self, capacity: int) -> None:
+        self._keys = array("q", bytes(8 * capacity))
+        self._states = array("B", bytes(capacity))
+        self._seen = array("I", bytes(4 * capacity))
+        self._mask = capacity - 1
+        self._size = 0
+        # Live and deleted slots, both make the probes longer.
+        self._used = 0
+
+    def _now(self) -> int:
+        return int(time.monotonic() - self._epoch)
+
+    def _find(self, user_id: int) -> int:
+        keys = self._keys
+        index = (user_id * 0x9E3779B97F4A7C15 >> 17) & self._mask
+        while True:
+            key = keys[index]
+            if key == user_id:
+                return index
+            if key == _EMPTY:
+                return -1
+            index = (index + 1) & self._mask
+
+    def _insert(self, user_id: int, code: int, seen: int) -> None:
+        if (self._used + 1) * 10 > len(self._keys) * 7:
+            self._resize(max(self.min_capacity, 2 * (self._size + 1)))
+        keys = self._keys
+        index = (user_id * 0x9E3779B97F4A7C15 >> 17) & self._mask
+        while keys[index] > 0:
+            index = (index + 1) & self._mask
+        if keys[index] == _EMPTY:
+            self._used += 1
+        keys[index] = user_id
+        self._states[index] = code
+        self._seen[index] = seen
+        self._size += 1
+
+    def _resize(self, entries: int) -> None:
+        capacity = self.min_capacity
+        while capacity * 7 < entries * 10:
+            capacity *= 2
+        keys, states, seen = self._keys, self._states, self._seen
+        self._allocate(capacity)
+        for index, key in enumerate(keys):
+            if key > 0:
+                self._insert(key, states[index], seen[index])
+        self._sweep_from = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, user_id: int) -> bool:
+        return self._find(user_id) >= 0
+
+    async def get(self, user_id: int) -> UserState:
+        """Return the state of the user, :attr:`UserState.IDLE` if it's unknown."""
+        index = self._find(user_id)
+        if index < 0:
+            state = UserState.IDLE
+            if self.persistent and self.database is not None:
+                data = await self.database.get_user_data(user_id)
+                self.loads += 1
+                # The state may have been set while it was loaded.
+                index = self._find(user_id)
+                if index >= 0:
+                    return _STATES[self._states[index]]
+                if data is not None and "state" in data:
+                    state = UserState(data["state"])
+            # Unknown users are kept too, so they are only looked up once.
+            self._insert(user_id, _CODES[state], self._now())
+            return state
+        self._seen[index] = self._now()
+        return _STATES[self._states[index]]
+
+    def set(self, user_id: int, state: UserState) -> None:
+        """Set the state of the user."""
+        index = self._find(user_id)
+        if index < 0:
+            self._insert(user_id, _CODES[state], self._now())
+        else:
+            self._states[index] = _CODES[state]
+            self._seen[index] = self._now()
+        if self.persistent:
+            self.dirty[user_id] = state
+
+    def sweep(self, slots: Optional[int] = None) -> int:
+        """
+        Evict the idle users from the next `slots` slots of the table.
+
+        Args:
+            slots: The number of slots to look at, the whole table by default.
+
+        Returns:
+            The number of users evicted.
+        """
+        capacity = len(self._keys)
+        start = self._sweep_from
+        end = min(capacity, start + (slots or capacity))
+        deadline = self._now() - self.idle_ttl
+        keys, states, seen, dirty = self._keys, self._states, self._seen, self.dirty
+        # Without a database, a user in a conversation would lose it.
+        idle = None if self.persistent else _CODES[UserState.IDLE]
+        evicted = 0
+        for index in range(start, end):
+            key = keys[index]
+            if (
+                key > 0
+                and seen[index] < deadline
+                and key not in dirty
+                and (idle is None or states[index] == idle)
+            ):
+                keys[index] = _DELETED
+                evicted += 1
+        self._size -= evicted
+        self.evicted += evicted
+        self._sweep_from = 0 if end >= capacity else end
+        if self._sweep_from == 0 and (
+            capacity > self.min_capacity and self._size * 4 < capacity
+            or (self._used - self._size) * 4 > capacity
+        ):
+            # Drops the deleted slots, and gives the memory back.
+            self._resize(2 * self._size)
+        return evicted
+
+    async def flush(self) -> None:
+        """Write the changes of the states to the database."""
+        async with self._lock:
+            if not self.dirty or self.database is None:
+                return
+            changes, self.dirty = self.dirty, {}
+            try:
+                await self.database.write_user_data(
+                    {user_id: {"state": state.value} for user_id, state in changes.items()}
+                )
+            except PyMongoError as exception:
+                logger.warning("Couldn't write the state of %s users: %s", len(changes), exception)
+                self._keep(changes)
+                return
+            except asyncio.CancelledError:
+                self._keep(changes)
+                raise
+            self.flushes += 1
+            self.written += len(changes)
+
+    def _keep(self, changes: Dict[int, UserState]) -> None:
+        # Retried with the next round, unless the user changed again since.
+        for user_id, state in changes.items():
+            self.dirty.setdefault(user_id, state)
+
+    def start(self, database: Database) -> None:
+        """Start writing the changes to `database` and evicting the idle users."""
+        self.database = database
+        self._task = asyncio.create_task(self._maintain())
+
+    async def stop(self) -> None:
+        """Stop the background task and write the remaining changes."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.persistent:
+            await self.flush()
+
+    async def _maintain(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if self.persistent:
+                await self.flush()
+            # A slice per round, so a large table doesn't hold up the updates.
+            self.sweep(65536)
+
+    def stats(self) -> Dict[str, float]:
+        capacity = len(self._keys)
+        return {
+            "resident": self._size,
+            "capacity": capacity,
+            "bytes": capacity * (self._keys.itemsize + self._states.itemsize + self._seen.itemsize),
+            "evicted": self.evicted,
+            "dirty": len(self.dirty),
+            "loads": self.loads,
+            "flushes": self.flushes,
+            "written": self.written,
+        }
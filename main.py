@@ -1,13 +1,35 @@
 """The script that runs the bot."""
-import functools
+import asyncio
+import multiprocessing
 import os
+import secrets
 from logging import basicConfig, getLogger, WARNING, INFO
+from typing import Dict, List, Optional
 
 from telegram.constants import ParseMode
-from telegram.ext import ApplicationBuilder, Defaults
-from telegram import Update
+from telegram.ext import Application, ApplicationBuilder, Defaults, Updater
+from telegram.request import BaseRequest
 
-from bot.setup import setup_application
+from bot.admins import AdminRouter
+from bot.metrics import InstrumentedRequest
+from bot.models import Database
+from bot.processor import KeyedUpdateProcessor
+from bot.ratelimiter import PriorityRateLimiter
+from bot.setup import (
+    allowed_updates,
+    register_handlers,
+    setup_application,
+    shutdown_application,
+    stop_application,
+)
+from bot.sharding import (
+    LocalShards,
+    MongoShards,
+    MongoTaker,
+    run_front,
+    serve_worker,
+    take_local,
+)
 
 # Enable logging
 basicConfig(
@@ -20,19 +42,153 @@ getLogger("httpx").setLevel(WARNING)
 logger = getLogger(__name__)
 
 
-def main() -> None:
-    """Start the bot."""
+def build_application(request: Optional[BaseRequest] = None) -> Application:
+    """
+    Build the application and register its handlers.
+
+    Args:
+        request: The request used for the Bot API calls other than ``getUpdates``, e.g.
+            the stand-in of `tools/benchmark.py`. Defaults to an
+            :class:`bot.metrics.InstrumentedRequest`.
+    """
     defaults = Defaults(parse_mode=ParseMode.HTML)
-    application = (
+    builder = (
         ApplicationBuilder()
         .token(os.environ.get("TOKEN"))
         .defaults(defaults)
         .post_init(setup_application)
-        .concurrent_updates(True)
-        .build()
+        .post_stop(stop_application)
+        .post_shutdown(shutdown_application)
+        .concurrent_updates(
+            KeyedUpdateProcessor(
+                int(os.environ.get("CONCURRENT_UPDATES", 256)),
+                max_queue_per_key=int(os.environ.get("UPDATE_QUEUE_PER_CHAT", 100)),
+            )
+        )
+        # Only the regular requests are timed, long polling would skew the metrics.
+        .request(request or InstrumentedRequest(connection_pool_size=256))
+        .rate_limiter(
+            PriorityRateLimiter(
+                overall_rate=float(os.environ.get("RATE_LIMIT_OVERALL", 30)),
+                private_chat_rate=float(os.environ.get("RATE_LIMIT_PRIVATE_CHAT", 1)),
+                group_chat_rate=float(os.environ.get("RATE_LIMIT_GROUP_CHAT", 20)),
+                max_retries=int(os.environ.get("RATE_LIMIT_MAX_RETRIES", 3)),
+                # The workers of a sharded deployment share the limits of the token.
+                shards=int(os.environ.get("SHARDS", 1)),
+                shared_chats=AdminRouter.from_env().chat_ids,
+                max_chat_delay=float(os.environ.get("RATE_LIMIT_MAX_CHAT_DELAY", 60)),
+            )
+        )
+    )
+    if os.environ.get("BOT_API_URL"):
+        # E.g. a local Bot API server, or the stand-in from `tools/fakeapi.py`.
+        builder = builder.base_url(os.environ["BOT_API_URL"] + "/bot")
+        builder = builder.base_file_url(os.environ["BOT_API_URL"] + "/file/bot")
+
+    application = builder.build()
+    register_handlers(application)
+    return application
+
+
+def webhook_settings(updates: List[str]) -> Dict:
+    """Return the arguments of ``run_webhook`` and ``Updater.start_webhook``.
+
+    Without ``WEBHOOK_SECRET`` a random secret is used, which only works with a single
+    process: every process that starts sets the webhook with its own secret, and the
+    others would reject the updates. It's required when ``SHARDS`` is more than 1, and
+    must be set whenever several instances serve the same bot.
+    """
+    base_url = os.environ.get("WEBHOOK_URL")
+    if not base_url:
+        raise ValueError("WEBHOOK_URL must be set in webhook mode.")
+    secret_token = os.environ.get("WEBHOOK_SECRET")
+    if not secret_token:
+        if int(os.environ.get("SHARDS", 1)) > 1:
+            raise ValueError("WEBHOOK_SECRET must be set when SHARDS is more than 1.")
+        secret_token = secrets.token_urlsafe(32)
+    url_path = os.environ.get("WEBHOOK_PATH", "telegram")
+    return dict(
+        listen=os.environ.get("WEBHOOK_LISTEN", "0.0.0.0"),
+        port=int(os.environ.get("WEBHOOK_PORT", os.environ.get("PORT", 8443))),
+        url_path=url_path,
+        webhook_url=f"{base_url.rstrip('/')}/{url_path}",
+        # Telegram echoes the token in every request, anything else is rejected.
+        secret_token=secret_token,
+        allowed_updates=updates,
+    )
+
+
+def run_local_worker(index: int, shard_queue: "multiprocessing.Queue[Optional[Dict]]") -> None:
+    """Run a worker process started by the front, see :class:`bot.sharding.LocalShards`."""
+    os.environ["SHARD_INDEX"] = str(index)
+    application = build_application()
+    asyncio.run(serve_worker(application, take_local(shard_queue)))
+
+
+async def run_sharded_front(application: Application, mode: str, shards: int) -> None:
+    """Receive the updates and route them to the workers, see :mod:`bot.sharding`."""
+    updates = allowed_updates(application)
+    if mode == "webhook":
+        settings = webhook_settings(updates)
+
+        async def start(updater: Updater) -> None:
+            await updater.start_webhook(**settings)
+    else:
+
+        async def start(updater: Updater) -> None:
+            await updater.start_polling(allowed_updates=updates)
+
+    if os.environ.get("SHARD_QUEUE", "local") == "mongo":
+        database = Database.shared()
+        await database.ensure_indexes()
+        try:
+            await run_front(application, start, MongoShards(database).push, shards)
+        finally:
+            database.close()
+        return
+
+    workers = LocalShards(
+        run_local_worker, shards, maxsize=int(os.environ.get("SHARD_QUEUE_SIZE", 1000))
+    )
+    workers.start()
+    try:
+        await run_front(application, start, workers.push, shards)
+    finally:
+        await asyncio.get_running_loop().run_in_executor(None, workers.stop)
+
+
+async def run_mongo_worker() -> None:
+    """Run a worker fed through the Mongo update queue, see :class:`bot.sharding.MongoShards`."""
+    application = build_application()
+    shard = int(os.environ.get("SHARD_INDEX", 0))
+    take = MongoTaker(
+        application,
+        Database.shared(),
+        shard,
+        max_unacked=int(os.environ.get("SHARD_MAX_UNACKED", 1000)),
     )
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    await serve_worker(application, take, take.ack)
+
+
+def main() -> None:
+    """Start the bot."""
+    mode = os.environ.get("MODE", "polling")
+    shards = int(os.environ.get("SHARDS", 1))
+
+    if mode == "worker":
+        asyncio.run(run_mongo_worker())
+        return
+    if shards > 1:
+        asyncio.run(run_sharded_front(build_application(), mode, shards))
+        return
+
+    application = build_application()
+    updates = allowed_updates(application)
+    if mode == "webhook":
+        application.run_webhook(**webhook_settings(updates))
+    else:
+        application.run_polling(allowed_updates=updates)
 
 
 if __name__ == "__main__":
-    main()            
+    main()
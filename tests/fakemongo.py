@@ -0,0 +1,81 @@
+"""A stand-in for the few motor collection methods the paging queries use, so the real
+:class:`bot.models.Database` methods run against documents in memory."""
+import operator
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from pymongo import ASCENDING
+
+OPERATORS = {
+    "$gt": operator.gt,
+    "$gte": operator.ge,
+    "$lt": operator.lt,
+    "$lte": operator.le,
+    "$ne": operator.ne,
+    "$in": lambda value, options: value in options,
+}
+
+
+def matches(document: Dict, query: Dict) -> bool:
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(matches(document, branch) for branch in condition):
+                return False
+            continue
+        value = document.get(field)
+        if isinstance(condition, dict):
+            if value is None or not all(
+                OPERATORS[name](value, operand) for name, operand in condition.items()
+            ):
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+def project(document: Dict, projection: Optional[Dict]) -> Dict:
+    if not projection:
+        return dict(document)
+    fields = {"_id", *(field for field, shown in projection.items() if shown)}
+    return {field: value for field, value in document.items() if field in fields}
+
+
+class FakeCursor:
+    def __init__(self, documents: List[Dict]) -> None:
+        self.documents = documents
+
+    def sort(self, key: Any, direction: int = ASCENDING) -> "FakeCursor":
+        keys = [(key, direction)] if isinstance(key, str) else key
+        # Stable sorts from the last key to the first.
+        for field, order in reversed(keys):
+            self.documents.sort(key=lambda document: document[field], reverse=order < 0)
+        return self
+
+    def limit(self, count: int) -> "FakeCursor":
+        self.documents = self.documents[:count]
+        return self
+
+    async def __aiter__(self):
+        for document in self.documents:
+            yield document
+
+
+class FakeCollection:
+    def __init__(self) -> None:
+        self.documents: List[Dict] = []
+
+    def find(self, query: Dict, projection: Optional[Dict] = None) -> FakeCursor:
+        return FakeCursor(
+            [project(document, projection) for document in self.documents if matches(document, query)]
+        )
+
+    async def find_one(self, query: Dict, projection: Optional[Dict] = None) -> Optional[Dict]:
+        for document in self.documents:
+            if matches(document, query):
+                return project(document, projection)
+        return None
+
+
+def fake_client() -> Dict[str, Dict[str, FakeCollection]]:
+    """Return a client to pass to :class:`bot.models.Database`."""
+    return {"FeedbackBot": defaultdict(FakeCollection)}
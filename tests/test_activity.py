@@ -0,0 +1,109 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import AutoReconnect
+
+from bot.activity import ActivityWriter
+from bot.analytics import Analytics
+from tools.benchmark import MemoryDatabase
+
+NOON = datetime(2024, 5, 1, 12, tzinfo=timezone.utc)
+
+
+class RecordingDatabase(MemoryDatabase):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.writes = []
+        self.failing = 0
+
+    async def write_activity(self, activity):
+        if self.failing:
+            self.failing -= 1
+            raise AutoReconnect("connection lost")
+        self.writes.append(dict(activity))
+        return await super().write_activity(activity)
+
+
+def test_notes_of_a_user_are_coalesced():
+    writer = ActivityWriter(RecordingDatabase())
+    writer.touch(1, NOON)
+    writer.touch(1, NOON - timedelta(minutes=5))
+    writer.register(2, NOON)
+    writer.touch(2, NOON + timedelta(minutes=1))
+    # Seen first, then registered: written once, as a registration.
+    writer.register(1, NOON - timedelta(minutes=10))
+    assert len(writer) == 2
+    assert writer.registrations == {1: NOON, 2: NOON + timedelta(minutes=1)}
+    assert not writer.seen
+    assert writer.stats()["coalesced"] == 3
+
+
+def test_pending_users_are_written_in_one_batch():
+    async def main():
+        database = RecordingDatabase(users=2)
+        analytics = Analytics(database)
+        writer = ActivityWriter(database, flush_interval=60, flush_size=3, analytics=analytics)
+        writer.start()
+        writer.touch(1, NOON)
+        writer.register(5, NOON)
+        await asyncio.sleep(0.01)
+        # Below `flush_size`, the write waits for the interval.
+        assert database.writes == []
+        writer.touch(2, NOON)
+        await asyncio.sleep(0.01)
+        assert database.writes == [{1: (False, NOON), 2: (False, NOON), 5: (True, NOON)}]
+        assert len(writer) == 0
+        assert writer.stats()["written"] == 3
+        assert database.users == {1, 2, 5}
+        assert database.last_seen == {1: NOON, 2: NOON, 5: NOON}
+        # Counted when they're written, the activity on the day it happened.
+        assert sum(amount for (_, metric), amount in analytics.counts.items() if metric == "signups") == 1
+        assert analytics.actives == {NOON: {1, 2, 5}}
+        assert analytics.pending_users == 3
+
+        writer.touch(9, NOON)
+        await writer.stop()
+        # An unknown user that was only seen isn't registered.
+        assert database.writes[-1] == {9: (False, NOON)}
+        assert database.users == {1, 2, 5}
+
+    asyncio.run(main())
+
+
+def test_a_failed_write_is_kept_for_the_next():
+    async def main():
+        database = RecordingDatabase(users=3)
+        database.failing = 1
+        writer = ActivityWriter(database)
+        writer.touch(1, NOON)
+        writer.register(2, NOON)
+        assert not await writer.flush()
+        # Merged with what was noted since.
+        writer.touch(1, NOON + timedelta(minutes=1))
+        writer.touch(3, NOON)
+        assert writer.stats()["failures"] == 1
+        assert await writer.flush()
+        assert database.writes == [
+            {1: (False, NOON + timedelta(minutes=1)), 3: (False, NOON), 2: (True, NOON)}
+        ]
+
+    asyncio.run(main())
+
+
+def test_registrations_take_the_place_of_the_seen_users_when_full():
+    writer = ActivityWriter(RecordingDatabase(), maxsize=2)
+    writer.touch(1, NOON)
+    writer.touch(2, NOON)
+    writer.touch(3, NOON)
+    assert list(writer.seen) == [1, 2]
+    # Notes of pending users still count.
+    writer.touch(2, NOON + timedelta(minutes=1))
+    assert writer.stats()["dropped"] == 1
+
+    writer.register(4, NOON)
+    assert list(writer.seen) == [2]
+    writer.register(5, NOON)
+    assert not writer.seen
+    writer.register(6, NOON)
+    assert list(writer.registrations) == [4, 5]
+    assert writer.stats()["dropped"] == 4
@@ -0,0 +1,108 @@
+import asyncio
+import functools
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from telegram import Chat, Message, Update, User
+
+from bot.admins import AdminRouter
+from bot.albums import AlbumCollector
+from bot.callbacks import forward_album, handle
+from bot.constants import UserState
+from bot.userstate import UserStates
+from tools.benchmark import MemoryDatabase
+
+USER = User(5, "user", False)
+
+
+class FakeBot:
+    def __init__(self):
+        self.forwarded = []
+
+    async def forward_message(self, from_chat_id, message_id, chat_id):
+        await asyncio.sleep(0.01)
+        self.forwarded.append([message_id])
+        return SimpleNamespace(message_id=100 + message_id)
+
+    async def forward_messages(self, from_chat_id, message_ids, chat_id):
+        await asyncio.sleep(0.01)
+        self.forwarded.append(list(message_ids))
+        return [SimpleNamespace(message_id=100 + message_id) for message_id in message_ids]
+
+
+class Recorder:
+    def touch(self, *args):
+        pass
+
+    count = record = touch
+
+
+def make_update(message_id, media_group_id=None):
+    message = Message(
+        message_id,
+        datetime.now(timezone.utc),
+        Chat(USER.id, Chat.PRIVATE),
+        from_user=USER,
+        text=None if media_group_id else "text",
+        media_group_id=media_group_id,
+    )
+    return Update(message_id, message=message)
+
+
+def make_context(delay):
+    bot = FakeBot()
+    database = MemoryDatabase()
+    admins = AdminRouter([1])
+    states = UserStates(persistent=False)
+    states.set(USER.id, UserState.COMMENTING)
+    application = SimpleNamespace(create_task=asyncio.ensure_future)
+    albums = AlbumCollector(
+        application, functools.partial(forward_album, bot, database, admins), delay=delay
+    )
+    bot_data = {
+        "states": states,
+        "database": database,
+        "admins": admins,
+        "albums": albums,
+        "activity": Recorder(),
+        "analytics": Recorder(),
+        "archive": Recorder(),
+    }
+    return SimpleNamespace(bot=bot, bot_data=bot_data)
+
+
+def test_album_then_text_keeps_the_order():
+    async def main():
+        context = make_context(delay=10)
+        for message_id in (1, 2, 3):
+            await handle(make_update(message_id, "album"), context)
+        await handle(make_update(4), context)
+        assert context.bot.forwarded == [[1, 2, 3], [4]]
+        assert len(context.bot_data["albums"]) == 0
+
+    asyncio.run(main())
+
+
+def test_text_waits_for_an_album_being_sent():
+    async def main():
+        context = make_context(delay=0)
+        await handle(make_update(1, "album"), context)
+        await handle(make_update(2, "album"), context)
+        # The album is being forwarded by its timer.
+        await asyncio.sleep(0.005)
+        await handle(make_update(3), context)
+        assert context.bot.forwarded == [[1, 2], [3]]
+
+    asyncio.run(main())
+
+
+def test_album_alone_is_sent_after_the_delay():
+    async def main():
+        context = make_context(delay=0.02)
+        await handle(make_update(2, "album"), context)
+        await handle(make_update(1, "album"), context)
+        assert context.bot.forwarded == []
+        await asyncio.sleep(0.1)
+        assert context.bot.forwarded == [[1, 2]]
+
+    asyncio.run(main())
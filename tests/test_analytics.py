@@ -0,0 +1,115 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import AutoReconnect
+
+from bot.analytics import Analytics, hour_of, sparkline
+from tools.benchmark import MemoryDatabase
+
+NOON = datetime(2024, 5, 1, 12, tzinfo=timezone.utc)
+
+
+def test_hour_of_and_sparkline():
+    assert hour_of(NOON + timedelta(minutes=59, seconds=5)) == NOON
+    assert hour_of(datetime(2024, 5, 1, 14, 30, tzinfo=timezone(timedelta(hours=2)))) == NOON
+    assert sparkline([0, 1, 2, 4]) == "▁▃▅█"
+    assert sparkline([0, 0]) == "▁▁"
+
+
+def test_counts_are_added_per_hour():
+    async def main():
+        database = MemoryDatabase()
+        analytics = Analytics(database)
+        analytics.count("messages", when=NOON)
+        analytics.count("messages", 2, when=NOON + timedelta(minutes=30))
+        analytics.count("replies", when=NOON + timedelta(hours=1))
+        analytics.count("replies", 0, when=NOON)
+        assert await analytics.flush()
+        analytics.count("messages", when=NOON)
+        assert await analytics.flush()
+        assert database.analytics == {
+            NOON: {"messages": 4},
+            NOON + timedelta(hours=1): {"replies": 1},
+        }
+        assert analytics.stats()["pending_counts"] == 0
+
+    asyncio.run(main())
+
+
+def test_active_users_are_counted_once_a_day():
+    async def main():
+        database = MemoryDatabase()
+        first, second = Analytics(database), Analytics(database)
+        first.active(1, NOON)
+        first.active(1, NOON)
+        first.active(2, NOON)
+        assert first.pending_users == 2
+        assert await first.flush()
+        # Later the same day, or by another process.
+        first.active(1, NOON + timedelta(hours=3))
+        second.active(2, NOON)
+        second.active(3, NOON)
+        # And the next day.
+        second.active(1, NOON + timedelta(days=1))
+        assert await first.flush()
+        assert await second.flush()
+        assert database.analytics == {
+            NOON: {"actives": 3},
+            NOON + timedelta(days=1): {"actives": 1},
+        }
+
+    asyncio.run(main())
+
+
+def test_pending_users_are_bounded_and_kept_on_failure():
+    async def main():
+        database = MemoryDatabase()
+        analytics = Analytics(database, max_pending_users=2)
+        for user_id in (1, 2, 3):
+            analytics.active(user_id, NOON)
+        assert analytics.stats()["dropped"] == 1
+
+        mark_active = database.mark_active
+
+        async def lost(*args):
+            raise AutoReconnect("connection lost")
+
+        database.mark_active = lost
+        analytics.count("messages", when=NOON)
+        assert not await analytics.flush()
+        assert analytics.actives == {NOON: {1, 2}}
+        assert analytics.pending_users == 2
+        assert analytics.stats()["failures"] == 1
+
+        database.mark_active = mark_active
+        assert await analytics.flush()
+        assert database.analytics == {NOON: {"messages": 1, "actives": 2}}
+
+    asyncio.run(main())
+
+
+def test_read_adds_up_the_days():
+    async def main():
+        database = MemoryDatabase()
+        analytics = Analytics(database)
+        now = datetime.now(timezone.utc)
+        today = hour_of(now).replace(hour=0)
+        analytics.count("messages", 2, when=today)
+        analytics.count("messages", 3, when=today + timedelta(hours=now.hour))
+        analytics.count("signups", when=today - timedelta(days=2))
+        analytics.count("replies", when=today - timedelta(days=7))
+        analytics.active(1, today - timedelta(days=1))
+        assert await analytics.flush()
+        # Not written yet, still read.
+        analytics.count("replies", when=now)
+
+        dates, series = await analytics.read(3)
+        assert dates == [(today - timedelta(days=days)).date() for days in (2, 1, 0)]
+        assert series == {
+            "actives": [0, 1, 0],
+            "signups": [1, 0, 0],
+            "messages": [0, 0, 5],
+            "replies": [0, 0, 1],
+        }
+
+    asyncio.run(main())
@@ -0,0 +1,135 @@
+import asyncio
+from types import SimpleNamespace
+
+from telegram.error import Forbidden
+
+from bot.broadcast import Broadcaster
+from tools.benchmark import MemoryDatabase
+
+PAYLOAD = {
+    "from_chat_id": 10,
+    "message_id": 7,
+    "type": "text",
+    "file_id": None,
+    "text": "",
+    "buttons": [],
+}
+
+
+class FakeBot:
+    def __init__(self, blocked=()):
+        self.blocked = set(blocked)
+        self.copied = []
+        self.sent = []
+        self.deleted = 0
+
+    async def copy_message(self, chat_id, from_chat_id, message_id, **kwargs):
+        if chat_id in self.blocked:
+            raise Forbidden("bot was blocked by the user")
+        self.copied.append(chat_id)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+        async def delete():
+            self.deleted += 1
+
+        return SimpleNamespace(message_id=len(self.sent), delete=delete)
+
+    async def edit_message_text(self, text, **kwargs):
+        pass
+
+
+def broadcast(**fields):
+    return {
+        "status": "running",
+        "payload": PAYLOAD,
+        "last_user_id": 0,
+        "sent": 0,
+        "blocked": 0,
+        "failed": 0,
+        "total": 0,
+        "chat_id": 10,
+        "message_id": 1,
+        **fields,
+    }
+
+
+def test_start_sends_to_the_active_users():
+    async def main():
+        bot = FakeBot(blocked=[3])
+        database = MemoryDatabase(users=5, banned=1)
+        broadcaster = Broadcaster(bot, database, batch_size=2)
+        assert await broadcaster.start(PAYLOAD, 10)
+        await broadcaster.task
+        assert bot.copied == [2, 4, 5]
+        assert database.broadcasts[1]["status"] == "done"
+        assert database.broadcasts[1]["sent"] == 3
+        assert database.broadcasts[1]["blocked"] == 1
+        assert database.inactive == {3}
+
+    asyncio.run(main())
+
+
+def test_start_refuses_while_another_process_broadcasts():
+    async def main():
+        bot = FakeBot()
+        database = MemoryDatabase(users=5)
+        # Started by another worker, this broadcaster has no task.
+        await database.create_broadcast(broadcast())
+        broadcaster = Broadcaster(bot, database)
+        assert not await broadcaster.start(PAYLOAD, 10)
+        assert not broadcaster.running
+        assert bot.sent == []
+        assert len(database.broadcasts) == 1
+
+    asyncio.run(main())
+
+
+def test_start_gives_way_when_it_loses_the_race():
+    async def main():
+        bot = FakeBot()
+        database = MemoryDatabase(users=5)
+        broadcaster = Broadcaster(bot, database)
+        count_users = database.count_users
+
+        async def count_users_while_another_starts():
+            await database.create_broadcast(broadcast())
+            return await count_users()
+
+        database.count_users = count_users_while_another_starts
+        assert not await broadcaster.start(PAYLOAD, 10)
+        assert not broadcaster.running
+        # The progress message of the broadcast that didn't start is removed.
+        assert bot.deleted == 1
+        assert len(database.broadcasts) == 1
+
+    asyncio.run(main())
+
+
+def test_resume_continues_after_the_checkpoint():
+    async def main():
+        bot = FakeBot()
+        database = MemoryDatabase(users=6)
+        database.broadcasts[1] = broadcast(last_user_id=3, sent=3, total=6)
+        database.broadcasts[2] = broadcast(status="done", total=6)
+        broadcaster = Broadcaster(bot, database, batch_size=2)
+        await broadcaster.resume()
+        assert broadcaster.running
+        await broadcaster.task
+        assert bot.copied == [4, 5, 6]
+        assert database.broadcasts[1]["status"] == "done"
+        assert database.broadcasts[1]["sent"] == 6
+        assert database.broadcasts[1]["last_user_id"] == 6
+        assert database.broadcasts[2]["sent"] == 0
+
+    asyncio.run(main())
+
+
+def test_resume_without_a_running_broadcast():
+    async def main():
+        broadcaster = Broadcaster(FakeBot(), MemoryDatabase(users=2))
+        await broadcaster.resume()
+        assert not broadcaster.running
+
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+import asyncio
+from types import SimpleNamespace
+
+from telegram.error import RetryAfter
+
+from bot.errorhandler import ErrorReporter, error_handler, fingerprint
+
+
+def raise_at(line):
+    try:
+        if line == 1:
+            raise ValueError("first")
+        raise ValueError("second")
+    except ValueError as error:
+        return error
+
+
+def test_fingerprint_is_the_type_and_the_frames():
+    assert fingerprint(raise_at(1)) != fingerprint(raise_at(2))
+    assert fingerprint(raise_at(1)) == fingerprint(raise_at(1))
+    # The message doesn't matter, e.g. ids in it.
+    assert fingerprint(ValueError("a")) == fingerprint(ValueError("b"))
+    assert fingerprint(ValueError()) != fingerprint(KeyError())
+
+
+def test_record_reports_the_first_occurrence_only():
+    reporter = ErrorReporter(chat_id=1)
+    key = reporter.record(raise_at(1))
+    assert key
+    assert reporter.record(raise_at(1)) == ""
+    assert reporter.record(raise_at(1)) == ""
+    assert reporter.record(raise_at(2))
+    assert reporter.stats()["repeats"] == 2
+
+
+def test_digest_counts_the_repeats_and_resets():
+    reporter = ErrorReporter(chat_id=1, interval=300)
+    assert reporter.digest() is None
+    key = reporter.record(raise_at(1))
+    reporter.record(raise_at(1))
+    quiet = reporter.record(raise_at(2))
+    reporter.dropped = 2
+    text = reporter.digest()
+    assert text.startswith("Errors in the last 5 min:")
+    assert f"x1 <code>{key}</code> ValueError: first" in text
+    assert quiet not in text
+    assert "2 reports dropped" in text
+    # A quiet error is forgotten, and reported in full again.
+    assert reporter.record(raise_at(2)) == quiet
+    assert reporter.record(raise_at(1)) == ""
+    assert reporter.digest() is not None
+    assert reporter.digest() is None
+
+
+class FakeBot:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.fail:
+            raise RetryAfter(5)
+        self.sent.append(text)
+
+
+def handle(reporter, bot, error):
+    context = SimpleNamespace(error=error, bot=bot, bot_data={"errors": reporter})
+    asyncio.run(error_handler(None, context))
+
+
+def test_failed_report_is_sent_in_full_next_time():
+    reporter = ErrorReporter(chat_id=1)
+    bot = FakeBot(fail=True)
+    handle(reporter, bot, raise_at(1))
+    assert reporter.dropped == 1
+    bot.fail = False
+    handle(reporter, bot, raise_at(1))
+    assert len(bot.sent) == 1
+    assert "An exception was raised" in bot.sent[0]
+
+
+def test_dropped_report_is_sent_in_full_next_time():
+    reporter = ErrorReporter(chat_id=1, max_in_flight=0)
+    bot = FakeBot()
+    handle(reporter, bot, raise_at(1))
+    assert reporter.dropped == 1
+    assert bot.sent == []
+    reporter.max_in_flight = 1
+    handle(reporter, bot, raise_at(1))
+    assert len(bot.sent) == 1
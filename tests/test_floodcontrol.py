@@ -0,0 +1,62 @@
+from bot.floodcontrol import FloodControl
+
+
+def test_burst_then_mute(clock):
+    flood = FloodControl(rate=1, burst=3, mute_seconds=60)
+    assert [flood.check(1) for _ in range(3)] == ["allow"] * 3
+    assert flood.check(1) == "mute"
+    assert flood.check(1) == "drop"
+    # Other users have their own bucket.
+    assert flood.check(2) == "allow"
+
+
+def test_tokens_refill(clock):
+    flood = FloodControl(rate=1, burst=2)
+    assert [flood.check(1) for _ in range(2)] == ["allow", "allow"]
+    clock.advance(1)
+    assert flood.check(1) == "allow"
+
+
+def test_album_counts_once(clock):
+    flood = FloodControl(rate=1, burst=1)
+    assert [flood.check(1, "album") for _ in range(10)] == ["allow"] * 10
+    assert flood.check(1, "other") == "mute"
+
+
+def test_mutes_double_then_ban(clock):
+    flood = FloodControl(rate=1, burst=1, mute_seconds=10, max_mutes=2)
+    durations = []
+    for _ in range(2):
+        while flood.check(1) == "allow":
+            pass
+        muted_until = flood.users.get(1).muted_until
+        durations.append(muted_until - clock())
+        clock.advance(muted_until - clock())
+    assert durations == [10, 20]
+    while True:
+        result = flood.check(1)
+        if result != "allow":
+            break
+    assert result == "ban"
+    # Until the user is forgotten, see `forget`.
+    clock.advance(500)
+    assert flood.check(1) == "drop"
+    assert flood.stats()["banned"] == 1
+
+
+def test_forget_lifts_the_ban(clock):
+    flood = FloodControl(rate=1, burst=1, max_mutes=0)
+    flood.check(1)
+    assert flood.check(1) == "ban"
+    flood.forget(1)
+    assert flood.check(1) == "allow"
+
+
+def test_idle_users_are_forgotten(clock):
+    flood = FloodControl(burst=1, mute_seconds=10, max_mutes=1, idle_ttl=60)
+    flood.check(1)
+    assert flood.check(1) == "mute"
+    clock.advance(61)
+    # Starts over: the next flood is a first mute, not a ban.
+    flood.check(1)
+    assert flood.check(1) == "mute"
@@ -0,0 +1,43 @@
+from bot.helpers import button_parser
+
+
+def rows(buttons):
+    return [[(button.text, button.url) for button in row] for row in buttons]
+
+
+def test_no_markup():
+    assert button_parser("hello") == ("hello", [])
+    assert button_parser(None) == ("", [])
+
+
+def test_buttons_are_removed_from_the_text():
+    text, buttons = button_parser(
+        "Read [the docs](buttonurl://example.com/docs) or [ask](buttonurl:example.com/chat) us"
+    )
+    assert text == "Read  or  us"
+    assert rows(buttons) == [[("the docs", "example.com/docs")], [("ask", "example.com/chat")]]
+
+
+def test_same_puts_the_button_on_the_previous_row():
+    _, buttons = button_parser(
+        "[a](buttonurl:a.com)[b](buttonurl:b.com:same)\n[c](buttonurl:c.com)"
+    )
+    assert rows(buttons) == [[("a", "a.com"), ("b", "b.com")], [("c", "c.com")]]
+
+
+def test_same_on_the_first_button_starts_a_row():
+    _, buttons = button_parser("[a](buttonurl:a.com:same)")
+    assert rows(buttons) == [[("a", "a.com")]]
+
+
+def test_escaped_markup_is_kept():
+    text, buttons = button_parser("see \\[a](buttonurl:a.com) and [b](buttonurl:b.com)")
+    assert rows(buttons) == [[("b", "b.com")]]
+    assert "[a](buttonurl:a.com)" in text
+
+
+def test_many_buttons():
+    count = 20000
+    text, buttons = button_parser("x [b](buttonurl:b.com)" * count)
+    assert text == "x " * count
+    assert len(buttons) == count
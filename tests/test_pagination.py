@@ -0,0 +1,195 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from bson import ObjectId
+from telegram import Chat
+
+from bot.admintools import BANS_PER_PAGE, HISTORY_PER_PAGE, archive_page, ban_list_page
+from bot.models import Database
+from tests.fakemongo import fake_client
+from tools.benchmark import MemoryDatabase
+
+
+class ChatCache:
+    async def load(self, chat_id):
+        return Chat(chat_id, Chat.PRIVATE, first_name=f"user {chat_id}")
+
+
+def make_context(database):
+    return SimpleNamespace(bot_data={"database": database, "chat_cache": ChatCache()})
+
+
+def callbacks(keyboard):
+    if keyboard is None:
+        return []
+    return [button.callback_data for row in keyboard.inline_keyboard for button in row]
+
+
+def listed_ids(text):
+    return [int(line.split("[<code>")[1].split("<")[0]) for line in text.splitlines()[1:]]
+
+
+def test_ban_pages_forward_and_back():
+    context = make_context(MemoryDatabase(banned=2 * BANS_PER_PAGE + 5))
+
+    async def main():
+        text, keyboard = await ban_list_page(context)
+        assert listed_ids(text) == list(range(1, BANS_PER_PAGE + 1))
+        assert callbacks(keyboard) == [f"banlist:next:{BANS_PER_PAGE}"]
+
+        text, keyboard = await ban_list_page(context, after=BANS_PER_PAGE)
+        first = BANS_PER_PAGE + 1
+        assert listed_ids(text)[0] == first
+        assert callbacks(keyboard) == [f"banlist:prev:{first}", f"banlist:next:{2 * BANS_PER_PAGE}"]
+
+        text, keyboard = await ban_list_page(context, after=2 * BANS_PER_PAGE)
+        assert len(listed_ids(text)) == 5
+        assert callbacks(keyboard) == [f"banlist:prev:{2 * BANS_PER_PAGE + 1}"]
+
+        text, _ = await ban_list_page(context, before=first)
+        assert listed_ids(text) == list(range(1, BANS_PER_PAGE + 1))
+
+    asyncio.run(main())
+
+
+def test_ban_page_emptied_in_the_meantime_falls_back_to_the_first():
+    database = MemoryDatabase(banned=BANS_PER_PAGE + 5)
+    context = make_context(database)
+
+    async def main():
+        _, keyboard = await ban_list_page(context)
+        assert callbacks(keyboard) == [f"banlist:next:{BANS_PER_PAGE}"]
+        for user_id in range(BANS_PER_PAGE + 1, BANS_PER_PAGE + 6):
+            await database.unban_user(user_id)
+        text, keyboard = await ban_list_page(context, after=BANS_PER_PAGE)
+        assert listed_ids(text) == list(range(1, BANS_PER_PAGE + 1))
+        assert keyboard is None
+
+    asyncio.run(main())
+
+
+def test_no_bans():
+    context = make_context(MemoryDatabase())
+    text, keyboard = asyncio.run(ban_list_page(context, after=10))
+    assert listed_ids(text) == []
+    assert keyboard is None
+
+
+def test_database_ban_pages_match_the_memory_database():
+    ids = list(range(3, 60, 3))
+    memory = MemoryDatabase()
+    memory.banned = set(ids)
+    database = Database(fake_client())
+    database.db["ban"].documents = [{"user_id": user_id} for user_id in reversed(ids)]
+
+    async def main():
+        assert await database.get_banned_page(limit=4) == ([3, 6, 9, 12], False, True)
+        assert await database.get_banned_page(after=12, limit=4) == ([15, 18, 21, 24], True, True)
+        assert await database.get_banned_page(before=15, limit=4) == ([3, 6, 9, 12], False, True)
+        assert await database.get_banned_page(after=57, limit=4) == ([], True, False)
+        for boundary in [None, 1, *ids, 100]:
+            for limit in (1, 4, 30):
+                for key in ("after", "before"):
+                    kwargs = {key: boundary, "limit": limit}
+                    assert await database.get_banned_page(**kwargs) == await memory.get_banned_page(
+                        **kwargs
+                    ), kwargs
+
+    asyncio.run(main())
+
+
+def archive(database, user_id, count):
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    records = [
+        {
+            "_id": ObjectId(),
+            "user_id": user_id,
+            "ts": start + timedelta(minutes=index),
+            "type": "text",
+            "text": f"message {index}",
+        }
+        for index in range(count)
+    ]
+    database.archive.extend(records)
+    # Newest first.
+    return records[::-1]
+
+
+def shown(text):
+    return [line.rsplit(" ", 2)[-2:] for line in text.splitlines()[1:]]
+
+
+def test_history_pages():
+    database = MemoryDatabase()
+    records = archive(database, 7, HISTORY_PER_PAGE + 3)
+    context = make_context(database)
+
+    async def main():
+        text, keyboard = await archive_page(context, 7)
+        assert len(shown(text)) == HISTORY_PER_PAGE
+        last = records[HISTORY_PER_PAGE - 1]["_id"]
+        assert callbacks(keyboard) == [f"history:next:7:{last}"]
+
+        text, keyboard = await archive_page(context, 7, after=last)
+        assert len(shown(text)) == 3
+        first = records[HISTORY_PER_PAGE]["_id"]
+        assert callbacks(keyboard) == [f"history:prev:7:{first}"]
+        # Within the 64 bytes of the callback data.
+        assert all(len(data.encode()) <= 64 for data in callbacks(keyboard))
+
+        text, _ = await archive_page(context, 7, before=first)
+        assert f"message {HISTORY_PER_PAGE + 2}" in text
+
+    asyncio.run(main())
+
+
+def test_history_page_expired_in_the_meantime_falls_back_to_the_first():
+    database = MemoryDatabase()
+    records = archive(database, 7, 3)
+    context = make_context(database)
+
+    async def main():
+        # The boundary expired, the first page is shown.
+        gone = ObjectId()
+        text, keyboard = await archive_page(context, 7, after=gone)
+        assert "message 2" in text
+        assert keyboard is None
+        database.archive.clear()
+        text, keyboard = await archive_page(context, 7, before=records[0]["_id"])
+        assert len(text.splitlines()) == 2
+        assert keyboard is None
+
+    asyncio.run(main())
+
+
+def test_database_archive_pages_match_the_memory_database():
+    memory = MemoryDatabase()
+    records = archive(memory, 7, 12)
+    archive(memory, 8, 5)
+    # Messages of the same second are ordered by id.
+    for record in records[4:8]:
+        record["ts"] = records[4]["ts"]
+    database = Database(fake_client())
+    database.db["archive"].documents = list(reversed(memory.archive))
+
+    async def page(source, **kwargs):
+        found, has_prev, has_next = await source.get_archive_page(7, limit=5, **kwargs)
+        return [record["_id"] for record in found], has_prev, has_next
+
+    async def main():
+        ids = [record["_id"] for record in records]
+        assert await page(database) == (ids[:5], False, True)
+        assert await page(database, after=ids[4]) == (ids[5:10], True, True)
+        assert await page(database, after=ids[9]) == (ids[10:], True, False)
+        assert await page(database, before=ids[5]) == (ids[:5], False, True)
+        assert await page(database, before=ids[10]) == (ids[5:10], True, True)
+        # An expired boundary starts over.
+        assert await page(database, after=ObjectId()) == (ids[:5], False, True)
+        for boundary in ids:
+            assert await page(database, after=boundary) == await page(memory, after=boundary)
+        # The newest message has no previous page, it never is a `before` boundary.
+        for boundary in ids[1:]:
+            assert await page(database, before=boundary) == await page(memory, before=boundary)
+
+    asyncio.run(main())
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from telegram import Chat, Message, Update
+
+from bot.admintools import perf
+from bot.metrics import render_prometheus
+from bot.processor import KeyedUpdateProcessor, update_key
+from bot.ratelimiter import PriorityRateLimiter
+
+
+def make_update(update_id: int, chat_id: int, thread_id: int = None) -> Update:
+    message = Message(
+        update_id,
+        datetime.now(timezone.utc),
+        Chat(chat_id, Chat.SUPERGROUP if thread_id else Chat.PRIVATE),
+        message_thread_id=thread_id,
+        is_topic_message=thread_id is not None,
+    )
+    return Update(update_id, message=message)
+
+
+def test_update_key():
+    assert update_key(make_update(1, 5)) == 5
+    assert update_key(make_update(1, -100, thread_id=7)) == (-100, 7)
+    assert update_key(Update(1)) is None
+    assert update_key("not an update") is None
+
+
+def test_same_chat_in_order_other_chats_concurrent():
+    async def main():
+        processor = KeyedUpdateProcessor(max_concurrent_updates=4)
+        done = []
+        release = asyncio.Event()
+
+        async def handle(name, wait=False):
+            if wait:
+                await release.wait()
+            done.append(name)
+
+        tasks = [
+            asyncio.create_task(processor.process_update(make_update(1, 1), handle("a1", wait=True))),
+            asyncio.create_task(processor.process_update(make_update(2, 1), handle("a2"))),
+            asyncio.create_task(processor.process_update(make_update(3, 2), handle("b1"))),
+        ]
+        await asyncio.sleep(0.01)
+        # The other chat isn't held up, the second update of chat 1 waits for the first.
+        assert done == ["b1"]
+        assert processor.stats()["waiting"] == 1
+        release.set()
+        await asyncio.gather(*tasks)
+        assert done == ["b1", "a1", "a2"]
+        assert processor.stats()["keys"] == 0
+
+    asyncio.run(main())
+
+
+def test_drops_beyond_the_cap_per_chat():
+    async def main():
+        processor = KeyedUpdateProcessor(max_concurrent_updates=2, max_pending=10, max_queue_per_key=3)
+        release = asyncio.Event()
+        done = []
+
+        async def handle(index):
+            await release.wait()
+            done.append(index)
+
+        tasks = [
+            asyncio.create_task(processor.process_update(make_update(index, 1), handle(index)))
+            for index in range(5)
+        ]
+        await asyncio.sleep(0.01)
+        assert processor.dropped == 2
+        release.set()
+        await asyncio.gather(*tasks)
+        assert done == [0, 1, 2]
+
+    asyncio.run(main())
+
+
+def test_dropped_updates_are_logged_and_reported(caplog):
+    processor = KeyedUpdateProcessor(max_concurrent_updates=2, max_queue_per_key=1)
+    replies = []
+
+    async def reply_text(text):
+        replies.append(text)
+
+    application = SimpleNamespace(
+        update_processor=processor,
+        update_queue=asyncio.Queue(),
+        bot=SimpleNamespace(rate_limiter=PriorityRateLimiter()),
+        bot_data={},
+    )
+    context = SimpleNamespace(application=application)
+
+    async def main():
+        release = asyncio.Event()
+        tasks = [
+            asyncio.create_task(processor.process_update(make_update(index, 1), release.wait()))
+            for index in range(4)
+        ]
+        await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.gather(*tasks)
+        await perf(SimpleNamespace(effective_message=SimpleNamespace(reply_text=reply_text)), context)
+
+    with caplog.at_level(logging.WARNING, logger="bot.processor"):
+        asyncio.run(main())
+    assert len([record for record in caplog.records if "Dropping" in record.message]) == 3
+    assert processor.stats()["dropped"] == 3
+    assert "dropped: <code>3</code>" in replies[0]
+    assert "feedbackbot_updates_dropped 3\n" in render_prometheus(application)
+
+
+def test_failure_releases_the_chat():
+    async def main():
+        processor = KeyedUpdateProcessor(max_concurrent_updates=1)
+        done = []
+
+        async def fail():
+            raise RuntimeError
+
+        async def handle():
+            done.append(True)
+
+        first = asyncio.create_task(processor.process_update(make_update(1, 1), fail()))
+        second = asyncio.create_task(processor.process_update(make_update(2, 1), handle()))
+        results = await asyncio.gather(first, second, return_exceptions=True)
+        assert isinstance(results[0], RuntimeError)
+        assert done == [True]
+        assert processor.stats()["in_flight"] == 0
+
+    asyncio.run(main())
@@ -0,0 +1,162 @@
+import asyncio
+import time
+
+import pytest
+from telegram.error import RetryAfter
+
+from bot.constants import Priority
+from bot.ratelimiter import PriorityRateLimiter, TokenBucket
+
+
+def test_token_bucket(clock):
+    bucket = TokenBucket(rate=2, capacity=2)
+    assert bucket.delay() == 0
+    bucket.take()
+    bucket.take()
+    assert bucket.delay() == 0.5
+    assert bucket.delay(2) == 1
+    assert bucket.time_to_full() == 1
+
+    clock.advance(0.25)
+    assert bucket.delay() == 0.25
+    assert bucket.time_to_full() == 0.75
+
+    # The bucket doesn't fill beyond its capacity.
+    clock.advance(60)
+    assert bucket.delay(2) == 0
+    assert bucket.delay(3) == 0.5
+
+
+def send(limiter, results, name, priority=None, chat_id=None, callback=None):
+    async def record():
+        results.append(name)
+        return True
+
+    data = {} if chat_id is None else {"chat_id": chat_id}
+    return asyncio.create_task(
+        limiter.process_request(callback or record, (), {}, "sendMessage", data, priority)
+    )
+
+
+def test_global_queue_by_priority():
+    async def main():
+        limiter = PriorityRateLimiter(overall_rate=50)
+        limiter._queue.bucket.tokens = 0
+        results = []
+        tasks = [send(limiter, results, f"broadcast{i}", Priority.BROADCAST) for i in range(3)]
+        tasks.append(send(limiter, results, "normal"))
+        tasks.append(send(limiter, results, "admin", Priority.ADMIN))
+        await asyncio.gather(*tasks)
+        assert results == ["admin", "normal", "broadcast0", "broadcast1", "broadcast2"]
+        assert limiter.stats()["broadcast_requests"] == 3
+        assert limiter.queue_depth == 0
+
+    asyncio.run(main())
+
+
+def test_admin_requests_skip_ahead_in_the_chat_queue():
+    async def main():
+        limiter = PriorityRateLimiter(overall_rate=1000, private_chat_rate=50)
+        results = []
+        tasks = [send(limiter, results, f"broadcast{i}", Priority.BROADCAST, 5) for i in range(3)]
+        tasks.append(send(limiter, results, "admin", Priority.ADMIN, 5))
+        await asyncio.sleep(0)
+        # The first request had a token, the others wait for the chat.
+        assert results == ["broadcast0"]
+        assert limiter.queue_depth == 3
+        await asyncio.gather(*tasks)
+        assert results == ["broadcast0", "admin", "broadcast1", "broadcast2"]
+
+    asyncio.run(main())
+
+
+def test_chat_delay_is_capped():
+    async def main():
+        limiter = PriorityRateLimiter(overall_rate=1000, private_chat_rate=10, max_chat_delay=0.25)
+        results = []
+        tasks = [send(limiter, results, f"normal{i}", chat_id=5) for i in range(3)]
+        await asyncio.sleep(0)
+        # The next request would wait for three tokens, 0.3 seconds.
+        with pytest.raises(RetryAfter) as info:
+            await limiter.process_request(None, (), {}, "sendMessage", {"chat_id": 5}, None)
+        assert info.value.retry_after == 1
+        assert limiter.stats()["rejected"] == 1
+        # Another chat isn't affected and admin requests are never rejected.
+        tasks.append(send(limiter, results, "other", chat_id=6))
+        tasks.append(send(limiter, results, "admin", Priority.ADMIN, 5))
+        await asyncio.gather(*tasks)
+        assert results == ["normal0", "other", "admin", "normal1", "normal2"]
+
+    asyncio.run(main())
+
+
+def test_shutdown_cancels_the_waiting_requests():
+    async def main():
+        limiter = PriorityRateLimiter(overall_rate=1000, private_chat_rate=0.1)
+        results = []
+        tasks = [send(limiter, results, i, chat_id=5) for i in range(2)]
+        await asyncio.sleep(0)
+        await limiter.shutdown()
+        done = await asyncio.gather(*tasks, return_exceptions=True)
+        assert done[0] is True
+        assert isinstance(done[1], asyncio.CancelledError)
+
+    asyncio.run(main())
+
+
+def test_retry_after_pauses_and_retries():
+    async def main():
+        limiter = PriorityRateLimiter(overall_rate=1000)
+        calls = []
+
+        async def flaky():
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                raise RetryAfter(0.1)
+            return True
+
+        assert await limiter.process_request(flaky, (), {}, "sendMessage", {}, None)
+        assert len(calls) == 2
+        assert calls[1] - calls[0] >= 0.09
+        assert limiter.stats()["retries"] == 1
+
+        # Requests that didn't fail wait out the pause too.
+        limiter._paused_until = time.monotonic() + 0.1
+        results = []
+        started = time.monotonic()
+        await send(limiter, results, "after")
+        assert time.monotonic() - started >= 0.09
+
+    asyncio.run(main())
+
+
+def test_retry_after_is_raised_after_max_retries():
+    async def main():
+        limiter = PriorityRateLimiter(overall_rate=1000, max_retries=2)
+        calls = []
+
+        async def flood():
+            calls.append(None)
+            raise RetryAfter(0)
+
+        with pytest.raises(RetryAfter):
+            await limiter.process_request(flood, (), {}, "sendMessage", {}, None)
+        assert len(calls) == 3
+        assert limiter.stats()["retries"] == 2
+
+    asyncio.run(main())
+
+
+def test_other_endpoints_are_not_paced():
+    async def main():
+        limiter = PriorityRateLimiter(overall_rate=1)
+        limiter._queue.bucket.tokens = 0
+
+        async def get_me():
+            return {"id": 1}
+
+        assert await asyncio.wait_for(
+            limiter.process_request(get_me, (), {}, "getMe", {}, None), 0.1
+        ) == {"id": 1}
+
+    asyncio.run(main())
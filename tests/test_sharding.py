@@ -0,0 +1,98 @@
+import asyncio
+from collections import Counter
+from types import SimpleNamespace
+
+from telegram import Update
+
+from bot.processor import KeyedUpdateProcessor
+from bot.sharding import HashRing, MongoTaker, shard_key
+from tools.benchmark import MemoryDatabase
+
+
+def test_distribution_is_even():
+    ring = HashRing(4)
+    counts = Counter(ring.shard(user_id) for user_id in range(1, 40001))
+    assert set(counts) == {0, 1, 2, 3}
+    # Within 25% of a fair share with 100 points per shard.
+    assert max(counts.values()) < 1.25 * 10000
+    assert min(counts.values()) > 0.75 * 10000
+
+
+def test_same_shard_in_every_process():
+    assert [HashRing(3).shard(key) for key in range(100)] == [
+        HashRing(3).shard(key) for key in range(100)
+    ]
+
+
+def test_adding_a_shard_moves_about_its_share():
+    before, after = HashRing(4), HashRing(5)
+    keys = range(1, 20001)
+    moved = [key for key in keys if before.shard(key) != after.shard(key)]
+    # Only to the new shard, and about a fifth of the keys.
+    assert {after.shard(key) for key in moved} == {4}
+    assert 0.1 < len(moved) / len(keys) < 0.3
+
+
+def test_single_shard():
+    ring = HashRing(1)
+    assert {ring.shard(key) for key in range(1000)} == {0}
+
+
+def test_shard_key():
+    assert shard_key({"update_id": 1, "message": {"from": {"id": 5}, "chat": {"id": -9}}}) == 5
+    assert shard_key({"update_id": 1, "callback_query": {"from": {"id": 6}}}) == 6
+    assert shard_key({"update_id": 1, "my_chat_member": {"chat": {"id": -9}}}) == -9
+    assert shard_key({"update_id": 1, "channel_post": {"chat": {"id": -7}}}) == -7
+    assert shard_key({"update_id": 3}) == 3
+
+
+def make_update(update_id, user_id):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "user"},
+        },
+    }
+
+
+def test_mongo_taker_acks_each_update_as_it_completes():
+    async def main():
+        processor = KeyedUpdateProcessor(max_concurrent_updates=10)
+        application = SimpleNamespace(update_processor=processor)
+        database = MemoryDatabase()
+        taker = MongoTaker(application, database, 0, max_delay=0.001, max_unacked=3)
+        await database.push_updates([(0, make_update(index, index)) for index in range(1, 6)])
+        stop = asyncio.Event()
+        slow = asyncio.Event()
+
+        async def process(data, wait=False):
+            if wait:
+                await slow.wait()
+
+        first = await taker(stop)
+        assert [data["update_id"] for data in first] == [1, 2, 3]
+        tasks = [
+            asyncio.create_task(
+                processor.process_update(Update.de_json(data, None), process(data, index == 0))
+            )
+            for index, data in enumerate(first)
+        ]
+        await asyncio.sleep(0.01)
+        # The slow update doesn't hold up the others.
+        second = await asyncio.wait_for(taker(stop), 1)
+        assert [data["update_id"] for data in second] == [4, 5]
+        # 2 and 3 are acked, the slow one stays queued.
+        assert list(database.update_queue) == [1, 4, 5]
+        # At most `max_unacked` are in progress.
+        stop_soon = asyncio.get_running_loop().call_later(0.05, stop.set)
+        assert await taker(stop) is None
+        stop_soon.cancel()
+        slow.set()
+        await asyncio.gather(*tasks)
+        await taker.ack()
+        assert list(database.update_queue) == [4, 5]
+
+    asyncio.run(main())
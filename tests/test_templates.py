@@ -0,0 +1,81 @@
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from telegram import Chat, Message, MessageId, User
+
+from bot.admintools import use_template
+from bot.archive import Archive
+from bot.templates import TemplateStore
+from tools.benchmark import MemoryDatabase
+
+ADMIN = User(1, "admin", False)
+ADMIN_CHAT = Chat(-100, Chat.SUPERGROUP)
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+        return Message(50, datetime.now(timezone.utc), Chat(chat_id, Chat.PRIVATE), text=text)
+
+    async def copy_message(self, chat_id, from_chat_id, message_id, **kwargs):
+        self.sent.append((chat_id, message_id))
+        return MessageId(51)
+
+
+def template(name, type="text", text="Thanks for your message!"):
+    return {
+        "name": name,
+        "type": type,
+        "text": text,
+        "file_id": None,
+        "from_chat_id": ADMIN_CHAT.id,
+        "message_id": 3,
+    }
+
+
+def use(context, name):
+    forwarded = Message(10, datetime.now(timezone.utc), ADMIN_CHAT)
+    command = Message(
+        11,
+        datetime.now(timezone.utc),
+        ADMIN_CHAT,
+        from_user=ADMIN,
+        text=f"/use {name}",
+        reply_to_message=forwarded,
+    )
+    context.args = [name]
+    return use_template(SimpleNamespace(effective_message=command), context)
+
+
+def test_template_replies_are_archived():
+    database = MemoryDatabase()
+    database.routes[ADMIN_CHAT.id, 10] = 7
+    database.templates["thanks"] = template("thanks")
+    database.templates["poll"] = template("poll", type="poll", text="")
+    archive = Archive(database)
+    context = SimpleNamespace(
+        bot=FakeBot(),
+        bot_data={
+            "database": database,
+            "templates": TemplateStore(database),
+            "analytics": SimpleNamespace(count=lambda name: None),
+            "archive": archive,
+        },
+    )
+
+    async def main():
+        await use(context, "thanks")
+        await use(context, "poll")
+
+    asyncio.run(main())
+    assert context.bot.sent == [(7, "Thanks for your message!"), (7, 3)]
+    sent, copied = archive.pending
+    assert sent["user_id"] == copied["user_id"] == 7
+    assert sent["admin_id"] == copied["admin_id"] == ADMIN.id
+    assert sent["text"] == "Thanks for your message!"
+    # A copied template is archived as the command that sent it.
+    assert copied["text"] == "/use poll"
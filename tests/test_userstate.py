@@ -0,0 +1,129 @@
+import asyncio
+
+from pymongo.errors import AutoReconnect
+
+from bot.constants import UserState
+from bot.userstate import UserStates
+
+
+class FakeDatabase:
+    def __init__(self, states=None, fail=False):
+        self.states = dict(states or {})
+        self.fail = fail
+        self.loads = 0
+
+    async def get_user_data(self, user_id):
+        self.loads += 1
+        state = self.states.get(user_id)
+        return None if state is None else {"state": state}
+
+    async def write_user_data(self, changes):
+        if self.fail:
+            raise AutoReconnect("down")
+        for user_id, fields in changes.items():
+            self.states[user_id] = fields["state"]
+
+
+def test_set_and_get_many(clock):
+    states = UserStates(persistent=False, min_capacity=8)
+    for user_id in range(1, 1001):
+        states.set(user_id, UserState.COMMENTING if user_id % 2 else UserState.IDLE)
+    assert len(states) == 1000
+    assert len(states._keys) >= 1000 * 10 // 7
+    assert asyncio.run(states.get(999)) is UserState.COMMENTING
+    assert asyncio.run(states.get(1000)) is UserState.IDLE
+    assert asyncio.run(states.get(5000)) is UserState.IDLE
+
+
+def colliding_ids(count, capacity):
+    """Return `count` user ids with the same home slot in a table of `capacity` slots."""
+    home = {}
+    for user_id in range(1, 10000):
+        slot = (user_id * 0x9E3779B97F4A7C15 >> 17) & (capacity - 1)
+        home.setdefault(slot, []).append(user_id)
+        if len(home[slot]) == count:
+            return home[slot]
+
+
+def test_eviction_leaves_tombstones_that_probes_skip(clock):
+    states = UserStates(idle_ttl=60, persistent=False, min_capacity=16)
+    first, second, third = colliding_ids(3, 16)
+    states.set(first, UserState.IDLE)
+    clock.advance(30)
+    states.set(second, UserState.COMMENTING)
+    states.set(third, UserState.IDLE)
+    clock.advance(40)
+    assert states.sweep() == 1
+    assert len(states) == 2
+    # The others are found past the tombstone of the first.
+    assert first not in states
+    assert asyncio.run(states.get(second)) is UserState.COMMENTING
+    assert third in states
+    # The tombstone is reused on insert.
+    states.set(first, UserState.COMMENTING)
+    assert states._keys.tolist().count(-1) == 0
+    assert asyncio.run(states.get(first)) is UserState.COMMENTING
+
+
+def test_shrinks_when_mostly_empty(clock):
+    states = UserStates(idle_ttl=60, persistent=False, min_capacity=16)
+    for user_id in range(1, 1001):
+        states.set(user_id, UserState.IDLE)
+    grown = len(states._keys)
+    clock.advance(61)
+    states.set(5000, UserState.IDLE)
+    states.sweep()
+    assert len(states._keys) < grown
+    assert len(states) == 1
+    assert 5000 in states
+
+
+def test_memory_mode_keeps_conversations(clock):
+    states = UserStates(idle_ttl=60, persistent=False)
+    states.set(1, UserState.COMMENTING)
+    states.set(2, UserState.IDLE)
+    clock.advance(61)
+    assert states.sweep() == 1
+    assert asyncio.run(states.get(1)) is UserState.COMMENTING
+
+
+def test_persistent_evicts_once_written_and_reloads(clock):
+    database = FakeDatabase()
+
+    async def main():
+        states = UserStates(idle_ttl=60)
+        states.database = database
+        states.set(1, UserState.COMMENTING)
+        clock.advance(61)
+        # Not written yet.
+        assert states.sweep() == 0
+        await states.flush()
+        assert database.states == {1: UserState.COMMENTING.value}
+        assert states.sweep() == 1
+        assert 1 not in states
+        assert await states.get(1) is UserState.COMMENTING
+        assert database.loads == 1
+        # Unknown users are looked up once.
+        assert await states.get(2) is UserState.IDLE
+        assert await states.get(2) is UserState.IDLE
+        assert database.loads == 2
+
+    asyncio.run(main())
+
+
+def test_failed_flush_keeps_the_latest_change(clock):
+    database = FakeDatabase(fail=True)
+
+    async def main():
+        states = UserStates()
+        states.database = database
+        states.set(1, UserState.COMMENTING)
+        await states.flush()
+        assert states.dirty == {1: UserState.COMMENTING}
+        states.set(1, UserState.IDLE)
+        database.fail = False
+        await states.flush()
+        assert database.states == {1: UserState.IDLE.value}
+        assert not states.dirty
+
+    asyncio.run(main())
@@ -0,0 +1,671 @@
+"""An offline load test of the bot, against stand-ins of the Bot API and of Mongo.
+
+The application is built by :func:`main.build_application` and set up by
+:func:`bot.setup.setup_application`, so the handlers, the rate limiter and the update
+processor are the real ones. Only the edges are replaced: the Bot API calls go to
+:class:`tools.fakeapi.FakeBotAPI` through an HTTPX transport, and the database is
+:class:`MemoryDatabase`. Run it with::
+
+    python -m tools.benchmark --users 1000 --messages 5 --latency 0.02
+
+and compare the report between two revisions. The rate limits are lifted unless
+``--rate-limit`` is given, otherwise the benchmark measures the Telegram flood limits.
+With ``--shards 2``, the updates are split between two worker processes and fed
+through the update queue, like a sharded deployment with ``SHARD_QUEUE=mongo``.
+"""
+import argparse
+import asyncio
+import bisect
+import itertools
+import multiprocessing
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from logging import WARNING, getLogger
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    cast,
+)
+
+import httpx
+from bson import ObjectId
+from telegram import Update
+
+from bot import metrics
+from bot.ratelimiter import RATE_LIMITED_PREFIXES
+from bot.sharding import HashRing, MongoTaker, shard_key
+from bot.setup import setup_application, shutdown_application, stop_application
+from main import build_application
+from tools.fakeapi import BOT_USER, FakeBotAPI
+
+
+class MemoryDatabase:
+    """An in-memory stand-in for :class:`bot.models.Database`, with the same methods.
+
+    Args:
+        users: The number of users already registered, their ids start at 1.
+        banned: The number of those users that are banned.
+    """
+
+    pool_stats = None
+
+    def __init__(self, users: int = 0, banned: int = 0) -> None:
+        self.users: Set[int] = set(range(1, users + 1))
+        self.inactive: Set[int] = set()
+        self.banned: Set[int] = set(range(1, banned + 1))
+        self._banned_sorted: Optional[List[int]] = None
+        self.unban_listeners: List[Callable[[int], Any]] = []
+        self.routes: Dict[Tuple[int, int], int] = {}
+        self.assignments: Dict[int, int] = {}
+        self.topics: Dict[int, int] = {}
+        self.templates: Dict[str, Dict] = {}
+        self.broadcasts: Dict[int, Dict] = {}
+        self.user_data: Dict[int, Dict] = {}
+        self.last_seen: Dict[int, datetime] = {}
+        self.active_days: Set[str] = set()
+        self.analytics: Dict[datetime, Counter] = {}
+        self.archive: List[Dict] = []
+        # queue id -> document, of the update queue read by `MongoTaker`
+        self.update_queue: Dict[int, Dict] = {}
+        self._queue_ids = itertools.count(1)
+
+    async def start(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    async def user_is_banned(self, user_id: int) -> bool:
+        return user_id in self.banned
+
+    async def ban_user(self, user_id: int) -> None:
+        self.banned.add(user_id)
+        self._banned_sorted = None
+
+    async def unban_user(self, user_id: int) -> bool:
+        if user_id not in self.banned:
+            return False
+        self.banned.discard(user_id)
+        self._banned_sorted = None
+        for listener in self.unban_listeners:
+            listener(user_id)
+        return True
+
+    async def get_banned_users(self) -> List[int]:
+        return list(self.banned)
+
+    async def get_banned_page(
+        self, after: Optional[int] = None, before: Optional[int] = None, limit: int = 20
+    ) -> Tuple[List[int], bool, bool]:
+        if self._banned_sorted is None:
+            self._banned_sorted = sorted(self.banned)
+        ids = self._banned_sorted
+        if before is not None:
+            end = bisect.bisect_left(ids, before)
+            return ids[max(end - limit, 0):end], end > limit, end < len(ids)
+        start = bisect.bisect_right(ids, after or 0)
+        return ids[start:start + limit], start > 0, start + limit < len(ids)
+
+    async def register_user_by_dict(self, info: Dict) -> None:
+        self.users.add(info["id"])
+        self.inactive.discard(info["id"])
+
+    async def write_activity(self, activity: Dict[int, Tuple[bool, datetime]]) -> int:
+        registered = 0
+        for user_id, (register, last_seen) in activity.items():
+            if register:
+                registered += user_id not in self.users
+                self.users.add(user_id)
+                self.inactive.discard(user_id)
+            elif user_id not in self.users:
+                continue
+            self.last_seen[user_id] = max(last_seen, self.last_seen.get(user_id, last_seen))
+        return registered
+
+    async def mark_active(self, when: datetime, user_ids: Iterable[int]) -> int:
+        keys = {f"{when:%Y-%m-%d}:{user_id}" for user_id in user_ids} - self.active_days
+        self.active_days.update(keys)
+        return len(keys)
+
+    async def increment_analytics(self, buckets: Dict[datetime, Dict[str, int]]) -> None:
+        for hour, counts in buckets.items():
+            self.analytics.setdefault(hour, Counter()).update(counts)
+
+    async def get_analytics(self, start: datetime, end: datetime) -> List[Dict]:
+        return [
+            {"_id": hour, "counts": dict(counts)}
+            for hour, counts in sorted(self.analytics.items())
+            if start <= hour < end
+        ]
+
+    async def get_user_by_id(self, id: Optional[int]) -> bool:
+        return id in self.users
+
+    async def count_users(self) -> int:
+        return len(self.users)
+
+    async def get_user_counts(self) -> Dict[str, int]:
+        return {
+            "total": len(self.users),
+            "banned": len(self.banned),
+            "inactive": len(self.inactive),
+        }
+
+    async def get_active_users(self, after: int = 0) -> AsyncIterator[int]:
+        for user_id in sorted(self.users - self.inactive):
+            if user_id > after:
+                yield user_id
+
+    async def mark_users_inactive(self, user_ids: List[int]) -> None:
+        self.inactive.update(user_ids)
+
+    async def create_broadcast(self, broadcast: Dict) -> Optional[int]:
+        if broadcast["status"] == "running" and await self.get_running_broadcast():
+            return None
+        broadcast_id = len(self.broadcasts) + 1
+        self.broadcasts[broadcast_id] = dict(broadcast)
+        return broadcast_id
+
+    async def update_broadcast(self, broadcast_id: int, fields: Dict) -> None:
+        self.broadcasts[broadcast_id].update(fields)
+
+    async def get_running_broadcast(self) -> Optional[Dict]:
+        for broadcast_id, broadcast in self.broadcasts.items():
+            if broadcast["status"] == "running":
+                return {**broadcast, "_id": broadcast_id}
+        return None
+
+    async def save_route(self, chat_id: int, message_id: int, user_id: int) -> None:
+        self.routes[chat_id, message_id] = user_id
+
+    async def save_routes(self, chat_id: int, message_ids: List[int], user_id: int) -> None:
+        for message_id in message_ids:
+            self.routes[chat_id, message_id] = user_id
+
+    async def get_route(self, chat_id: int, message_id: int) -> Optional[int]:
+        return self.routes.get((chat_id, message_id))
+
+    async def get_assignment(self, user_id: int) -> Optional[int]:
+        return self.assignments.get(user_id)
+
+    async def set_assignment(self, user_id: int, admin_id: int) -> None:
+        self.assignments[user_id] = admin_id
+
+    async def count_assignments(self, admin_ids: List[int]) -> Dict[int, int]:
+        return dict(Counter(admin for admin in self.assignments.values() if admin in admin_ids))
+
+    async def get_topic(self, user_id: int) -> Optional[int]:
+        return self.topics.get(user_id)
+
+    async def set_topic(self, user_id: int, topic_id: int) -> None:
+        self.topics[user_id] = topic_id
+
+    async def get_topic_user(self, topic_id: int) -> Optional[int]:
+        for user_id, user_topic_id in self.topics.items():
+            if user_topic_id == topic_id:
+                return user_id
+        return None
+
+    async def get_user_data(self, user_id: int) -> Optional[Dict]:
+        return self.user_data.get(user_id)
+
+    async def write_user_data(self, changes: Dict[int, Optional[Dict]]) -> None:
+        for user_id, data in changes.items():
+            if data is None:
+                self.user_data.pop(user_id, None)
+            else:
+                self.user_data[user_id] = data
+
+    async def insert_archive(self, records: List[Dict]) -> None:
+        for record in records:
+            self.archive.append({"_id": ObjectId(), **record})
+
+    async def get_archive_page(
+        self,
+        user_id: int,
+        after: Optional[ObjectId] = None,
+        before: Optional[ObjectId] = None,
+        limit: int = 10,
+    ) -> Tuple[List[Dict], bool, bool]:
+        records = sorted(
+            (record for record in self.archive if record["user_id"] == user_id),
+            key=lambda record: (record["ts"], record["_id"]),
+            reverse=True,
+        )
+        keys = [record["_id"] for record in records]
+        if before in keys:
+            end = keys.index(before)
+            return records[max(end - limit, 0):end], end > limit, end < len(records)
+        start = keys.index(after) + 1 if after in keys else 0
+        page = records[start:start + limit]
+        return page, bool(page) and start > 0, start + limit < len(records)
+
+    async def push_updates(self, updates: List[Tuple[int, Dict]]) -> None:
+        for shard, update in updates:
+            queue_id = next(self._queue_ids)
+            self.update_queue[queue_id] = {"_id": queue_id, "shard": shard, "update": update}
+
+    async def take_updates(self, shard: int, limit: int = 100, after: Optional[int] = None) -> List[Dict]:
+        documents = (
+            document
+            for queue_id, document in self.update_queue.items()
+            if document["shard"] == shard and (after is None or queue_id > after)
+        )
+        return list(itertools.islice(documents, limit))
+
+    async def ack_updates(self, ids: List[int]) -> None:
+        for queue_id in ids:
+            self.update_queue.pop(queue_id, None)
+
+    async def save_template(self, template: Dict) -> None:
+        self.templates[template["name"]] = template
+
+    async def get_template(self, name: str) -> Optional[Dict]:
+        return self.templates.get(name)
+
+    async def get_template_names(self) -> List[str]:
+        return sorted(self.templates)
+
+    async def delete_template(self, name: str) -> bool:
+        return self.templates.pop(name, None) is not None
+
+
+class CountingProxy:
+    """Passes everything through to `target` and counts the calls of its methods."""
+
+    def __init__(self, target: Any) -> None:
+        self._target = target
+        self.calls: Counter = Counter()
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self._target, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args: Any, **kwargs: Any) -> Any:
+            self.calls[name] += 1
+            return attribute(*args, **kwargs)
+
+        return call
+
+
+class FakeTransport(httpx.AsyncBaseTransport):
+    """Answers the requests of the bot with :meth:`FakeBotAPI.call`, without a socket.
+
+    Args:
+        api: The fake Bot API, which also adds its latency to every call.
+        retry_after_every: Answer every n-th rate limited call with a flood error.
+        retry_after: The number of seconds the flood errors ask to wait.
+    """
+
+    def __init__(self, api: FakeBotAPI, retry_after_every: int = 0, retry_after: int = 1) -> None:
+        self.api = api
+        self.retry_after_every = retry_after_every
+        self.retry_after = retry_after
+        self._rate_limited = itertools.count(1)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        method = request.url.path.rsplit("/", 1)[-1]
+        params = FakeBotAPI.parse_params(
+            await request.aread(), request.headers.get("content-type", "")
+        )
+        if (
+            self.retry_after_every
+            and method.startswith(RATE_LIMITED_PREFIXES)
+            and next(self._rate_limited) % self.retry_after_every == 0
+        ):
+            self.api.calls.append((method, params))
+            return httpx.Response(
+                429,
+                json={
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.retry_after}",
+                    "parameters": {"retry_after": self.retry_after},
+                },
+            )
+        return httpx.Response(200, json=await self.api.call(method, params))
+
+
+class FakeRequest(metrics.InstrumentedRequest):
+    """The request of the bot, with its HTTP client bound to a :class:`FakeTransport`."""
+
+    def __init__(self, transport: FakeTransport, **kwargs: Any) -> None:
+        self.transport = transport
+        super().__init__(**kwargs)
+
+    def _build_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(**{**self._client_kwargs, "transport": self.transport})
+
+
+class Workload:
+    """Builds the updates of a benchmark run.
+
+    Args:
+        admin_id: The admin that sends the commands and the replies.
+    """
+
+    def __init__(self, admin_id: int) -> None:
+        self.admin_id = admin_id
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    @staticmethod
+    def user(user_id: int) -> Dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"}
+
+    @staticmethod
+    def private_chat(user_id: int) -> Dict:
+        return {"id": user_id, "type": "private", "first_name": f"User {user_id}"}
+
+    def message(self, user_id: int, text: str, **extra: Any) -> Dict:
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": self.private_chat(user_id),
+            "from": self.user(user_id),
+            "text": text,
+            **extra,
+        }
+        if text.startswith("/"):
+            message["entities"] = [
+                {"type": "bot_command", "offset": 0, "length": len(text.split()[0])}
+            ]
+        return {"update_id": next(self._update_ids), "message": message}
+
+    def callback_query(self, user_id: int, data: str) -> Dict:
+        return {
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": str(next(self._update_ids)),
+                "from": self.user(user_id),
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": {
+                    "message_id": next(self._message_ids),
+                    "date": int(time.time()),
+                    "chat": self.private_chat(user_id),
+                    "from": BOT_USER,
+                    "text": "start",
+                },
+            },
+        }
+
+    def spam(self, users: int, messages: int) -> Iterator[List[Dict]]:
+        """`users` users open the conversation, then each sends `messages` messages."""
+        user_ids = range(10**9, 10**9 + users)
+        yield [self.callback_query(user_id, "start-message") for user_id in user_ids]
+        yield [
+            self.message(user_id, f"Message {index}")
+            for index in range(messages)
+            for user_id in user_ids
+        ]
+
+    def replies(self, database: MemoryDatabase, replies: int) -> Iterator[List[Dict]]:
+        """The admin answers `replies` forwarded messages at once."""
+        updates = []
+        for index in range(replies):
+            forwarded_id = 10**9 + index
+            database.routes[self.admin_id, forwarded_id] = 1 + index % max(len(database.users), 1)
+            updates.append(
+                self.message(
+                    self.admin_id,
+                    f"Answer {index}",
+                    reply_to_message={
+                        "message_id": forwarded_id,
+                        "date": int(time.time()),
+                        "chat": self.private_chat(self.admin_id),
+                        "from": BOT_USER,
+                        "text": "forwarded",
+                    },
+                )
+            )
+        yield updates
+
+    def commands(self, command: str, count: int) -> Iterator[List[Dict]]:
+        yield [self.message(self.admin_id, command) for _ in range(count)]
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+async def run(
+    name: str,
+    database: MemoryDatabase,
+    batches: Callable[[Workload], Iterator[List[Dict]]],
+    api: FakeBotAPI,
+    transport: FakeTransport,
+    shard: Optional[Tuple[int, int]] = None,
+) -> Dict[str, Any]:
+    """Process the updates of a workload with a fresh application and measure it.
+
+    Every batch is processed at once, as if it arrived in a burst; the next batch starts
+    when the previous one is done. Only the last batch is measured, the earlier ones set
+    up the state it depends on.
+
+    With `shard`, the index of this worker and the number of shards, only the updates
+    of that shard are processed, and they go through the update queue and
+    :class:`bot.sharding.MongoTaker` like in a worker started with ``MODE=worker``.
+    """
+    for histograms in (metrics.HANDLER_LATENCY, metrics.API_LATENCY, metrics.MONGO_LATENCY):
+        histograms.clear()
+    application = build_application(FakeRequest(transport, connection_pool_size=256))
+    counted = CountingProxy(database)
+    application.bot_data["database"] = counted
+    await application.initialize()
+    await setup_application(application)
+    await application.start()
+
+    workload = Workload(application.bot_data["admins"].admins[0])
+    latencies: List[float] = []
+    started = time.perf_counter()
+
+    async def process(update: Update) -> None:
+        arrived = time.perf_counter()
+        await application.update_processor.process_update(
+            update, application.process_update(update)
+        )
+        latencies.append(time.perf_counter() - arrived)
+
+    async def feed(batch: List[Dict]) -> None:
+        index, shards = cast(Tuple[int, int], shard)
+        taker = MongoTaker(application, counted, index, max_delay=0.001)
+        application.update_processor.done_listeners.append(
+            lambda update: latencies.append(time.perf_counter() - started)
+        )
+        await counted.push_updates([(index, data) for data in batch])
+        stop = asyncio.Event()
+
+        async def drained() -> None:
+            while database.update_queue:
+                await asyncio.sleep(0.001)
+            stop.set()
+
+        watcher = asyncio.create_task(drained())
+        while (updates := await taker(stop)) is not None:
+            for data in updates:
+                await application.update_queue.put(Update.de_json(data, application.bot))
+        await watcher
+        application.update_processor.done_listeners.clear()
+
+    batch: List[Dict] = []
+    for batch in batches(workload):
+        if shard is not None:
+            ring = HashRing(shard[1])
+            batch = [data for data in batch if ring.shard(shard_key(data)) == shard[0]]
+        latencies.clear()
+        api.calls.clear()
+        counted.calls.clear()
+        started = time.perf_counter()
+        if shard is None:
+            await asyncio.gather(*(process(Update.de_json(data, application.bot)) for data in batch))
+        else:
+            await feed(batch)
+
+    # Handlers that don't block, such as the error handler, are awaited by `stop`.
+    await application.stop()
+    elapsed = time.perf_counter() - started
+    await stop_application(application)
+    await application.shutdown()
+    await shutdown_application(application)
+
+    updates = len(batch)
+    return {
+        "workload": name,
+        "updates": updates,
+        "seconds": elapsed,
+        "updates_per_s": updates / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "latencies": list(latencies),
+        "api_per_update": len(api.calls) / updates if updates else 0.0,
+        "db_per_update": sum(counted.calls.values()) / updates if updates else 0.0,
+        "handlers": {
+            handler: histogram.to_dict()
+            for handler, histogram in metrics.HANDLER_LATENCY.items()
+            if histogram.count
+        },
+    }
+
+
+def report(results: List[Dict[str, Any]]) -> str:
+    columns = ("updates", "seconds", "updates_per_s", "p50_ms", "p99_ms", "api_per_update", "db_per_update")
+    lines = ["workload".ljust(10) + "".join(column.rjust(16) for column in columns)]
+    for result in results:
+        lines.append(
+            result["workload"].ljust(10)
+            + "".join(f"{result[column]:16.2f}" for column in columns)
+        )
+    for result in results:
+        for handler, stats in result["handlers"].items():
+            lines.append(
+                "{:10}{:>16} {count:>8g} × avg {avg_ms:.2f} ms, p99 ≤ {p99_ms:g} ms".format(
+                    result["workload"], handler, **stats
+                )
+            )
+    return "\n".join(lines)
+
+
+def workloads(args: argparse.Namespace) -> Dict[str, Tuple[Callable, Callable]]:
+    return {
+        "spam": (
+            lambda: MemoryDatabase(),
+            lambda database: lambda workload: workload.spam(args.users, args.messages),
+        ),
+        "replies": (
+            lambda: MemoryDatabase(users=args.users),
+            lambda database: lambda workload: workload.replies(database, args.replies),
+        ),
+        "listban": (
+            lambda: MemoryDatabase(users=args.banned, banned=args.banned),
+            lambda database: lambda workload: workload.commands("/listBanned", args.commands),
+        ),
+        "subs": (
+            lambda: MemoryDatabase(users=args.subscribers, banned=args.banned),
+            lambda database: lambda workload: workload.commands("/subs", args.commands),
+        ),
+    }
+
+
+async def benchmark(
+    args: argparse.Namespace, shard: Optional[Tuple[int, int]] = None
+) -> List[Dict[str, Any]]:
+    api = FakeBotAPI(latency=args.latency)
+    transport = FakeTransport(api, args.retry_after_every, args.retry_after)
+    results = []
+    for name in args.workloads:
+        create_database, create_batches = workloads(args)[name]
+        database = create_database()
+        results.append(await run(name, database, create_batches(database), api, transport, shard))
+    return results
+
+
+def benchmark_shard(args: argparse.Namespace, index: int) -> List[Dict[str, Any]]:
+    # Logging isn't inherited by the spawned process.
+    getLogger().setLevel(WARNING)
+    return asyncio.run(benchmark(args, (index, args.shards)))
+
+
+def benchmark_shards(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """Run a worker process per shard, all at once, and add up their results: the
+    workload takes as long as the slowest worker."""
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(args.shards, mp_context=context) as executor:
+        shards = list(executor.map(benchmark_shard, [args] * args.shards, range(args.shards)))
+    results = []
+    for workers in zip(*shards):
+        updates = sum(worker["updates"] for worker in workers)
+        seconds = max(worker["seconds"] for worker in workers)
+        latencies = [latency for worker in workers for latency in worker["latencies"]]
+        handlers: Dict[str, Dict] = {}
+        for worker in workers:
+            for handler, stats in worker["handlers"].items():
+                handlers.setdefault(handler, stats)
+        results.append({
+            "workload": workers[0]["workload"],
+            "updates": updates,
+            "seconds": seconds,
+            "updates_per_s": updates / seconds if seconds else 0.0,
+            "p50_ms": percentile(latencies, 0.5) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "api_per_update": sum(w["api_per_update"] * w["updates"] for w in workers) / updates,
+            "db_per_update": sum(w["db_per_update"] * w["updates"] for w in workers) / updates,
+            # Those of the first worker.
+            "handlers": handlers,
+        })
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("workloads", nargs="*", default=["spam", "replies", "listban", "subs"])
+    parser.add_argument("--users", type=int, default=1000, help="Users spamming the bot.")
+    parser.add_argument("--messages", type=int, default=5, help="Messages per user.")
+    parser.add_argument("--replies", type=int, default=2000, help="Admin replies in a burst.")
+    parser.add_argument("--banned", type=int, default=100000, help="Banned users.")
+    parser.add_argument("--subscribers", type=int, default=1000000, help="Users for /subs.")
+    parser.add_argument("--commands", type=int, default=200, help="Admin commands per workload.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every API call.")
+    parser.add_argument("--retry-after-every", type=int, default=0, help="Flood error every n calls.")
+    parser.add_argument("--retry-after", type=int, default=1, help="Seconds a flood error asks to wait.")
+    parser.add_argument("--rate-limit", action="store_true", help="Keep the Telegram flood limits.")
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=0,
+        help="Feed the updates through the update queue to this many worker processes.",
+    )
+    args = parser.parse_args()
+
+    os.environ.setdefault("TOKEN", "1:benchmark")
+    os.environ.setdefault("ADMINS", "1")
+    # The bursts come from a few chats, they are queued and not dropped.
+    os.environ.setdefault("UPDATE_QUEUE_PER_CHAT", str(10**6))
+    if not args.rate_limit:
+        for name in ("RATE_LIMIT_OVERALL", "RATE_LIMIT_PRIVATE_CHAT", "RATE_LIMIT_GROUP_CHAT"):
+            os.environ[name] = "1e9"
+    # Only the report, not the start and stop of every application.
+    getLogger().setLevel(WARNING)
+    if args.shards:
+        print(report(benchmark_shards(args)))
+    else:
+        print(report(asyncio.run(benchmark(args))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""A local stand-in for the Telegram Bot API that replays recorded updates.
+
+Start it with a file of recorded updates, one JSON update per line::
+
+    python -m tools.fakeapi updates.jsonl --port 8081
+
+and run the bot against it with ``BOT_API_URL=http://127.0.0.1:8081``. In polling mode the
+updates are served by ``getUpdates``; in webhook mode (``MODE=webhook``) they are posted
+to the webhook registered by ``setWebhook``, with its secret token.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from collections import deque
+from logging import basicConfig, getLogger, INFO
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+import httpx
+
+logger = getLogger(__name__)
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "FeedbackBot", "username": "feedback_bot"}
+
+
+class FakeBotAPI:
+    """Answers Bot API methods with plausible results and records every call.
+
+    Args:
+        updates: The updates served by ``getUpdates`` or posted to the webhook.
+        latency: The number of seconds added to every call.
+    """
+
+    def __init__(self, updates: Iterable[Dict] = (), latency: float = 0.0) -> None:
+        self.updates: Deque[Dict] = deque(updates)
+        self.latency = latency
+        self.calls: List[Tuple[str, Dict]] = []
+        self.webhook: Optional[Tuple[str, Optional[str]]] = None
+        self._message_ids = itertools.count(1)
+        self._webhook_task: Optional[asyncio.Task] = None
+
+    def _message(self, chat_id: Any, **extra: Any) -> Dict:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": self._chat(chat_id),
+            "from": BOT_USER,
+            **extra,
+        }
+
+    @staticmethod
+    def _chat(chat_id: Any) -> Dict:
+        chat_id = int(chat_id)
+        if chat_id > 0:
+            return {"id": chat_id, "type": "private", "first_name": f"User {chat_id}"}
+        return {"id": chat_id, "type": "supergroup", "title": f"Group {chat_id}"}
+
+    async def call(self, method: str, params: Dict) -> Dict:
+        """Process one Bot API call and return the JSON response body."""
+        self.calls.append((method, params))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        method = method.lower()
+        if method == "getme":
+            result: Any = BOT_USER
+        elif method == "getupdates":
+            result = await self._get_updates(params)
+        elif method == "setwebhook":
+            self.webhook = (params["url"], params.get("secret_token"))
+            self._webhook_task = asyncio.create_task(self._post_updates())
+            result = True
+        elif method == "getchat":
+            result = self._chat(params["chat_id"])
+        elif method == "forwardmessages" or method == "copymessages":
+            result = [
+                {"message_id": next(self._message_ids)} for _ in params["message_ids"]
+            ]
+        elif method == "copymessage":
+            result = {"message_id": next(self._message_ids)}
+        elif method == "forwardmessage" or method.startswith("send"):
+            result = self._message(params["chat_id"], text=params.get("text", ""))
+        elif method.startswith("edit") and "chat_id" in params:
+            result = self._message(params["chat_id"], text=params.get("text", ""))
+        else:
+            result = True
+        return {"ok": True, "result": result}
+
+    async def _get_updates(self, params: Dict) -> List[Dict]:
+        offset = int(params.get("offset") or 0)
+        while self.updates and self.updates[0]["update_id"] < offset:
+            self.updates.popleft()
+        if not self.updates:
+            # Behave like a long poll that timed out, without making the caller wait long.
+            await asyncio.sleep(min(float(params.get("timeout") or 0), 1.0))
+        return list(itertools.islice(self.updates, int(params.get("limit") or 100)))
+
+    async def _post_updates(self) -> None:
+        url, secret_token = self.webhook
+        headers = {"X-Telegram-Bot-Api-Secret-Token": secret_token} if secret_token else {}
+        async with httpx.AsyncClient() as client:
+            # Give the webhook server a moment to start listening.
+            await asyncio.sleep(0.5)
+            while self.updates:
+                update = self.updates.popleft()
+                response = await client.post(url, json=update, headers=headers)
+                logger.info("Posted update %s: %s", update["update_id"], response.status_code)
+
+    @staticmethod
+    def parse_params(body: bytes, content_type: str) -> Dict:
+        """Decode the parameters of a Bot API request sent by the bot."""
+        if not content_type.startswith("application/x-www-form-urlencoded"):
+            # Multipart uploads only matter for their side effect here.
+            return {}
+
+        params = {}
+        for key, value in parse_qsl(body.decode()):
+            try:
+                params[key] = json.loads(value)
+            except ValueError:
+                params[key] = value
+        return params
+
+    async def serve(self, host: str, port: int) -> None:
+        """Serve the Bot API over HTTP until cancelled."""
+        server = await asyncio.start_server(self._handle_connection, host, port)
+        logger.info("Fake Bot API listening on http://%s:%s", host, port)
+        async with server:
+            await server.serve_forever()
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                path = request_line.split()[1].decode().split("?")[0]
+                params = self.parse_params(body, headers.get("content-type", ""))
+                response = json.dumps(await self.call(path.rsplit("/", 1)[-1], params)).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(response)}\r\n\r\n".encode()
+                    + response
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("updates", help="A file with one recorded update per line.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    with open(args.updates, encoding="utf-8") as file:
+        updates = [json.loads(line) for line in file if line.strip()]
+
+    basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=INFO)
+    try:
+        asyncio.run(FakeBotAPI(updates, args.latency).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()